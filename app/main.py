@@ -1,23 +1,72 @@
-from fastapi import FastAPI, HTTPException, Request, Form, Depends, BackgroundTasks
+from fastapi import FastAPI, Request, Form, Depends
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, StreamingResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer
+from app.services.structured_logging import setup_logging, set_request_id, get_logging_stats
+from app.services.dynamo import get_pool_stats
+from app.services.db_accounting import start_request, finish_request, get_accounting_stats
 from app.services.auth import create_access_token, get_current_user, login_required
-from app.services.crud import create_user, get_user, send_partner_request, get_partner_requests, accept_partner_request, reject_partner_request, get_user_preferences, update_user_preferences, add_to_user_preferences, delete_from_user_preferences, get_combined_preferences, delete_partner, get_notifications, mark_notification_as_read, withdraw_partner_request
-from app.schemas import UserCreate, UserLogin, PartnerRequest, AcceptPartnerRequest, RejectPartnerRequest, UserPreferences, UpdatePreferences
-from app.services.openai_integration import generate_details, generate_movie_recommendations, generate_movie_details_async
+from app.services.async_crud import acquire_lease, get_db_pool_stats, create_user, get_user, send_partner_request, get_partner_requests, accept_partner_request, reject_partner_request, get_user_preferences, add_to_user_preferences, delete_from_user_preferences, get_combined_preferences, delete_partner, get_notifications_page, mark_notification_as_read, mark_all_notifications_as_read, get_unread_notification_count, withdraw_partner_request, get_partner_record, batch_get_movies, save_recommendations, get_recommendation_job, get_recommendation_history
+from app.services.structured_output import get_structured_stats
+from app.services.genres import canonical_genres, registry as genre_registry
+from app.services.titles import title_index
+from app.services.llm_cache import llm_cache
+from app.services.metrics import GaugeFunction, render_metrics
+from app.services.jobs import RecommendationJobQueue, QueueFull, PairBusy, job_is_stale, fail_stale_job, STALE_JOB_ERROR
+from app.services.precompute import RecommendationPrecomputer
+from app.services.collaborative import recommender, rebuild_periodically, fold_periodically, refresh_users, collaborative_recommendations
+from app.services.openai_integration import generate_details, generate_movie_recommendations, stream_movie_recommendations, enrich_recommendation_set, get_exclusion_stats, movie_cache, movie_index, build_movie_index, get_details_dedup_stats, RECOMMENDATION_COUNT
 from pathlib import Path
-from typing import Optional
-from functools import wraps
-import boto3
 import os
-from datetime import datetime
+import json
+import uuid
+import asyncio
+import logging
 from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
+
+setup_logging()
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
 
+class DynamoDBAccountingMiddleware(BaseHTTPMiddleware):
+    """
+    Counts the DynamoDB calls each request makes and reports them in the
+    X-DynamoDB-Calls / Server-Timing headers and in /metrics.
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        usage = start_request()
+        try:
+            response = await call_next(request)
+        finally:
+            # Etiket kardinalitesi için gerçek path değil route şablonu
+            route = getattr(request.scope.get("route"), "path", "unmatched")
+            over_budget = finish_request(usage, route)
+        response.headers["X-DynamoDB-Calls"] = usage.header()
+        response.headers["Server-Timing"] = f'dynamodb;dur={usage.seconds * 1000:.1f};desc="{usage.total_calls} calls"'
+        if over_budget:
+            response.headers["X-DynamoDB-Budget-Exceeded"] = "true"
+        return response
+
+app.add_middleware(DynamoDBAccountingMiddleware)
+
+class RequestIdMiddleware(BaseHTTPMiddleware):
+    """
+    Tags every log record of a request with its ID (X-Request-ID, generated if missing).
+    """
+
+    async def dispatch(self, request: Request, call_next):
+        request_id = request.headers.get("X-Request-ID", "")[:64] or uuid.uuid4().hex
+        set_request_id(request_id)
+        response = await call_next(request)
+        response.headers["X-Request-ID"] = request_id
+        return response
+
+# En son eklenen en dışta çalışır: DynamoDB muhasebesi de request ID'yi görsün
+app.add_middleware(RequestIdMiddleware)
+
 # Template ve static dosyaların yollarını ayarlayalım
 BASE_DIR = Path(__file__).resolve().parent
 templates = Jinja2Templates(directory=str(BASE_DIR / "templates"))
@@ -25,18 +74,10 @@ app.mount("/static", StaticFiles(directory=str(BASE_DIR / "static")), name="stat
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-# DynamoDB bağlantısı
-dynamodb = boto3.resource(
-    'dynamodb',
-    region_name=os.getenv("AWS_DEFAULT_REGION"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
-
 async def count_unread_notifications(user_id: str) -> int:
     try:
-        notifications = get_notifications(user_id)
-        return len([n for n in notifications if not n.get("IsRead", False)])
+        # Users.UnreadNotifications sayacı: tek bir anahtar okuması
+        return await get_unread_notification_count(user_id)
     except Exception:
         return 0
 
@@ -53,7 +94,8 @@ async def home(request: Request, current_user: str = Depends(get_current_user)):
                 "current_user": current_user
             }
         )
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in home")
         return templates.TemplateResponse(
             "base.html",
             {"request": request, "error": "Sayfa yüklenirken bir hata oluştu"}
@@ -72,32 +114,18 @@ async def login_post(
     password: str = Form(...)
 ):
     try:
-        print(f"Login attempt for user: {UserID}")
-        print(f"Received password: {password}")
-        
-        # Form verilerini kontrol et
-        form_data = await request.form()
-        print(f"Form data: {form_data}")
-        
-        # DynamoDB bağlantısını kontrol et
-        print(f"AWS Region: {os.getenv('AWS_DEFAULT_REGION')}")
-        print(f"AWS Access Key ID: {os.getenv('AWS_ACCESS_KEY_ID')}")
-        print(f"AWS Secret Key exists: {'Yes' if os.getenv('AWS_SECRET_ACCESS_KEY') else 'No'}")
-        
-        user = get_user(UserID)
-        print(f"get_user result: {user}")
+        logger.info("Login attempt", extra={"fields": {"user_id": UserID}})
+        user = await get_user(UserID)
         
         if not user:
-            print(f"User not found: {UserID}")
+            logger.info("Login failed: user not found", extra={"fields": {"user_id": UserID}})
             return templates.TemplateResponse(
                 "login.html",
                 {"request": request, "error": "Geçersiz kullanıcı ID veya şifre"}
             )
             
         if user.get("password") != password:
-            print(f"Invalid password for user: {UserID}")
-            print(f"Expected password: {user.get('password')}")
-            print(f"Received password: {password}")
+            logger.info("Login failed: invalid password", extra={"fields": {"user_id": UserID}})
             return templates.TemplateResponse(
                 "login.html",
                 {"request": request, "error": "Geçersiz kullanıcı ID veya şifre"}
@@ -112,13 +140,10 @@ async def login_post(
             max_age=60 * 60 * 24,  # 24 saat
             samesite="lax"
         )
-        print(f"Successful login for user: {UserID}")
+        logger.info("Successful login", extra={"fields": {"user_id": UserID}})
         return response
-    except Exception as e:
-        print(f"Login error for user {UserID}: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Login error", extra={"fields": {"user_id": UserID}})
         return templates.TemplateResponse(
             "login.html",
             {"request": request, "error": "Giriş yapılırken bir hata oluştu"}
@@ -138,10 +163,10 @@ async def register_post(
     password: str = Form(...)
 ):
     try:
-        print(f"Attempting to register user: {UserID}")
+        logger.info("Attempting to register user", extra={"fields": {"user_id": UserID}})
         
-        if get_user(UserID):
-            print(f"User already exists: {UserID}")
+        if await get_user(UserID):
+            logger.info("User already exists", extra={"fields": {"user_id": UserID}})
             return templates.TemplateResponse(
                 "register.html",
                 {"request": request, "error": "Bu kullanıcı ID zaten kayıtlı"}
@@ -153,16 +178,13 @@ async def register_post(
             "password": password
         }
         
-        print(f"Creating new user: {new_user}")
-        create_user(new_user)
-        print(f"User created successfully: {UserID}")
+        logger.debug("Creating new user", extra={"fields": {"user": new_user}})
+        await create_user(new_user)
+        logger.info("User created", extra={"fields": {"user_id": UserID}})
 
         return RedirectResponse(url="/login", status_code=303)
     except Exception as e:
-        print(f"Error in register_post: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in register_post")
         return templates.TemplateResponse(
             "register.html",
             {"request": request, "error": f"Kayıt olurken bir hata oluştu: {str(e)}"}
@@ -184,7 +206,8 @@ async def add_partner_page(
                 "current_user": current_user
             }
         )
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in add_partner_page")
         return templates.TemplateResponse(
             "add_partner.html",
             {"request": request, "error": "Sayfa yüklenirken bir hata oluştu"}
@@ -198,7 +221,7 @@ async def send_partner_request_endpoint(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = send_partner_request(current_user, PartnerID)
+        result = await send_partner_request(current_user, PartnerID)
         if "error" in result:
             return templates.TemplateResponse(
                 "add_partner.html",
@@ -208,7 +231,8 @@ async def send_partner_request_endpoint(
             "add_partner.html",
             {"request": request, "success": "Partner isteği başarıyla gönderildi"}
         )
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in send_partner_request_endpoint")
         return templates.TemplateResponse(
             "add_partner.html",
             {"request": request, "error": "İstek gönderilirken bir hata oluştu"}
@@ -221,7 +245,7 @@ async def partner_requests_page(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        requests = get_partner_requests(current_user)
+        requests = await get_partner_requests(current_user)
         unread_count = await count_unread_notifications(current_user)
         
         return templates.TemplateResponse(
@@ -234,7 +258,8 @@ async def partner_requests_page(
                 "current_user": current_user
             }
         )
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in partner_requests_page")
         return templates.TemplateResponse(
             "partner_requests.html",
             {"request": request, "error": "Partner istekleri alınırken bir hata oluştu"}
@@ -248,14 +273,17 @@ async def accept_partner_request_endpoint(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = accept_partner_request(SenderUserID, current_user)
+        result = await accept_partner_request(SenderUserID, current_user)
         if "error" in result:
             return templates.TemplateResponse(
                 "partner_requests.html",
                 {"request": request, "error": result["error"]}
             )
+        # Yeni çift için ilk seti hazırla
+        recommendation_precomputer.schedule(SenderUserID, current_user)
         return RedirectResponse(url="/partner-requests", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in accept_partner_request_endpoint")
         return templates.TemplateResponse(
             "partner_requests.html",
             {"request": request, "error": "İstek kabul edilirken bir hata oluştu"}
@@ -269,14 +297,15 @@ async def reject_partner_request_endpoint(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = reject_partner_request(SenderUserID, current_user)
+        result = await reject_partner_request(SenderUserID, current_user)
         if "error" in result:
             return templates.TemplateResponse(
                 "partner_requests.html",
                 {"request": request, "error": result["error"]}
             )
         return RedirectResponse(url="/partner-requests", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in reject_partner_request_endpoint")
         return templates.TemplateResponse(
             "partner_requests.html",
             {"request": request, "error": "İstek reddedilirken bir hata oluştu"}
@@ -290,14 +319,15 @@ async def withdraw_partner_request_endpoint(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = withdraw_partner_request(current_user, ReceiverUserID)
+        result = await withdraw_partner_request(current_user, ReceiverUserID)
         if "error" in result:
             return templates.TemplateResponse(
                 "partner_requests.html",
                 {"request": request, "error": result["error"]}
             )
         return RedirectResponse(url="/partner-requests", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in withdraw_partner_request_endpoint")
         return templates.TemplateResponse(
             "partner_requests.html",
             {"request": request, "error": "İstek geri çekilirken bir hata oluştu"}
@@ -311,10 +341,10 @@ async def preferences_page(
 ):
     try:
         # Kullanıcı tercihlerini al
-        preferences = get_user_preferences(current_user)
+        preferences = await get_user_preferences(current_user)
         
         # Partner bilgisini al
-        user_data = get_user(current_user)
+        user_data = await get_user(current_user)
         partner_id = user_data.get("partner_id") if user_data else None
         
         # Okunmamış bildirim sayısını al
@@ -330,7 +360,8 @@ async def preferences_page(
                 "current_user": current_user
             }
         )
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in preferences_page")
         return templates.TemplateResponse(
             "preferences.html",
             {"request": request, "error": "Tercihler alınırken bir hata oluştu"}
@@ -344,7 +375,7 @@ async def add_movie(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = add_to_user_preferences(
+        result = await add_to_user_preferences(
             current_user,
             None,  # Boş liste yerine None
             [movie]  # Sadece film
@@ -354,8 +385,10 @@ async def add_movie(
                 "preferences.html",
                 {"request": request, "error": result["error"]}
             )
+        await on_preferences_changed(current_user)
         return RedirectResponse(url="/preferences", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in add_movie")
         return templates.TemplateResponse(
             "preferences.html",
             {"request": request, "error": "Film eklenirken bir hata oluştu"}
@@ -369,7 +402,7 @@ async def add_genre(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = add_to_user_preferences(
+        result = await add_to_user_preferences(
             current_user,
             [genre],  # Sadece tür
             None  # Boş liste yerine None
@@ -379,8 +412,10 @@ async def add_genre(
                 "preferences.html",
                 {"request": request, "error": result["error"]}
             )
+        await on_preferences_changed(current_user)
         return RedirectResponse(url="/preferences", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in add_genre")
         return templates.TemplateResponse(
             "preferences.html",
             {"request": request, "error": "Tür eklenirken bir hata oluştu"}
@@ -394,7 +429,7 @@ async def delete_movie(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = delete_from_user_preferences(
+        result = await delete_from_user_preferences(
             current_user,
             [],  # Boş tür listesi
             [movie]  # Sadece film
@@ -404,8 +439,10 @@ async def delete_movie(
                 "preferences.html",
                 {"request": request, "error": result["error"]}
             )
+        await on_preferences_changed(current_user)
         return RedirectResponse(url="/preferences", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in delete_movie")
         return templates.TemplateResponse(
             "preferences.html",
             {"request": request, "error": "Film silinirken bir hata oluştu"}
@@ -419,7 +456,7 @@ async def delete_genre(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = delete_from_user_preferences(
+        result = await delete_from_user_preferences(
             current_user,
             [genre],  # Sadece tür
             []  # Boş film listesi
@@ -429,8 +466,10 @@ async def delete_genre(
                 "preferences.html",
                 {"request": request, "error": result["error"]}
             )
+        await on_preferences_changed(current_user)
         return RedirectResponse(url="/preferences", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in delete_genre")
         return templates.TemplateResponse(
             "preferences.html",
             {"request": request, "error": "Tür silinirken bir hata oluştu"}
@@ -444,139 +483,303 @@ async def recommendations_page(
 ):
     try:
         # Partner bilgisini al
-        user_data = get_user(current_user)
+        user_data = await get_user(current_user)
         partner_id = user_data.get("partner_id") if user_data else None
         
         # Partners tablosundan film önerilerini al
         recommendations = []
+        movie_round_trips = 0
         if partner_id:
-            partners_table = dynamodb.Table('Partners')
-            movies_table = dynamodb.Table('Movies')  # Movies tablosu
-            
-            response = partners_table.scan(
-                FilterExpression="UserID = :user_id",
-                ExpressionAttributeValues={":user_id": current_user}
-            )
+            partner_data = await get_partner_record(current_user)
             
-            if response.get("Items"):
-                partner_data = response["Items"][0]
+            if partner_data:
                 movies = partner_data.get("Movies", [])  # Filmleri liste olarak al
                 
-                # Her film için detayları al
+                # Tüm filmlerin detaylarını BatchGetItem ile toplu al (katalogdaki kanonik isimlerle)
+                catalog_names = {movie: title_index.resolve(movie) for movie in movies}
+                movie_details, movie_round_trips = await batch_get_movies(list(set(catalog_names.values())))
+                
                 for movie in movies:
-                    movie_response = movies_table.get_item(
-                        Key={"MovieName": movie}
-                    )
-                    
                     movie_data = {
                         "title": movie,
                         "created_at": partner_data.get("CreatedAt", "")
                     }
                     
                     # Film türlerini al
-                    if "Item" in movie_response:
-                        movie_details = movie_response["Item"]
-                        if "Genre" in movie_details:
-                            # Genre zaten liste olarak tutuluyor
-                            movie_data["genres"] = movie_details["Genre"]
+                    details = movie_details.get(catalog_names[movie])
+                    if details and "Genre" in details:
+                        # Genre zaten liste olarak tutuluyor; eski satırlar kanonik isme çevrilir
+                        movie_data["genres"] = canonical_genres(details["Genre"])
                     
                     recommendations.append(movie_data)
         
         # Okunmamış bildirim sayısını al
         unread_count = await count_unread_notifications(current_user)
         
-        return templates.TemplateResponse(
+        response = templates.TemplateResponse(
             "recommendations.html",
             {
                 "request": request,
                 "partner": partner_id,
                 "recommendations": recommendations,
                 "unread_notifications": unread_count,
-                "current_user": current_user
+                "current_user": current_user,
+                "job_id": request.query_params.get("job")
             }
         )
-    except Exception as e:
+        # Sayfa başına Movies round-trip sayısı (öneri geçmişi büyüdükçe sabit kalmalı)
+        response.headers["X-Movies-Round-Trips"] = str(movie_round_trips)
+        return response
+    except Exception:
+        logger.exception("Error in recommendations_page")
         return templates.TemplateResponse(
             "recommendations.html",
             {"request": request, "error": "Öneriler alınırken bir hata oluştu"}
         )
 
+# Referans tutulmazsa çalışan task'lar GC tarafından toplanabilir
+running_background_tasks = set()
+
+def run_in_background(coroutine):
+    task = asyncio.create_task(coroutine)
+    running_background_tasks.add(task)
+    task.add_done_callback(running_background_tasks.discard)
+
+async def collaborative_fallback(user_id: str, partner_id: str, k: int = RECOMMENDATION_COUNT) -> list:
+    """
+    LLM-free suggestions from the item-item matrix, for when GPT-4 fails.
+    """
+    combined = await get_combined_preferences(user_id, partner_id)
+    history = await get_recommendation_history(user_id, partner_id)
+    return collaborative_recommendations(combined, k=k, exclude=history)
+
+async def run_recommendation_job(user_id: str, partner_id: str) -> dict:
+    """
+    Worker side of /generate-recommendations: generate, save, then enrich.
+    """
+    recommendations = await test_recommendations(user_id, partner_id)
+    if "error" in recommendations:
+        # GPT-4 yanıt vermediyse ortak filtreleme önerilerine düş
+        fallback = await collaborative_fallback(user_id, partner_id)
+        if not fallback:
+            return recommendations
+        logger.info("Using collaborative fallback", extra={"fields": {"user_id": user_id, "count": len(fallback)}})
+        return await store_recommendation_set(user_id, partner_id, fallback)
+    return await store_recommendation_set(user_id, partner_id, recommendations.get("recommendations", []))
+
+async def store_recommendation_set(user_id: str, partner_id: str, movies: list) -> dict:
+    # Önerileri iki kullanıcının Partners satırına ve çiftin geçmişine kaydet
+    new_movies = [movie["title"] for movie in movies]
+    await save_recommendations(user_id, partner_id, new_movies)
+
+    # Film detaylarını arka planda tek bir toplu istekle oluştur ve kaydet
+    run_in_background(enrich_recommendation_set(movies))
+    # Yeni öneriler kullanıcı-film matrisine de yansısın
+    run_in_background(refresh_users(user_id, partner_id))
+    return {"count": len(new_movies)}
+
+recommendation_jobs = RecommendationJobQueue(run_recommendation_job)
+recommendation_precomputer = RecommendationPrecomputer()
+
+GaugeFunction("recommendation_queue_depth", "Recommendation jobs waiting for a worker.", lambda: recommendation_jobs.stats()["queue_depth"])
+GaugeFunction("recommendation_jobs_running", "Recommendation jobs being processed.", lambda: recommendation_jobs.stats()["running"])
+GaugeFunction("recommendation_jobs_waiting_inline", "Streamed generations waiting for a worker slot.", lambda: recommendation_jobs.stats()["waiting_inline"])
+
+@app.on_event("startup")
+async def start_recommendation_workers():
+    await recommendation_jobs.start()
+    await recommendation_precomputer.start()
+    # İndeks arka planda kurulur; hazır olana kadar aday listesi boş kalır
+    run_in_background(build_movie_index())
+    run_in_background(rebuild_periodically())
+    run_in_background(fold_periodically())
+    run_in_background(llm_cache.trim_periodically())
+
+@app.on_event("shutdown")
+async def stop_recommendation_workers():
+    await recommendation_precomputer.stop()
+    await recommendation_jobs.stop()
+
+async def on_preferences_changed(user_id: str):
+    await refresh_users(user_id)
+    try:
+        await recommendation_precomputer.preferences_changed(user_id)
+    except Exception:
+        logger.warning("Error invalidating precomputed recommendations", exc_info=True, extra={"fields": {"user_id": user_id}})
+
 @app.post("/generate-recommendations", response_class=HTMLResponse)
 @login_required
 async def generate_recommendations_endpoint(
     request: Request,
-    background_tasks: BackgroundTasks,
     current_user: str = Depends(get_current_user)
 ):
+    """
+    Serve the pair's precomputed batch if there is one, otherwise enqueue
+    a recommendation job and return at once. JSON clients get 202 + job id;
+    the HTML form is redirected to a page that polls the job.
+    """
+    wants_json = "application/json" in request.headers.get("accept", "")
     try:
         # Partner bilgisini al
-        user_data = get_user(current_user)
+        user_data = await get_user(current_user)
         partner_id = user_data.get("partner_id")
         
         if not partner_id:
+            error = "Film önerileri için bir partneriniz olması gerekiyor"
+            if wants_json:
+                return JSONResponse(status_code=400, content={"error": error})
             return templates.TemplateResponse(
                 "recommendations.html",
-                {"request": request, "error": "Film önerileri için bir partneriniz olması gerekiyor"}
+                {"request": request, "error": error}
             )
 
-        # /docs/recommendations endpoint'ini kullanarak öneriler oluştur
-        recommendations = await test_recommendations(current_user, partner_id)
-        
-        if "error" in recommendations:
-            return templates.TemplateResponse(
-                "recommendations.html",
-                {
-                    "request": request,
-                    "partner": partner_id,
-                    "error": recommendations["error"]
-                }
-            )
+        # Önceden hazırlanmış set varsa LLM beklemeden hemen kaydet
+        buffered = await recommendation_precomputer.take(current_user, partner_id)
+        if buffered:
+            result = await store_recommendation_set(current_user, partner_id, buffered)
+            if wants_json:
+                return JSONResponse(content={"status": "done", "count": result["count"]})
+            return RedirectResponse(url="/recommendations", status_code=303)
 
-        # Partners tablosuna önerileri kaydet
-        partners_table = dynamodb.Table('Partners')
-        
-        # Her iki kullanıcı için de önerileri kaydet
-        for user_id in [current_user, partner_id]:
-            response = partners_table.scan(
-                FilterExpression="UserID = :user_id",
-                ExpressionAttributeValues={":user_id": user_id}
-            )
-            
-            if response.get("Items"):
-                partner_data = response["Items"][0]
-                existing_movies = partner_data.get("Movies", [])  # Mevcut filmleri al
-                if isinstance(existing_movies, set):  # Eğer set ise listeye çevir
-                    existing_movies = list(existing_movies)
-                
-                # Yeni önerileri başa ekle
-                new_movies = [movie["title"] for movie in recommendations.get("recommendations", [])]
-                all_movies = new_movies + existing_movies  # Listeleri birleştir
-                
-                # Update the movies in the table as a list
-                partners_table.update_item(
-                    Key={"UserID": user_id},
-                    UpdateExpression="SET Movies = :movies",
-                    ExpressionAttributeValues={":movies": all_movies}
-                )
-
-        # Film detaylarını arka planda oluştur ve database'e kaydet
-        movies_table = dynamodb.Table('Movies')
-        for movie in recommendations.get("recommendations", []):
-            background_tasks.add_task(
-                generate_movie_details_async,
-                movie["title"],
-                movie.get("genres", []),
-                movies_table
-            )
+        job_id = await recommendation_jobs.submit(current_user, partner_id)
 
-        return RedirectResponse(url="/recommendations", status_code=303)
-    except Exception as e:
-        print(f"Error in generate_recommendations_endpoint: {e}")
+        if wants_json:
+            return JSONResponse(
+                status_code=202,
+                content={"job_id": job_id, "status_url": f"/recommendation-jobs/{job_id}"}
+            )
+        return RedirectResponse(url=f"/recommendations?job={job_id}", status_code=303)
+    except QueueFull:
+        error = "Sistem şu anda çok yoğun, lütfen biraz sonra tekrar deneyin"
+        if wants_json:
+            return JSONResponse(status_code=503, content={"error": error}, headers={"Retry-After": "10"})
+        return templates.TemplateResponse(
+            "recommendations.html",
+            {"request": request, "partner": partner_id, "error": error},
+            status_code=503,
+            headers={"Retry-After": "10"}
+        )
+    except Exception:
+        logger.exception("Error in generate_recommendations_endpoint")
         return templates.TemplateResponse(
             "recommendations.html",
             {"request": request, "error": "Film önerileri oluşturulurken bir hata oluştu"}
         )
 
+@app.get("/recommendation-jobs/{job_id}")
+@login_required
+async def recommendation_job_status(
+    request: Request,
+    job_id: str,
+    current_user: str = Depends(get_current_user)
+):
+    job = await get_recommendation_job(job_id)
+    # Çiftin işi iki partnere de görünür (submit çift bazında tekilleştirir)
+    if not job or current_user not in (job.get("UserID"), job.get("PartnerID")):
+        return JSONResponse(status_code=404, content={"error": "İş bulunamadı"})
+    if job_is_stale(job):
+        await fail_stale_job(job)
+        job.update(Status="failed", Error=STALE_JOB_ERROR)
+    return JSONResponse(content={
+        "job_id": job_id,
+        "status": job.get("Status"),
+        "count": int(job["Count"]) if "Count" in job else None,
+        "error": job.get("Error"),
+        "created_at": job.get("CreatedAt"),
+        "updated_at": job.get("UpdatedAt")
+    })
+
+# SSE isteklerinin request_id'leri bu süre boyunca tekrar kullanılamaz
+STREAM_REQUEST_CLAIM_TTL = int(os.getenv("STREAM_REQUEST_CLAIM_TTL", str(24 * 3600)))
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.get("/generate-recommendations/stream")
+@login_required
+async def stream_recommendations_endpoint(
+    request: Request,
+    request_id: str = "",
+    current_user: str = Depends(get_current_user)
+):
+    """
+    Server-sent events: one `movie` event per recommendation as soon as the
+    model has produced it (or all at once from the precomputed batch), then
+    `done` once the set has been saved through store_recommendation_set.
+    Generation takes a slot of the recommendation job queue (same limits and
+    per-pair dedupe as /generate-recommendations): a pair that already has a
+    job gets a `queued` event with its id, a full queue a `failure`.
+
+    Generating consumes the buffer and saves history, so it runs at most once
+    per client-generated `request_id`; a GET without one (prefetch) or a
+    replay of a used one (EventSource reconnect) has no side effects.
+    """
+    user_data = await get_user(current_user)
+    partner_id = user_data.get("partner_id") if user_data else None
+
+    async def events():
+        movies = []
+        if not partner_id:
+            yield sse_event("failure", {"error": "Film önerileri için bir partneriniz olması gerekiyor"})
+            return
+        if not request_id or len(request_id) > 64:
+            yield sse_event("failure", {"error": "Geçersiz istek"})
+            return
+        # Aynı request_id ile gelen ikinci bağlantı (yeniden bağlanma) tekrar üretmez
+        claim_key = f"recommendation-stream#{current_user}#{request_id}"
+        if not await acquire_lease(claim_key, uuid.uuid4().hex, STREAM_REQUEST_CLAIM_TTL):
+            yield sse_event("failure", {"error": "Bu istek zaten işlendi, sayfayı yenileyin"})
+            return
+        try:
+            # Önceden hazırlanmış set varsa LLM akışına gerek yok
+            buffered = await recommendation_precomputer.take(current_user, partner_id)
+            if buffered:
+                for movie in buffered:
+                    yield sse_event("movie", movie)
+                result = await store_recommendation_set(current_user, partner_id, buffered)
+                yield sse_event("done", result)
+                return
+
+            # Üretim kuyruk worker'larıyla aynı slotları ve çift bazında tekilleştirmeyi kullanır
+            async with recommendation_jobs.inline_job(current_user, partner_id) as job:
+                try:
+                    async for movie in stream_movie_recommendations(current_user, partner_id):
+                        movies.append(movie)
+                        yield sse_event("movie", movie)
+                except Exception as e:
+                    if movies:
+                        raise
+                    # Akış hiç başlamadıysa ortak filtreleme önerilerine düş
+                    logger.warning("Streaming failed, using collaborative fallback: %s", e)
+                    for movie in await collaborative_fallback(current_user, partner_id):
+                        movies.append(movie)
+                        yield sse_event("movie", movie)
+
+                if not movies:
+                    job["error"] = "Film önerileri oluşturulamadı"
+                else:
+                    # Set tamamlandığında bir kez kaydet; detaylar ve ortak filtreleme arka planda güncellenir
+                    job.update(await store_recommendation_set(current_user, partner_id, movies))
+
+            if "error" in job:
+                yield sse_event("failure", {"error": job["error"]})
+            else:
+                yield sse_event("done", {"count": job["count"]})
+        except PairBusy as busy:
+            # Bu çift için zaten bir iş var; sayfa onun durumunu sorgular
+            yield sse_event("queued", {"job_id": busy.job_id})
+        except QueueFull:
+            yield sse_event("failure", {"error": "Sistem şu anda çok yoğun, lütfen biraz sonra tekrar deneyin"})
+        except Exception:
+            logger.exception("Error in stream_recommendations_endpoint")
+            yield sse_event("failure", {"error": "Film önerileri oluşturulurken bir hata oluştu"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/movie-details/{movie_name}")
 @login_required
 async def movie_details_endpoint(
@@ -585,20 +788,20 @@ async def movie_details_endpoint(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        print(f"Getting movie details for: {movie_name}")
+        logger.debug("Getting movie details", extra={"fields": {"movie": movie_name}})
         # generate_details fonksiyonu zaten database kontrolü yapıyor
-        details = generate_details(movie_name)
+        details = await generate_details(movie_name)
         
         if "error" in details:
-            print(f"Error getting details for {movie_name}: {details['error']}")
+            logger.warning("Error getting movie details: %s", details["error"], extra={"fields": {"movie": movie_name}})
             return JSONResponse(content={"error": "Film detayları alınamadı"})
             
         return JSONResponse(content={
             "description": details.get("description", ""),
             "genres": details.get("genre", [])
         })
-    except Exception as e:
-        print(f"Error in movie_details_endpoint for {movie_name}: {e}")
+    except Exception:
+        logger.exception("Error in movie_details_endpoint", extra={"fields": {"movie": movie_name}})
         return JSONResponse(content={"error": "Film detayları alınırken bir hata oluştu"})
 
 @app.get("/docs/recommendations")
@@ -608,14 +811,59 @@ async def test_recommendations(user1: str, user2: str):
     Example: /docs/recommendations?user1=User1&user2=User2
     """
     try:
-        recommendations = generate_movie_recommendations(user1, user2)
+        recommendations = await generate_movie_recommendations(user1, user2)
         if not recommendations:
             return {"error": "Film önerileri oluşturulamadı"}
         return {"recommendations": recommendations}
-    except Exception as e:
-        print(f"Error in test_recommendations: {e}")
+    except Exception:
+        logger.exception("Error in test_recommendations")
+        return {"error": "Film önerileri oluşturulurken bir hata oluştu"}
+
+@app.get("/docs/recommendations/collaborative")
+async def collaborative_recommendations_endpoint(user1: str, user2: str, k: int = RECOMMENDATION_COUNT):
+    """
+    LLM-free recommendations from all users' preferences.
+    Example: /docs/recommendations/collaborative?user1=User1&user2=User2
+    """
+    try:
+        recommendations = await collaborative_fallback(user1, user2, k)
+        if not recommendations:
+            return {"error": "Film önerileri oluşturulamadı"}
+        return {"recommendations": recommendations}
+    except Exception:
+        logger.exception("Error in collaborative_recommendations_endpoint")
         return {"error": "Film önerileri oluşturulurken bir hata oluştu"}
 
+@app.get("/internal/stats")
+async def internal_stats():
+    """
+    Process-level runtime statistics.
+    """
+    return {
+        "dynamodb_pool": get_pool_stats(),
+        "db_thread_pool": get_db_pool_stats(),
+        "recommendation_exclusions": get_exclusion_stats(),
+        "movie_cache": movie_cache.stats(),
+        "movie_details_dedup": get_details_dedup_stats(),
+        "structured_output": get_structured_stats(),
+        "recommendation_jobs": recommendation_jobs.stats(),
+        "recommendation_precompute": recommendation_precomputer.stats(),
+        "movie_vector_index": movie_index.stats(),
+        "collaborative_recommender": recommender.stats(),
+        "genre_registry": genre_registry.stats(),
+        "title_index": title_index.stats(),
+        "llm_cache": llm_cache.stats(),
+        "dynamodb_accounting": get_accounting_stats(),
+        "logging": get_logging_stats()
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text exposition of LLM, DynamoDB and recommendation job metrics.
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/logout")
 async def logout():
     response = RedirectResponse(url="/login")
@@ -629,14 +877,20 @@ async def delete_partner_endpoint(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = delete_partner(current_user)
+        user_data = await get_user(current_user)
+        partner_id = user_data.get("partner_id") if user_data else None
+        result = await delete_partner(current_user)
         if "error" in result:
             return templates.TemplateResponse(
                 "recommendations.html",
                 {"request": request, "error": result["error"]}
             )
+        if partner_id:
+            # Çift artık aktif değil, hazır seti bırakma
+            await recommendation_precomputer.invalidate(current_user, partner_id, active=False)
         return RedirectResponse(url="/recommendations", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in delete_partner_endpoint")
         return templates.TemplateResponse(
             "recommendations.html",
             {"request": request, "error": "Partner ilişkisi silinirken bir hata oluştu"}
@@ -649,24 +903,46 @@ async def notifications_page(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        notifications = get_notifications(current_user)
+        # Sadece ilk sayfayı render et, devamı /notifications/more ile yüklenir
+        page = await get_notifications_page(current_user)
         unread_count = await count_unread_notifications(current_user)
         
         return templates.TemplateResponse(
             "notifications.html",
             {
                 "request": request,
-                "notifications": notifications,
+                "notifications": page.get("items", []),
+                "next_cursor": page.get("next_cursor"),
                 "unread_notifications": unread_count,
                 "current_user": current_user
             }
         )
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in notifications_page")
         return templates.TemplateResponse(
             "notifications.html",
             {"request": request, "error": "Bildirimler alınırken bir hata oluştu"}
         )
 
+@app.get("/notifications/more")
+@login_required
+async def more_notifications(
+    request: Request,
+    cursor: str,
+    current_user: str = Depends(get_current_user)
+):
+    try:
+        page = await get_notifications_page(current_user, cursor=cursor)
+        if "error" in page:
+            return JSONResponse(content={"error": page["error"]}, status_code=400)
+        return JSONResponse(content={
+            "notifications": page["items"],
+            "next_cursor": page["next_cursor"]
+        })
+    except Exception:
+        logger.exception("Error in more_notifications")
+        return JSONResponse(content={"error": "Bildirimler alınırken bir hata oluştu"}, status_code=500)
+
 @app.post("/mark-notification-read", response_class=HTMLResponse)
 @login_required
 async def mark_notification_read(
@@ -675,15 +951,37 @@ async def mark_notification_read(
     current_user: str = Depends(get_current_user)
 ):
     try:
-        result = mark_notification_as_read(current_user, timestamp)
+        result = await mark_notification_as_read(current_user, timestamp)
         if "error" in result:
             return templates.TemplateResponse(
                 "notifications.html",
                 {"request": request, "error": result["error"]}
             )
         return RedirectResponse(url="/notifications", status_code=303)
-    except Exception as e:
+    except Exception:
+        logger.exception("Error in mark_notification_read")
         return templates.TemplateResponse(
             "notifications.html",
             {"request": request, "error": "Bildirim işaretlenirken bir hata oluştu"}
         )
+
+@app.post("/mark-all-notifications-read", response_class=HTMLResponse)
+@login_required
+async def mark_all_notifications_read(
+    request: Request,
+    current_user: str = Depends(get_current_user)
+):
+    try:
+        result = await mark_all_notifications_as_read(current_user)
+        if "error" in result:
+            return templates.TemplateResponse(
+                "notifications.html",
+                {"request": request, "error": result["error"]}
+            )
+        return RedirectResponse(url="/notifications", status_code=303)
+    except Exception:
+        logger.exception("Error in mark_all_notifications_read")
+        return templates.TemplateResponse(
+            "notifications.html",
+            {"request": request, "error": "Bildirimler işaretlenirken bir hata oluştu"}
+        )
@@ -0,0 +1,116 @@
+"""
+Async facade over crud.py for the FastAPI handlers.
+
+boto3 is blocking, so every call is offloaded to a bounded thread pool
+instead of running on the event loop. The pool size defaults to the
+DynamoDB connection pool size so offloaded calls never queue for a
+connection.
+"""
+import os
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from app.services import crud
+from app.services.dynamo import DYNAMODB_MAX_POOL_CONNECTIONS
+
+DB_THREADPOOL_SIZE = int(os.getenv("DB_THREADPOOL_SIZE", str(DYNAMODB_MAX_POOL_CONNECTIONS)))
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADPOOL_SIZE, thread_name_prefix="dynamodb")
+
+_lock = threading.Lock()
+_pool_counters = {"submitted": 0, "started": 0, "completed": 0}
+
+
+def _count(name):
+    with _lock:
+        _pool_counters[name] += 1
+
+
+def _tracked(call):
+    # Worker thread'inde çalışır: başlangıç ve bitişi say
+    _count("started")
+    try:
+        return call()
+    finally:
+        _count("completed")
+
+
+async def run_in_db_pool(func, *args, **kwargs):
+    """
+    Run a blocking data-access function on the DynamoDB thread pool.
+    Context variables of the caller are visible inside the call.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, func, *args, **kwargs)
+    _count("submitted")
+    return await loop.run_in_executor(_executor, _tracked, call)
+
+
+def _offload(func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        return await run_in_db_pool(func, *args, **kwargs)
+    return wrapper
+
+
+get_partner_record = _offload(crud.get_partner_record)
+get_movie_record = _offload(crud.get_movie_record)
+batch_get_movies = _offload(crud.batch_get_movies)
+put_movies = _offload(crud.put_movies)
+find_movie_by_title = _offload(crud.find_movie_by_title)
+scan_movies = _offload(crud.scan_movies)
+scan_preference_rows = _offload(crud.scan_preference_rows)
+scan_partner_rows = _offload(crud.scan_partner_rows)
+get_recommendation_history = _offload(crud.get_recommendation_history)
+save_recommendations = _offload(crud.save_recommendations)
+acquire_lease = _offload(crud.acquire_lease)
+release_lease = _offload(crud.release_lease)
+acquire_leases = _offload(crud.acquire_leases)
+release_leases = _offload(crud.release_leases)
+put_recommendation_job = _offload(crud.put_recommendation_job)
+update_recommendation_job = _offload(crud.update_recommendation_job)
+get_recommendation_job = _offload(crud.get_recommendation_job)
+scan_unfinished_recommendation_jobs = _offload(crud.scan_unfinished_recommendation_jobs)
+put_recommendation_buffer = _offload(crud.put_recommendation_buffer)
+take_recommendation_buffer = _offload(crud.take_recommendation_buffer)
+invalidate_recommendation_buffer = _offload(crud.invalidate_recommendation_buffer)
+get_recommendation_buffer_generation = _offload(crud.get_recommendation_buffer_generation)
+list_pairs_to_refill = _offload(crud.list_pairs_to_refill)
+get_llm_cache_entry = _offload(crud.get_llm_cache_entry)
+put_llm_cache_entry = _offload(crud.put_llm_cache_entry)
+scan_llm_cache_ages = _offload(crud.scan_llm_cache_ages)
+delete_llm_cache_entries = _offload(crud.delete_llm_cache_entries)
+
+create_user = _offload(crud.create_user)
+get_user = _offload(crud.get_user)
+
+send_partner_request = _offload(crud.send_partner_request)
+get_partner_requests = _offload(crud.get_partner_requests)
+accept_partner_request = _offload(crud.accept_partner_request)
+reject_partner_request = _offload(crud.reject_partner_request)
+withdraw_partner_request = _offload(crud.withdraw_partner_request)
+delete_partner = _offload(crud.delete_partner)
+
+get_user_preferences = _offload(crud.get_user_preferences)
+update_user_preferences = _offload(crud.update_user_preferences)
+add_to_user_preferences = _offload(crud.add_to_user_preferences)
+delete_from_user_preferences = _offload(crud.delete_from_user_preferences)
+get_combined_preferences = _offload(crud.get_combined_preferences)
+
+get_notifications_page = _offload(crud.get_notifications_page)
+mark_notification_as_read = _offload(crud.mark_notification_as_read)
+mark_all_notifications_as_read = _offload(crud.mark_all_notifications_as_read)
+get_unread_notification_count = _offload(crud.get_unread_notification_count)
+
+
+def get_db_pool_stats():
+    with _lock:
+        stats = dict(_pool_counters)
+    stats["max_workers"] = DB_THREADPOOL_SIZE
+    # Gönderilmiş ama henüz bir thread'de başlamamış çağrılar
+    stats["queued"] = stats["submitted"] - stats["started"]
+    stats["running"] = stats["started"] - stats["completed"]
+    return stats
@@ -2,19 +2,22 @@ from jose import JWTError, jwt
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
-from fastapi import Depends, HTTPException, Request
+from fastapi import HTTPException, Request
 from fastapi.security import OAuth2PasswordBearer
 from fastapi.responses import RedirectResponse
 from typing import Optional
 from starlette.status import HTTP_401_UNAUTHORIZED
 from functools import wraps
+import logging
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 # Get SECRET_KEY from environment or use default
 SECRET_KEY = os.getenv("SECRET_KEY", "your-256-bit-secret-key-moviesuggestion-app-2024")
 if not SECRET_KEY:
-    print("WARNING: Using default SECRET_KEY. This is not secure for production!")
+    logger.warning("Using default SECRET_KEY. This is not secure for production!")
     SECRET_KEY = "your-256-bit-secret-key-moviesuggestion-app-2024"
 
 ALGORITHM = "HS256"
@@ -22,7 +25,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24  # 24 saat
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     try:
-        print(f"Creating access token for data: {data}")
+        logger.debug("Creating access token", extra={"fields": {"sub": data.get("sub")}})
         to_encode = data.copy()
         if expires_delta:
             expire = datetime.utcnow() + expires_delta
@@ -30,16 +33,10 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
             expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
         
         to_encode.update({"exp": expire})
-        print(f"Data to encode: {to_encode}")
-        print(f"Using SECRET_KEY: {SECRET_KEY}")
         encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
-        print(f"Generated token: {encoded_jwt}")
         return encoded_jwt
-    except Exception as e:
-        print(f"Error creating access token: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error creating access token")
         raise
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
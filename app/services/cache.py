@@ -0,0 +1,75 @@
+"""
+Bounded in-process LRU cache with per-entry TTL and negative caching.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+MISS = object()
+# Stored for keys whose lookup/generation recently failed
+NEGATIVE = object()
+
+
+class TTLCache:
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, key):
+        """
+        Return the cached value, NEGATIVE for a remembered failure, or MISS.
+        """
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return MISS
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                self._counters["expirations"] += 1
+                self._counters["misses"] += 1
+                return MISS
+            self._data.move_to_end(key)
+            self._counters["negative_hits" if value is NEGATIVE else "hits"] += 1
+            return value
+
+    def set(self, key, value, ttl: float = None):
+        with self._lock:
+            self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def set_negative(self, key):
+        self.set(key, NEGATIVE, ttl=self.negative_ttl)
+
+    def invalidate(self, key):
+        with self._lock:
+            if self._data.pop(key, None) is not None:
+                self._counters["invalidations"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._counters)
+            stats["size"] = len(self._data)
+        stats["maxsize"] = self.maxsize
+        lookups = stats["hits"] + stats["negative_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["hits"] + stats["negative_hits"]) / lookups, 3) if lookups else None
+        return stats
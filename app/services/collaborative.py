@@ -0,0 +1,294 @@
+"""
+LLM-free item-item collaborative filtering.
+
+Every user is a row of a sparse user-item matrix X: movies they liked
+(UserPreferences.Movies, weight 1) and movies recommended to their pair
+(Partners.Movies, weight COLLAB_RECOMMENDED_WEIGHT). The item-item
+co-occurrence matrix C = X^T X is kept in SciPy CSR form; a pair's
+suggestions are the cosine-normalized sum of the C rows of the movies they
+like, which is a sparse row slice plus one vector product.
+
+When a user's row changes, the new row is queued; every
+COLLAB_FOLD_INTERVAL seconds the queued rows are folded into C in one
+batch on the DB thread pool (C += new^T new - old^T old) instead of on the
+event loop. A periodic full rebuild removes any drift.
+"""
+import os
+import time
+import threading
+import asyncio
+import logging
+import numpy as np
+from scipy import sparse
+from app.services.async_crud import run_in_db_pool, get_user_preferences, get_partner_record, scan_preference_rows, scan_partner_rows
+
+logger = logging.getLogger(__name__)
+
+COLLAB_RECOMMENDED_WEIGHT = float(os.getenv("COLLAB_RECOMMENDED_WEIGHT", "0.5"))
+COLLAB_REBUILD_INTERVAL = float(os.getenv("COLLAB_REBUILD_INTERVAL", "3600"))
+COLLAB_FOLD_INTERVAL = float(os.getenv("COLLAB_FOLD_INTERVAL", "5"))
+# Bir filmin önerilebilmesi için gereken en az kullanıcı sayısı
+COLLAB_MIN_SUPPORT = int(os.getenv("COLLAB_MIN_SUPPORT", "2"))
+
+
+def user_row(preferences: dict, partner_record: dict) -> dict:
+    """
+    {title: weight} for one user.
+    """
+    row = {str(title): COLLAB_RECOMMENDED_WEIGHT for title in (partner_record or {}).get("Movies", [])}
+    for title in (preferences or {}).get("Movies", []):
+        row[str(title)] = 1.0
+    return row
+
+
+class ItemItemRecommender:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fold_lock = threading.Lock()
+        self._pending = {}  # user_id -> row waiting to be folded into C
+        self._items = {}  # title -> column
+        self._titles = []
+        self._users = {}  # user_id -> {title: weight}
+        self._support = np.zeros(0, dtype=np.int32)  # users per item
+        self._cooccurrence = sparse.csr_matrix((0, 0), dtype=np.float32)
+        self._stats = {
+            "builds": 0, "build_seconds": None, "user_updates": 0, "folds": 0, "fold_ms": None,
+            "queries": 0, "query_ms_total": 0.0
+        }
+
+    def _column(self, title: str) -> int:
+        column = self._items.get(title)
+        if column is None:
+            column = len(self._titles)
+            self._items[title] = column
+            self._titles.append(title)
+        return column
+
+    def _indexed(self, row: dict) -> dict:
+        """
+        {column: weight} for a {title: weight} row; columns must exist. Call under _lock.
+        """
+        return {self._items[title]: weight for title, weight in row.items()}
+
+    @staticmethod
+    def _matrix(rows: list, size: int):
+        """
+        Sparse (len(rows) x size) matrix of {column: weight} rows.
+        """
+        row_index, columns, weights = [], [], []
+        for index, row in enumerate(rows):
+            for column, weight in row.items():
+                row_index.append(index)
+                columns.append(column)
+                weights.append(weight)
+        return sparse.csr_matrix(
+            (np.array(weights, dtype=np.float32), (np.array(row_index, dtype=np.int32), np.array(columns, dtype=np.int32))),
+            shape=(len(rows), size)
+        )
+
+    def build(self, users: dict):
+        """
+        Rebuild from {user_id: {title: weight}}.
+        """
+        started = time.perf_counter()
+        fresh = ItemItemRecommender()
+        rows, columns, weights = [], [], []
+        for index, row in enumerate(users.values()):
+            for title, weight in row.items():
+                rows.append(index)
+                columns.append(fresh._column(title))
+                weights.append(weight)
+        matrix = sparse.csr_matrix(
+            (np.array(weights, dtype=np.float32), (np.array(rows, dtype=np.int32), np.array(columns, dtype=np.int32))),
+            shape=(len(users), len(fresh._titles))
+        )
+        cooccurrence = (matrix.T @ matrix).tocsr()
+        support = np.asarray((matrix > 0).sum(axis=0)).ravel().astype(np.int32)
+
+        with self._lock:
+            self._items, self._titles = fresh._items, fresh._titles
+            self._users = {user_id: dict(row) for user_id, row in users.items()}
+            self._cooccurrence, self._support = cooccurrence, support
+            self._stats["builds"] += 1
+            self._stats["build_seconds"] = round(time.perf_counter() - started, 3)
+
+    def update_user(self, user_id: str, row: dict):
+        """
+        Queue one user's new row; apply_pending() folds it into C.
+        """
+        with self._lock:
+            self._pending[user_id] = dict(row)
+
+    def apply_pending(self) -> int:
+        """
+        Fold queued rows into C in one batch: C += new^T new - old^T old.
+        Blocking; run it off the event loop. Returns the number of users folded.
+        Rows that could not be folded are queued again.
+        """
+        with self._fold_lock:
+            started = time.perf_counter()
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                pending = {user_id: row for user_id, row in pending.items() if self._users.get(user_id, {}) != row}
+                if not pending:
+                    return 0
+            try:
+                return self._fold(pending, started)
+            except Exception:
+                self._requeue(pending)
+                raise
+
+    def _fold(self, pending: dict, started: float) -> int:
+        with self._lock:
+            # Sütun numaraları kilit altında çözülür; build() _items'ı değiştirse de
+            # aşağıdaki matrisler bu anın görüntüsüne aittir
+            builds = self._stats["builds"]
+            for row in pending.values():
+                for title in row:
+                    self._column(title)
+            old_rows = [self._indexed(self._users.get(user_id, {})) for user_id in pending]
+            new_rows = [self._indexed(row) for row in pending.values()]
+            size = len(self._titles)
+            cooccurrence, support = self._cooccurrence, self._support
+
+        # Ağır kısım kilit dışında: sorgular eski C ile devam eder
+        old_matrix = self._matrix(old_rows, size)
+        new_matrix = self._matrix(new_rows, size)
+        delta = (new_matrix.T @ new_matrix) - (old_matrix.T @ old_matrix)
+        cooccurrence = (_padded(cooccurrence, size) + delta).tocsr()
+        cooccurrence.eliminate_zeros()
+        support = np.concatenate([support, np.zeros(size - len(support), dtype=np.int32)])
+        support += np.asarray((new_matrix > 0).sum(axis=0)).ravel().astype(np.int32)
+        support -= np.asarray((old_matrix > 0).sum(axis=0)).ravel().astype(np.int32)
+
+        with self._lock:
+            if self._stats["builds"] != builds:
+                # Arada tam yeniden kurulum oldu; taramadan önce gelen satırları
+                # içermeyebilir, bir sonraki katlamaya bırak
+                self._requeue_locked(pending)
+                return 0
+            self._cooccurrence, self._support = cooccurrence, support
+            self._users.update(pending)
+            self._stats["user_updates"] += len(pending)
+            self._stats["folds"] += 1
+            self._stats["fold_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return len(pending)
+
+    def _requeue(self, pending: dict):
+        with self._lock:
+            self._requeue_locked(pending)
+
+    def _requeue_locked(self, pending: dict):
+        # Bu arada gelen daha yeni satırlar öncelikli
+        for user_id, row in pending.items():
+            self._pending.setdefault(user_id, row)
+
+    def recommend(self, liked, k: int = 10, exclude=()) -> list:
+        """
+        Top-k (title, score) for a set of liked titles, skipping `liked` and `exclude`.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            size = self._cooccurrence.shape[0]
+            # Henüz C'ye katlanmamış yeni filmlerin sütunu olabilir
+            columns = np.array(
+                [self._items[title] for title in liked if self._items.get(title, size) < size], dtype=np.int32
+            )
+            if len(columns) == 0:
+                return []
+            norms = np.sqrt(self._cooccurrence.diagonal()).astype(np.float32)
+            norms[norms == 0] = 1.0
+            # cosine(i, j) = C_ij / (|i| |j|); C simetrik olduğundan satır dilimi yeterli
+            scores = (self._cooccurrence[columns].T @ (1.0 / norms[columns])) / norms
+            scores[columns] = 0
+            scores[self._support < COLLAB_MIN_SUPPORT] = 0
+            for title in exclude:
+                column = self._items.get(title)
+                if column is not None and column < size:
+                    scores[column] = 0
+
+            candidates = np.flatnonzero(scores > 0)
+            top = candidates[np.argsort(-scores[candidates])[:k]]
+            results = [(self._titles[i], float(scores[i])) for i in top]
+        self._stats["queries"] += 1
+        self._stats["query_ms_total"] += (time.perf_counter() - started) * 1000
+        return results
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["users"] = len(self._users)
+            stats["pending_updates"] = len(self._pending)
+            stats["items"] = len(self._titles)
+            stats["nonzeros"] = int(self._cooccurrence.nnz)
+        queries = stats.pop("query_ms_total")
+        stats["avg_query_ms"] = round(queries / stats["queries"], 3) if stats["queries"] else None
+        return stats
+
+
+def _padded(matrix, size: int):
+    """
+    `matrix` grown to (size x size) with empty rows/columns, without touching the original.
+    """
+    rows = matrix.shape[0]
+    indptr = np.concatenate([matrix.indptr, np.full(size - rows, matrix.indptr[-1], dtype=matrix.indptr.dtype)])
+    return sparse.csr_matrix((matrix.data, matrix.indices, indptr), shape=(size, size))
+
+
+recommender = ItemItemRecommender()
+
+
+async def build_recommender():
+    """
+    Full rebuild from UserPreferences and Partners scans.
+    """
+    preferences = {item["UserID"]: item for item in await scan_preference_rows()}
+    partners = {item["UserID"]: item for item in await scan_partner_rows()}
+    users = {
+        user_id: user_row(preferences.get(user_id), partners.get(user_id))
+        for user_id in set(preferences) | set(partners)
+    }
+    await run_in_db_pool(recommender.build, users)
+    logger.info("Collaborative recommender built", extra={"fields": recommender.stats()})
+
+
+async def rebuild_periodically():
+    while True:
+        try:
+            await build_recommender()
+        except Exception:
+            logger.exception("Error building collaborative recommender")
+        await asyncio.sleep(COLLAB_REBUILD_INTERVAL)
+
+
+async def fold_periodically():
+    while True:
+        await asyncio.sleep(COLLAB_FOLD_INTERVAL)
+        try:
+            await run_in_db_pool(recommender.apply_pending)
+        except Exception as e:
+            logger.exception("Error folding collaborative updates: %s", e)
+
+
+async def refresh_users(*user_ids):
+    """
+    Re-read the given users' rows after their preferences or pair history changed.
+    """
+    for user_id in user_ids:
+        try:
+            preferences = await get_user_preferences(user_id)
+            if "error" in preferences:
+                preferences = {}
+            partner_record = await get_partner_record(user_id)
+            recommender.update_user(user_id, user_row(preferences, partner_record))
+        except Exception:
+            logger.exception("Error refreshing collaborative row", extra={"fields": {"user_id": user_id}})
+
+
+def collaborative_recommendations(combined_preferences: dict, k: int = 10, exclude=()) -> list:
+    """
+    Ranked suggestions for a pair from get_combined_preferences output,
+    as [{"title", "genres"}] like generate_movie_recommendations.
+    """
+    ranked = recommender.recommend(combined_preferences.get("movies", []), k=k, exclude=set(exclude))
+    return [{"title": title, "genres": []} for title, _ in ranked]
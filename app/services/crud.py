@@ -1,14 +1,18 @@
-import boto3
 import os
+import json
+import base64
+import time
+import logging
 from datetime import datetime
+from boto3.dynamodb.types import TypeSerializer
+from app.services.dynamo import get_dynamodb_resource
+from app.services.genres import canonical_genres
+from app.services.titles import title_key, base_title_key, match_title
+
+logger = logging.getLogger(__name__)
 
 # DynamoDB connection
-dynamodb = boto3.resource(
-    'dynamodb',
-    region_name=os.getenv("AWS_DEFAULT_REGION"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
-)
+dynamodb = get_dynamodb_resource()
 
 # Tables
 user_table = dynamodb.Table('Users')
@@ -16,6 +20,531 @@ request_table = dynamodb.Table('PartnerRequests')
 preferences_table = dynamodb.Table('UserPreferences')
 partners_table = dynamodb.Table('Partners')
 notifications_table = dynamodb.Table('Notifications')  # Yeni tablo
+movies_table = dynamodb.Table('Movies')
+history_table = dynamodb.Table('RecommendationHistory')  # PairID -> önerilen filmler
+leases_table = dynamodb.Table('Leases')  # Worker'lar arası kısa süreli kilitler
+jobs_table = dynamodb.Table('RecommendationJobs')  # Kuyruktaki öneri işlerinin durumu
+buffer_table = dynamodb.Table('RecommendationBuffer')  # PairID -> önceden hazırlanmış öneri seti
+llm_cache_table = dynamodb.Table('LLMCache')  # Prompt parmak izi -> model cevabı
+
+BATCH_GET_MAX_KEYS = 100  # DynamoDB BatchGetItem limit
+BATCH_GET_MAX_RETRIES = 5
+TRANSACT_MAX_ITEMS = 100  # DynamoDB TransactWriteItems limit
+
+_serializer = TypeSerializer()
+
+NOTIFICATIONS_PAGE_SIZE = int(os.getenv("NOTIFICATIONS_PAGE_SIZE", "20"))
+
+# PartnerRequests GSI (HASH SenderUserID, RANGE Status); see dynamo_schema.py
+PARTNER_REQUESTS_SENDER_INDEX = "SenderUserID-Status-index"
+# Movies GSI (HASH TitleBase): aynı filmin farklı yazılışlarını worker'lar arası bulmak için
+MOVIES_TITLE_INDEX = "TitleBase-index"
+
+
+# Repository layer: primary-key lookups instead of full-table scans.
+# Users, UserPreferences and Partners are keyed by UserID, Notifications by
+# UserID + Timestamp and Movies by MovieName.
+
+def _get_item(table, key, **kwargs):
+    """
+    Fetch a single item by its primary key. Returns None if it does not exist.
+    """
+    response = table.get_item(Key=key, **kwargs)
+    return response.get("Item")
+
+
+def _is_conditional_check_failure(error):
+    return getattr(error, "response", {}).get("Error", {}).get("Code") == "ConditionalCheckFailedException"
+
+
+def _query_all(table, **kwargs):
+    """
+    Run a Query and follow LastEvaluatedKey until every page has been read.
+    """
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return items
+        kwargs["ExclusiveStartKey"] = last_key
+
+
+def _scan_all(table, **kwargs):
+    """
+    Full-table Scan following LastEvaluatedKey. Only for background jobs
+    (index builds, sweeps), never on a request path.
+    """
+    items = []
+    while True:
+        response = table.scan(**kwargs)
+        items.extend(response.get("Items", []))
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return items
+        kwargs["ExclusiveStartKey"] = last_key
+
+
+def get_user_record(user_id):
+    return _get_item(user_table, {"UserID": user_id})
+
+
+def get_preferences_record(user_id):
+    return _get_item(preferences_table, {"UserID": user_id})
+
+
+def get_partner_record(user_id):
+    return _get_item(partners_table, {"UserID": user_id})
+
+
+def get_notification_record(user_id, timestamp):
+    return _get_item(notifications_table, {"UserID": user_id, "Timestamp": timestamp})
+
+
+def get_movie_record(movie_name):
+    return _get_item(movies_table, {"MovieName": movie_name})
+
+
+def batch_get_movies(movie_names):
+    """
+    Fetch Movies rows with chunked BatchGetItem calls.
+    Returns ({MovieName: item}, round_trips). UnprocessedKeys are retried
+    with exponential backoff.
+    """
+    unique_names = list(dict.fromkeys(movie_names))
+    movies = {}
+    round_trips = 0
+
+    for start in range(0, len(unique_names), BATCH_GET_MAX_KEYS):
+        chunk = unique_names[start:start + BATCH_GET_MAX_KEYS]
+        request_items = {
+            movies_table.name: {"Keys": [{"MovieName": name} for name in chunk]}
+        }
+        attempt = 0
+        while request_items:
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            round_trips += 1
+            for item in response.get("Responses", {}).get(movies_table.name, []):
+                movies[item["MovieName"]] = item
+
+            request_items = response.get("UnprocessedKeys") or {}
+            if request_items:
+                attempt += 1
+                if attempt > BATCH_GET_MAX_RETRIES:
+                    logger.warning("batch_get_movies: giving up on unprocessed keys", extra={"fields": {"unprocessed": request_items}})
+                    break
+                time.sleep(min(0.05 * (2 ** attempt), 2))
+
+    return movies, round_trips
+
+
+def title_attributes(movie_name):
+    """
+    Normalized title attributes stored on every Movies row.
+    """
+    return {"TitleKey": title_key(movie_name), "TitleBase": base_title_key(movie_name)}
+
+
+def find_movie_by_title(title):
+    """
+    Movies row stored under another spelling of `title` ("the matrix" ->
+    "The Matrix (1999)"), via the TitleBase index. None if there is none.
+    """
+    items = _query_all(
+        movies_table,
+        IndexName=MOVIES_TITLE_INDEX,
+        KeyConditionExpression="TitleBase = :base",
+        ExpressionAttributeValues={":base": base_title_key(title)}
+    )
+    by_name = {item["MovieName"]: item for item in items}
+    name = match_title(title, sorted(by_name))
+    return by_name[name] if name else None
+
+
+def put_movies(items, skip_lookup=False):
+    """
+    Write Movies rows through one batch_writer, which groups them into
+    BatchWriteItem calls of 25 and resends unprocessed items. Titles already
+    stored under another spelling are skipped; returns the items written.
+    Callers that have already resolved the titles against the catalog pass
+    skip_lookup=True to avoid one TitleBase query per item.
+    """
+    written = []
+    for item in items:
+        if not skip_lookup:
+            existing = find_movie_by_title(item["MovieName"])
+            if existing and existing["MovieName"] != item["MovieName"]:
+                logger.info("Skipping duplicate movie", extra={"fields": {"movie": item["MovieName"], "stored_as": existing["MovieName"]}})
+                continue
+        written.append(dict(item, **title_attributes(item["MovieName"])))
+
+    with movies_table.batch_writer(overwrite_by_pkeys=["MovieName"]) as batch:
+        for item in written:
+            batch.put_item(Item=item)
+    return written
+
+
+def scan_movies():
+    """
+    Every Movies row (MovieName, Description, Genre), e.g. to build the vector index.
+    """
+    return _scan_all(movies_table, ProjectionExpression="MovieName, Description, Genre")
+
+
+def scan_preference_rows():
+    """
+    (UserID, Movies) of every UserPreferences row.
+    """
+    return _scan_all(preferences_table, ProjectionExpression="UserID, Movies")
+
+
+def scan_partner_rows():
+    """
+    (UserID, PartnerID, Movies) of every Partners row.
+    """
+    return _scan_all(partners_table, ProjectionExpression="UserID, PartnerID, Movies")
+
+
+def pair_id(user_id, partner_id):
+    """
+    Order-independent key for a partner pair.
+    """
+    return "#".join(sorted([user_id, partner_id]))
+
+
+def get_recommendation_history(user_id, partner_id):
+    """
+    Every title ever recommended to this pair, as a set for O(1) membership checks.
+    One key lookup, independent of how many users exist.
+    """
+    item = _get_item(
+        history_table,
+        {"PairID": pair_id(user_id, partner_id)},
+        ProjectionExpression="Movies"
+    )
+    return set((item or {}).get("Movies", set()))
+
+
+def add_to_recommendation_history(user_id, partner_id, titles):
+    titles = set(str(t) for t in titles)
+    if not titles:
+        return
+    history_table.update_item(
+        Key={"PairID": pair_id(user_id, partner_id)},
+        UpdateExpression="ADD Movies :titles SET UpdatedAt = :now",
+        ExpressionAttributeValues={
+            ":titles": titles,
+            ":now": datetime.utcnow().isoformat()
+        }
+    )
+
+
+def acquire_lease(lease_key, owner, ttl_seconds):
+    """
+    Take a lease row unless another owner holds an unexpired one.
+    ExpiresAt doubles as the table's DynamoDB TTL attribute.
+    """
+    now = int(time.time())
+    try:
+        leases_table.put_item(
+            Item={
+                "LeaseKey": lease_key,
+                "Owner": owner,
+                "ExpiresAt": now + int(ttl_seconds)
+            },
+            ConditionExpression="attribute_not_exists(LeaseKey) OR ExpiresAt < :now OR #o = :owner",
+            ExpressionAttributeNames={"#o": "Owner"},
+            ExpressionAttributeValues={":now": now, ":owner": owner}
+        )
+        return True
+    except Exception as e:
+        if _is_conditional_check_failure(e):
+            return False
+        raise
+
+
+def release_lease(lease_key, owner):
+    try:
+        leases_table.delete_item(
+            Key={"LeaseKey": lease_key},
+            ConditionExpression="#o = :owner",
+            ExpressionAttributeNames={"#o": "Owner"},
+            ExpressionAttributeValues={":owner": owner}
+        )
+    except Exception as e:
+        if not _is_conditional_check_failure(e):
+            raise
+
+
+def _transact_each(actions):
+    """
+    Run conditional TransactWriteItems `actions` as one transaction per 100.
+    When a transaction is cancelled, the actions whose condition failed (or
+    that conflicted) are dropped and the rest retried. Returns the indexes
+    of the actions that were applied.
+    """
+    applied = []
+    for start in range(0, len(actions), TRANSACT_MAX_ITEMS):
+        pending = list(range(start, min(start + TRANSACT_MAX_ITEMS, len(actions))))
+        while pending:
+            try:
+                dynamodb.meta.client.transact_write_items(TransactItems=[actions[i] for i in pending])
+                applied.extend(pending)
+                break
+            except Exception as e:
+                reasons = getattr(e, "response", {}).get("CancellationReasons")
+                if not reasons:
+                    raise
+                pending = [i for i, reason in zip(pending, reasons) if reason.get("Code") in (None, "None")]
+    return applied
+
+
+def acquire_leases(lease_keys, owner, ttl_seconds):
+    """
+    acquire_lease for several keys in one transactional write.
+    Returns the keys that were acquired.
+    """
+    now = int(time.time())
+    actions = [
+        {
+            "Put": {
+                "TableName": leases_table.name,
+                "Item": {
+                    "LeaseKey": {"S": lease_key},
+                    "Owner": {"S": owner},
+                    "ExpiresAt": _serializer.serialize(now + int(ttl_seconds))
+                },
+                "ConditionExpression": "attribute_not_exists(LeaseKey) OR ExpiresAt < :now OR #o = :owner",
+                "ExpressionAttributeNames": {"#o": "Owner"},
+                "ExpressionAttributeValues": {":now": _serializer.serialize(now), ":owner": {"S": owner}}
+            }
+        }
+        for lease_key in lease_keys
+    ]
+    return [lease_keys[i] for i in _transact_each(actions)]
+
+
+def release_leases(lease_keys, owner):
+    """
+    release_lease for several keys in one transactional write; leases that
+    expired and were taken over by another owner are left alone.
+    """
+    _transact_each([
+        {
+            "Delete": {
+                "TableName": leases_table.name,
+                "Key": {"LeaseKey": {"S": lease_key}},
+                "ConditionExpression": "#o = :owner",
+                "ExpressionAttributeNames": {"#o": "Owner"},
+                "ExpressionAttributeValues": {":owner": {"S": owner}}
+            }
+        }
+        for lease_key in lease_keys
+    ])
+
+
+def put_recommendation_job(job):
+    jobs_table.put_item(Item=job)
+
+
+def update_recommendation_job(job_id, status, **fields):
+    """
+    Set a job's Status plus any extra attributes (e.g. StartedAt, Error).
+    """
+    fields["Status"] = status
+    fields["UpdatedAt"] = datetime.utcnow().isoformat()
+    names = {f"#f{i}": name for i, name in enumerate(fields)}
+    values = {f":v{i}": value for i, value in enumerate(fields.values())}
+    jobs_table.update_item(
+        Key={"JobID": job_id},
+        UpdateExpression="SET " + ", ".join(f"#f{i} = :v{i}" for i in range(len(fields))),
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues=values
+    )
+
+
+def get_recommendation_job(job_id):
+    return _get_item(jobs_table, {"JobID": job_id})
+
+
+def scan_unfinished_recommendation_jobs():
+    """
+    Jobs still marked queued or running, for recovery after a restart.
+    """
+    return _scan_all(
+        jobs_table,
+        FilterExpression="#s IN (:queued, :running)",
+        ProjectionExpression="JobID, #s, UpdatedAt",
+        ExpressionAttributeNames={"#s": "Status"},
+        ExpressionAttributeValues={":queued": "queued", ":running": "running"}
+    )
+
+
+# RecommendationBuffer satırı çift başına kalıcıdır: Generation her
+# geçersiz kılmada artar, Movies/CreatedAt sadece hazır bir set varken bulunur.
+
+def get_recommendation_buffer_generation(user_id, partner_id):
+    item = _get_item(
+        buffer_table,
+        {"PairID": pair_id(user_id, partner_id)},
+        ProjectionExpression="Generation"
+    )
+    return int((item or {}).get("Generation", 0))
+
+
+def put_recommendation_buffer(user_id, partner_id, movies, ttl_seconds, generation=0):
+    """
+    Store the pair's batch unless the buffer was invalidated after
+    `generation` was read. Returns False for a stale batch.
+    """
+    condition = "Generation = :generation"
+    if not generation:
+        # Satır hiç oluşmamış ya da TTL ile silinmiş olabilir
+        condition = "attribute_not_exists(Generation) OR " + condition
+    try:
+        buffer_table.update_item(
+            Key={"PairID": pair_id(user_id, partner_id)},
+            UpdateExpression="SET Movies = :movies, CreatedAt = :created, ExpiresAt = :expires, Generation = :generation",
+            ConditionExpression=condition,
+            ExpressionAttributeValues={
+                ":movies": movies,
+                ":created": datetime.utcnow().isoformat(),
+                ":expires": int(time.time()) + int(ttl_seconds),
+                ":generation": int(generation)
+            }
+        )
+        return True
+    except Exception as e:
+        if _is_conditional_check_failure(e):
+            return False
+        raise
+
+
+def take_recommendation_buffer(user_id, partner_id, ttl_seconds):
+    """
+    Atomically remove and return the pair's precomputed movies, or None.
+    Concurrent takers cannot both receive the same batch. Hit or miss, the
+    row records the pair as active (LastActiveAt) for the refill sweep.
+    """
+    now = int(time.time())
+    response = buffer_table.update_item(
+        Key={"PairID": pair_id(user_id, partner_id)},
+        UpdateExpression="REMOVE Movies, CreatedAt SET LastActiveAt = :now, UserID = :user, PartnerID = :partner, ExpiresAt = :expires",
+        ExpressionAttributeValues={
+            ":now": now,
+            ":user": user_id,
+            ":partner": partner_id,
+            ":expires": now + int(ttl_seconds)
+        },
+        ReturnValues="ALL_OLD"
+    )
+    item = response.get("Attributes")
+    # DynamoDB TTL silmesi gecikebilir, süresi geçmişse yok say
+    if not item or int(item.get("ExpiresAt", 0)) < now:
+        return None
+    return item.get("Movies") or None
+
+
+def invalidate_recommendation_buffer(user_id, partner_id, ttl_seconds, active=True):
+    """
+    Drop the pair's batch and bump its Generation so that a refill started
+    before this call (in any worker) cannot store its stale batch. Marks
+    the pair active like take_recommendation_buffer, or, with active=False
+    (the pair ended), drops it from the refill sweep.
+    """
+    now = int(time.time())
+    values = {":one": 1, ":expires": now + int(ttl_seconds)}
+    if active:
+        expression = "REMOVE Movies, CreatedAt ADD Generation :one SET ExpiresAt = :expires, LastActiveAt = :now, UserID = :user, PartnerID = :partner"
+        values.update({":now": now, ":user": user_id, ":partner": partner_id})
+    else:
+        expression = "REMOVE Movies, CreatedAt, LastActiveAt ADD Generation :one SET ExpiresAt = :expires"
+    buffer_table.update_item(
+        Key={"PairID": pair_id(user_id, partner_id)},
+        UpdateExpression=expression,
+        ExpressionAttributeValues=values
+    )
+
+
+def list_pairs_to_refill(active_since):
+    """
+    (user_id, partner_id) of pairs that took a batch or changed preferences
+    since `active_since` (epoch seconds) and have no batch now.
+    """
+    items = _scan_all(
+        buffer_table,
+        FilterExpression="attribute_not_exists(Movies) AND LastActiveAt >= :since",
+        ProjectionExpression="UserID, PartnerID",
+        ExpressionAttributeValues={":since": int(active_since)}
+    )
+    return [(item["UserID"], item["PartnerID"]) for item in items if item.get("UserID") and item.get("PartnerID")]
+
+
+def get_llm_cache_entry(fingerprint):
+    return _get_item(llm_cache_table, {"Fingerprint": fingerprint})
+
+
+def put_llm_cache_entry(item):
+    llm_cache_table.put_item(Item=item)
+
+
+def scan_llm_cache_ages():
+    """
+    (Fingerprint, CreatedAt) of every cached response, for size-bounded eviction.
+    """
+    return _scan_all(
+        llm_cache_table,
+        ProjectionExpression="Fingerprint, CreatedAt"
+    )
+
+
+def delete_llm_cache_entries(fingerprints):
+    with llm_cache_table.batch_writer() as batch:
+        for fingerprint in fingerprints:
+            batch.delete_item(Key={"Fingerprint": fingerprint})
+
+
+def get_pending_request_for_receiver(receiver_id):
+    """
+    PartnerRequests is keyed by ReceiverUserID, so the receiver side is a key
+    lookup followed by a status check.
+    """
+    item = _get_item(request_table, {"ReceiverUserID": receiver_id})
+    if item and item.get("Status") == "pending":
+        return item
+    return None
+
+
+def query_pending_requests_by_sender(sender_id):
+    """
+    Pending requests sent by a user, via the SenderUserID + Status index.
+    """
+    return _query_all(
+        request_table,
+        IndexName=PARTNER_REQUESTS_SENDER_INDEX,
+        KeyConditionExpression="SenderUserID = :sender AND #s = :pending",
+        ExpressionAttributeValues={
+            ":sender": sender_id,
+            ":pending": "pending"
+        },
+        ExpressionAttributeNames={"#s": "Status"}
+    )
+
+
+def query_user_notifications(user_id, extra_values=None, **kwargs):
+    """
+    Return every notification of a user, newest first, via the UserID partition.
+    """
+    values = {":user_id": user_id}
+    values.update(extra_values or {})
+    return _query_all(
+        notifications_table,
+        KeyConditionExpression="UserID = :user_id",
+        ExpressionAttributeValues=values,
+        ScanIndexForward=False,
+        **kwargs
+    )
 
 
 def create_user(user):
@@ -26,7 +555,7 @@ def create_user(user):
             "email": user["email"],
             "password": user["password"],
         }
-        user_table.put_item(Item=item)
+        user_table.put_item(Item={**item, "UnreadNotifications": 0})
         
         # Kullanıcı tercihleri için sadece UserID ile kayıt oluştur
         preferences_table.put_item(Item={
@@ -35,102 +564,51 @@ def create_user(user):
         
         return item
     except Exception as e:
-        print(f"Error in create_user: {e}")
+        logger.exception("Error in create_user")
         raise e
 
 
 def get_user(user_id):
     # Retrieve user information from the Users table
     try:
-        print(f"Attempting to get user with ID: {user_id}")
-        
-        # DynamoDB bağlantısını kontrol et
-        print(f"AWS Region: {os.getenv('AWS_DEFAULT_REGION')}")
-        print(f"AWS Access Key ID: {os.getenv('AWS_ACCESS_KEY_ID')}")
-        print(f"AWS Secret Key exists: {'Yes' if os.getenv('AWS_SECRET_ACCESS_KEY') else 'No'}")
+        logger.debug("Getting user", extra={"fields": {"user_id": user_id}})
         
-        # Tablo adını kontrol et
-        print(f"Table name: {user_table.name}")
+        # Kullanıcıyı primary key ile bul
+        user_data = get_user_record(user_id)
         
-        # Scan ile kullanıcıyı bul
-        scan_response = user_table.scan(
-            FilterExpression="UserID = :user_id",
-            ExpressionAttributeValues={":user_id": user_id}
-        )
-        print(f"Scan response: {scan_response}")
-        
-        if not scan_response.get("Items"):
-            print(f"User not found: {user_id}")
+        if not user_data:
+            logger.debug("User not found", extra={"fields": {"user_id": user_id}})
             return None
-            
-        user_data = scan_response["Items"][0]
-        print(f"Found user data: {user_data}")
 
-        # Get partner information from Partners table using scan
-        partners_response = partners_table.scan(
-            FilterExpression="UserID = :user_id",
-            ExpressionAttributeValues={":user_id": user_id}
-        )
-        
-        print(f"Partners table response: {partners_response}")
+        # Get partner information from Partners table by key
+        partner_data = get_partner_record(user_id)
         
-        if partners_response.get("Items"):
-            partner_data = partners_response["Items"][0]
+        if partner_data:
             user_data["partner_id"] = partner_data["PartnerID"]
-            print(f"Found partner data: {partner_data}")
 
-        print(f"Final user data: {user_data}")
+        logger.debug("Found user data", extra={"fields": {"user": user_data}})
         return user_data
-    except Exception as e:
-        print(f"Error in get_user: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error in get_user")
         return None
 
 
 def send_partner_request(sender_id, receiver_id):
     try:
-        partners_table = dynamodb.Table('Partners')
-
         # Check if the sender already has a partner
-        sender_partners = partners_table.scan(
-            FilterExpression="UserID = :sender",
-            ExpressionAttributeValues={":sender": sender_id}
-        )
-        if sender_partners["Count"] > 0:
+        if get_partner_record(sender_id):
             return {"error": "You already have a partner and cannot send more requests"}
 
         # Check if the receiver already has a partner
-        receiver_partners = partners_table.scan(
-            FilterExpression="UserID = :receiver",
-            ExpressionAttributeValues={":receiver": receiver_id}
-        )
-        if receiver_partners["Count"] > 0:
+        if get_partner_record(receiver_id):
             return {"error": "This user already has a partner and cannot receive requests"}
 
         # Check if the sender already has a pending request
-        existing_request = request_table.scan(
-            FilterExpression="SenderUserID = :sender AND #s = :pending",
-            ExpressionAttributeValues={
-                ":sender": sender_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
-        if existing_request["Count"] > 0:
+        if query_pending_requests_by_sender(sender_id):
             return {"error": "You can only send one partner request at a time"}
 
         # Check if the receiver already has a pending request
-        receiver_pending_requests = request_table.scan(
-            FilterExpression="ReceiverUserID = :receiver AND #s = :pending",
-            ExpressionAttributeValues={
-                ":receiver": receiver_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
-        if receiver_pending_requests["Count"] > 0:
+        if get_pending_request_for_receiver(receiver_id):
             return {"error": "This user already has pending requests"}
 
         # Add the partner request to the PartnerRequests table
@@ -151,41 +629,27 @@ def send_partner_request(sender_id, receiver_id):
 
         return {"message": "Partner request sent successfully"}
     except Exception as e:
-        print(f"Error in send_partner_request: {e}")
+        logger.exception("Error in send_partner_request")
         return {"error": str(e)}
 
 
 # Retrieve partner requests
 def get_partner_requests(user_id):
     try:
-        print(f"Getting partner requests for user: {user_id}")
+        logger.debug("Getting partner requests", extra={"fields": {"user_id": user_id}})
         
-        # Get incoming requests for the user using scan
-        received_requests = request_table.scan(
-            FilterExpression="ReceiverUserID = :user_id AND #s = :pending",
-            ExpressionAttributeValues={
-                ":user_id": user_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
+        # Get the incoming request for the user by key
+        received_request = get_pending_request_for_receiver(user_id)
+        received_requests = [received_request] if received_request else []
 
-        # Get outgoing requests from the user using scan
-        sent_requests = request_table.scan(
-            FilterExpression="SenderUserID = :user_id AND #s = :pending",
-            ExpressionAttributeValues={
-                ":user_id": user_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
+        # Get outgoing requests from the user via the sender index
+        sent_requests = query_pending_requests_by_sender(user_id)
 
-        print(f"Received requests scan response: {received_requests}")
-        print(f"Sent requests scan response: {sent_requests}")
+        logger.debug("Partner requests", extra={"fields": {"received": received_requests, "sent": sent_requests}})
 
         # Map field names for received requests
         mapped_received = []
-        for item in received_requests.get("Items", []):
+        for item in received_requests:
             mapped_received.append({
                 "SenderUserID": item.get("SenderUserID"),
                 "Timestamp": item.get("CreatedAt"),
@@ -194,42 +658,28 @@ def get_partner_requests(user_id):
 
         # Map field names for sent requests
         mapped_sent = []
-        for item in sent_requests.get("Items", []):
+        for item in sent_requests:
             mapped_sent.append({
                 "ReceiverUserID": item.get("ReceiverUserID"),
                 "Timestamp": item.get("CreatedAt"),
                 "Status": item.get("Status")
             })
 
-        print(f"Mapped received requests: {mapped_received}")
-        print(f"Mapped sent requests: {mapped_sent}")
-
         return {
             "received_requests": mapped_received,
             "sent_requests": mapped_sent
         }
-    except Exception as e:
-        print(f"Error in get_partner_requests: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+    except Exception:
+        logger.exception("Error in get_partner_requests")
         return {"received_requests": [], "sent_requests": []}
 
 
 def accept_partner_request(sender_id, receiver_id):
     try:
-        # Check if the partner request exists using scan with filter
-        response = request_table.scan(
-            FilterExpression="ReceiverUserID = :receiver AND SenderUserID = :sender AND #s = :pending",
-            ExpressionAttributeValues={
-                ":receiver": receiver_id,
-                ":sender": sender_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
+        # Check if the partner request exists
+        pending_request = get_pending_request_for_receiver(receiver_id)
         
-        if not response["Items"]:
+        if not pending_request or pending_request.get("SenderUserID") != sender_id:
             return {"error": "Partner isteği bulunamadı"}
 
         # Update the partner request status to 'accepted'
@@ -254,7 +704,7 @@ def accept_partner_request(sender_id, receiver_id):
 
         return {"message": "Partner isteği kabul edildi ve ilişki başarıyla oluşturuldu"}
     except Exception as e:
-        print(f"Error in accept_partner_request: {e}")
+        logger.exception("Error in accept_partner_request")
         return {"error": str(e)}
 
 
@@ -279,24 +729,16 @@ def create_partner_relationship(user_id, partner_id):
 
         return {"message": "Partner ilişkisi başarıyla oluşturuldu"}
     except Exception as e:
-        print(f"Error in create_partner_relationship: {e}")
+        logger.exception("Error in create_partner_relationship")
         return {"error": str(e)}
 
 
 def reject_partner_request(sender_id, receiver_id):
     try:
-        # Check if the partner request exists using scan with filter
-        response = request_table.scan(
-            FilterExpression="ReceiverUserID = :receiver AND SenderUserID = :sender AND #s = :pending",
-            ExpressionAttributeValues={
-                ":receiver": receiver_id,
-                ":sender": sender_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
+        # Check if the partner request exists
+        pending_request = get_pending_request_for_receiver(receiver_id)
         
-        if not response["Items"]:
+        if not pending_request or pending_request.get("SenderUserID") != sender_id:
             return {"error": "Partner isteği bulunamadı"}
 
         # Update the request status to 'rejected'
@@ -318,23 +760,19 @@ def reject_partner_request(sender_id, receiver_id):
 
         return {"message": "Partner isteği başarıyla reddedildi"}
     except Exception as e:
-        print(f"Error in reject_partner_request: {e}")
+        logger.exception("Error in reject_partner_request")
         return {"error": str(e)}
 
 
 def get_user_preferences(user_id):
     try:
-        # Get user preferences using scan
-        response = preferences_table.scan(
-            FilterExpression="UserID = :user_id",
-            ExpressionAttributeValues={":user_id": user_id}
-        )
+        # Get user preferences by primary key
+        item = get_preferences_record(user_id)
         
-        if not response["Items"]:
+        if not item:
             return {"error": "Preferences not found for the given UserID"}
         
         # Convert set items to strings
-        item = response["Items"][0]  # Get the first (and should be only) item
         if "Genre" in item:
             item["Genre"] = [str(genre) for genre in item["Genre"]]
         if "Movies" in item:
@@ -342,7 +780,7 @@ def get_user_preferences(user_id):
             
         return item
     except Exception as e:
-        print(f"Error in get_user_preferences: {e}")
+        logger.exception("Error in get_user_preferences")
         return {"error": str(e)}
     
 def update_user_preferences(user_id, genre=None, movies=None):
@@ -351,9 +789,10 @@ def update_user_preferences(user_id, genre=None, movies=None):
         expression_attribute_values = {}
 
         # Update genre if provided
-        if genre:
+        genre_set = set(canonical_genres(genre))
+        if genre_set:
             update_expression.append("Genre = :genre")
-            expression_attribute_values[":genre"] = set(genre)  # Convert to set for DynamoDB SS type
+            expression_attribute_values[":genre"] = genre_set  # Convert to set for DynamoDB SS type
 
         # Update movies if provided
         if movies:
@@ -375,23 +814,21 @@ def update_user_preferences(user_id, genre=None, movies=None):
 
         return {"message": "Preferences updated successfully"}
     except Exception as e:
-        print(f"Error in update_user_preferences: {e}")
+        logger.exception("Error in update_user_preferences")
         return {"error": str(e)}
 
 def add_to_user_preferences(user_id, genre=None, movies=None):
     try:
         # Önce mevcut tercihleri kontrol et
-        response = preferences_table.get_item(
-            Key={"UserID": user_id}
-        )
-        current_preferences = response.get("Item", {})
+        current_preferences = get_preferences_record(user_id) or {}
         
         update_expression_parts = []
         expression_attribute_values = {}
 
         # Genre için kontrol ve güncelleme
-        if genre and len(genre) > 0:
-            genre_set = set(str(g) for g in genre)
+        # Kanonik isimle kaydet: "sci-fi " ve "Science Fiction" aynı tür
+        genre_set = set(canonical_genres(genre))
+        if genre_set:
             if "Genre" not in current_preferences:
                 # İlk kez ekleniyor, SET kullan
                 update_expression_parts.append("SET Genre = :genre")
@@ -426,7 +863,7 @@ def add_to_user_preferences(user_id, genre=None, movies=None):
 
         return {"message": "Preferences updated successfully"}
     except Exception as e:
-        print(f"Error in add_to_user_preferences: {e}")
+        logger.exception("Error in add_to_user_preferences")
         return {"error": str(e)}
 
 def delete_from_user_preferences(user_id, genre=None, movies=None):
@@ -437,7 +874,8 @@ def delete_from_user_preferences(user_id, genre=None, movies=None):
         # Remove specified genres from the Genre set
         if genre:
             update_expression.append("DELETE Genre :genre")
-            expression_attribute_values[":genre"] = set(genre)  # Convert to set for DynamoDB SS type
+            # Kanonikleştirmeden önce kaydedilmiş ham isimler de silinsin
+            expression_attribute_values[":genre"] = set(genre) | set(canonical_genres(genre))  # Convert to set for DynamoDB SS type
 
         # Remove specified movies from the Movies set
         if movies:
@@ -459,7 +897,38 @@ def delete_from_user_preferences(user_id, genre=None, movies=None):
 
         return {"message": "Preferences updated successfully (deleted items)"}
     except Exception as e:
-        print(f"Error in delete_from_user_preferences: {e}")
+        logger.exception("Error in delete_from_user_preferences")
+        return {"error": str(e)}
+
+
+def save_recommendations(user_id: str, partner_id: str, titles: list):
+    """
+    Yeni önerileri iki kullanıcının Partners satırında listenin başına ekler
+    ve çiftin öneri geçmişine yazar.
+    """
+    try:
+        for member_id in [user_id, partner_id]:
+            partner_data = get_partner_record(member_id)
+            
+            if partner_data:
+                existing_movies = partner_data.get("Movies", [])  # Mevcut filmleri al
+                if isinstance(existing_movies, set):  # Eğer set ise listeye çevir
+                    existing_movies = list(existing_movies)
+                
+                # Yeni önerileri başa ekle
+                all_movies = list(titles) + existing_movies
+                
+                # Update the movies in the table as a list
+                partners_table.update_item(
+                    Key={"UserID": member_id},
+                    UpdateExpression="SET Movies = :movies",
+                    ExpressionAttributeValues={":movies": all_movies}
+                )
+
+        add_to_recommendation_history(user_id, partner_id, titles)
+        return {"message": "Öneriler kaydedildi"}
+    except Exception as e:
+        logger.exception("Error in save_recommendations")
         return {"error": str(e)}
 
 
@@ -483,8 +952,8 @@ def get_combined_preferences(user_id: str, partner_id: str) -> dict:
             "genres": combined_genres,
             "movies": combined_movies
         }
-    except Exception as e:
-        print(f"Error in get_combined_preferences: {e}")
+    except Exception:
+        logger.exception("Error in get_combined_preferences")
         return {}
 
 
@@ -494,7 +963,7 @@ def add_notification(user_id: str, message: str, notification_type: str):
     """
     try:
         timestamp = datetime.utcnow().isoformat()
-        print(f"Adding notification for user {user_id} at {timestamp}")
+        logger.debug("Adding notification", extra={"fields": {"user_id": user_id, "timestamp": timestamp}})
         
         item = {
             "UserID": user_id,
@@ -503,193 +972,271 @@ def add_notification(user_id: str, message: str, notification_type: str):
             "Type": notification_type,
             "IsRead": False
         }
-        print(f"Notification item to be added: {item}")
+        logger.debug("Notification item", extra={"fields": {"item": item}})
         
         notifications_table.put_item(Item=item)
+        _adjust_unread_counter(user_id, 1)
         return {"message": "Bildirim başarıyla eklendi"}
     except Exception as e:
-        print(f"Error in add_notification: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in add_notification")
         return {"error": str(e)}
 
-def get_notifications(user_id: str):
+def encode_cursor(last_evaluated_key):
+    """
+    Turn a LastEvaluatedKey into an opaque, URL-safe cursor string.
+    """
+    if not last_evaluated_key:
+        return None
+    raw = json.dumps(last_evaluated_key, sort_keys=True).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii")
+
+
+def decode_cursor(cursor):
     """
-    Kullanıcının bildirimlerini getirir.
+    Inverse of encode_cursor. Raises ValueError for malformed cursors.
     """
+    if not cursor:
+        return None
     try:
-        print(f"Getting notifications for user: {user_id}")
-        
-        response = notifications_table.scan(
-            FilterExpression="UserID = :user_id",
-            ExpressionAttributeValues={":user_id": user_id}
-        )
-        print(f"Scan response: {response}")
-        
-        # En yeni bildirimleri önce göstermek için sıralama
-        notifications = sorted(
-            response.get("Items", []),
-            key=lambda x: x.get("Timestamp", ""),
-            reverse=True
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+    if not isinstance(key, dict) or set(key) != {"UserID", "Timestamp"}:
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def get_notifications_page(user_id: str, limit: int = NOTIFICATIONS_PAGE_SIZE, cursor: str = None):
+    """
+    Kullanıcının bildirimlerini en yeniden eskiye sayfa sayfa getirir.
+    """
+    try:
+        query_kwargs = {
+            "KeyConditionExpression": "UserID = :user_id",
+            "ExpressionAttributeValues": {":user_id": user_id},
+            "ScanIndexForward": False,
+            "Limit": limit,
+        }
+        start_key = decode_cursor(cursor)
+        if start_key:
+            # Başka bir kullanıcının sayfasına geçilmesini engelle
+            if start_key["UserID"] != user_id:
+                return {"error": "Geçersiz sayfa bilgisi"}
+            query_kwargs["ExclusiveStartKey"] = start_key
+
+        response = notifications_table.query(**query_kwargs)
+
+        return {
+            "items": response.get("Items", []),
+            "next_cursor": encode_cursor(response.get("LastEvaluatedKey"))
+        }
+    except ValueError:
+        return {"error": "Geçersiz sayfa bilgisi"}
+    except Exception as e:
+        logger.exception("Error in get_notifications_page")
+        return {"error": str(e)}
+
+def _adjust_unread_counter(user_id: str, delta: int):
+    """
+    Users.UnreadNotifications sayacını atomik olarak artırır/azaltır.
+    Var olmayan kullanıcılar için satır oluşturulmaz ve sayaç sıfırın altına düşmez.
+    Sayacı olmayan (eski) kullanıcılarda ADD yanlış bir başlangıç değeri
+    yazacağından sayaç tablodan yeniden hesaplanır.
+    """
+    update_kwargs = {
+        "Key": {"UserID": user_id},
+        "UpdateExpression": "ADD UnreadNotifications :delta",
+        "ExpressionAttributeValues": {":delta": delta},
+        "ConditionExpression": "attribute_exists(UserID) AND attribute_exists(UnreadNotifications)",
+    }
+    if delta < 0:
+        update_kwargs["ConditionExpression"] += " AND UnreadNotifications >= :needed"
+        update_kwargs["ExpressionAttributeValues"][":needed"] = -delta
+    try:
+        user_table.update_item(**update_kwargs)
+        return True
+    except Exception as e:
+        if not _is_conditional_check_failure(e):
+            raise
+        # Sayaç yok ya da kaymış: gerçek değeri yaz (kullanıcı yoksa reconcile de yazmaz)
+        reconcile_unread_notification_count(user_id)
+        return False
+
+
+def _mark_read(user_id: str, timestamp: str) -> bool:
+    """
+    Okunmamış bir bildirimi okundu yapar. Bu çağrı durumu değiştirdiyse True döner.
+    """
+    try:
+        notifications_table.update_item(
+            Key={"UserID": user_id, "Timestamp": timestamp},
+            UpdateExpression="SET IsRead = :read",
+            ConditionExpression="attribute_exists(UserID) AND IsRead = :unread",
+            ExpressionAttributeValues={":read": True, ":unread": False}
         )
-        
-        print(f"Sorted notifications: {notifications}")
-        return notifications
+        return True
     except Exception as e:
-        print(f"Error in get_notifications: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
-        return []
+        if _is_conditional_check_failure(e):
+            return False
+        raise
+
 
 def mark_notification_as_read(user_id: str, timestamp: str):
     """
     Bildirimi okundu olarak işaretler.
     """
     try:
-        print(f"Marking notification as read for user {user_id} at timestamp {timestamp}")
+        logger.debug("Marking notification as read", extra={"fields": {"user_id": user_id, "timestamp": timestamp}})
         
-        # Önce bildirimi bul
-        response = notifications_table.scan(
-            FilterExpression="UserID = :user_id AND #ts = :timestamp",
-            ExpressionAttributeValues={
-                ":user_id": user_id,
-                ":timestamp": timestamp
-            },
-            ExpressionAttributeNames={
-                "#ts": "Timestamp"
-            }
-        )
-        
-        if not response.get("Items"):
-            return {"error": "Bildirim bulunamadı"}
-            
-        # Bildirimi güncelle
-        notification = response["Items"][0]
-        notifications_table.put_item(
-            Item={
-                "UserID": user_id,
-                "Timestamp": timestamp,
-                "Message": notification["Message"],
-                "Type": notification["Type"],
-                "IsRead": True
-            }
-        )
-        print("Notification marked as read successfully")
+        if not _mark_read(user_id, timestamp):
+            # Bildirim yok mu, yoksa zaten okunmuş mu?
+            if not get_notification_record(user_id, timestamp):
+                return {"error": "Bildirim bulunamadı"}
+            return {"message": "Bildirim okundu olarak işaretlendi"}
+
+        _adjust_unread_counter(user_id, -1)
+        logger.debug("Notification marked as read")
         return {"message": "Bildirim okundu olarak işaretlendi"}
     except Exception as e:
-        print(f"Error in mark_notification_as_read: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in mark_notification_as_read")
         return {"error": str(e)}
 
+def mark_all_notifications_as_read(user_id: str):
+    """
+    Kullanıcının tüm okunmamış bildirimlerini okundu olarak işaretler.
+    """
+    try:
+        unread = query_user_notifications(
+            user_id,
+            FilterExpression="IsRead = :unread",
+            ProjectionExpression="#ts",
+            ExpressionAttributeNames={"#ts": "Timestamp"},
+            extra_values={":unread": False}
+        )
+
+        marked = 0
+        for notification in unread:
+            if _mark_read(user_id, notification["Timestamp"]):
+                marked += 1
+
+        if marked:
+            _adjust_unread_counter(user_id, -marked)
+        return {"message": f"{marked} bildirim okundu olarak işaretlendi"}
+    except Exception as e:
+        logger.exception("Error in mark_all_notifications_as_read")
+        return {"error": str(e)}
+
+def count_unread_notifications_in_table(user_id: str) -> int:
+    """
+    Okunmamış bildirimleri Notifications tablosundan sayar (sayaç düzeltme için).
+    """
+    query_kwargs = {
+        "KeyConditionExpression": "UserID = :user_id",
+        "FilterExpression": "IsRead = :unread",
+        "ExpressionAttributeValues": {":user_id": user_id, ":unread": False},
+        "Select": "COUNT",
+    }
+    count = 0
+    while True:
+        response = notifications_table.query(**query_kwargs)
+        count += response.get("Count", 0)
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return count
+        query_kwargs["ExclusiveStartKey"] = last_key
+
+def reconcile_unread_notification_count(user_id: str) -> int:
+    """
+    Okunmamış bildirim sayacını tablodaki gerçek değere eşitler.
+    """
+    count = count_unread_notifications_in_table(user_id)
+    try:
+        user_table.update_item(
+            Key={"UserID": user_id},
+            UpdateExpression="SET UnreadNotifications = :count",
+            ConditionExpression="attribute_exists(UserID)",
+            ExpressionAttributeValues={":count": count}
+        )
+    except Exception as e:
+        if not _is_conditional_check_failure(e):
+            raise
+    return count
+
 def get_unread_notification_count(user_id: str) -> int:
     """
     Kullanıcının okunmamış bildirim sayısını döndürür.
     """
     try:
-        response = notifications_table.scan(
-            FilterExpression="UserID = :user_id AND IsRead = :is_read",
-            ExpressionAttributeValues={
-                ":user_id": user_id,
-                ":is_read": False
-            }
+        user = _get_item(
+            user_table,
+            {"UserID": user_id},
+            ProjectionExpression="UnreadNotifications"
         )
-        return len(response.get("Items", []))
-    except Exception as e:
-        print(f"Error in get_unread_notification_count: {str(e)}")
+        counter = (user or {}).get("UnreadNotifications")
+        if counter is None or counter < 0:
+            # Sayaç henüz yok (eski kullanıcı) veya kaymış
+            return reconcile_unread_notification_count(user_id)
+        return int(counter)
+    except Exception:
+        logger.exception("Error in get_unread_notification_count")
         return 0
 
 def delete_partner(user_id):
     try:
-        print(f"Attempting to delete partner relationship for user: {user_id}")
+        logger.info("Deleting partner relationship", extra={"fields": {"user_id": user_id}})
         
-        # Get partner information using scan
-        response = partners_table.scan(
-            FilterExpression="UserID = :user_id",
-            ExpressionAttributeValues={
-                ":user_id": user_id
-            }
-        )
+        # Get partner information by primary key
+        user_partner = get_partner_record(user_id)
         
-        print(f"Partners table scan response: {response}")
+        logger.debug("Partners table item", extra={"fields": {"item": user_partner}})
         
-        if not response["Items"]:
+        if not user_partner:
             return {"error": "Partner ilişkisi bulunamadı"}
 
-        user_partner = response["Items"][0]
         partner_id = user_partner["PartnerID"]
-        print(f"Found partner_id: {partner_id}")
+        logger.debug("Found partner_id", extra={"fields": {"partner_id": partner_id}})
 
         try:
             # Delete from Partners table for both users
-            print(f"Deleting from Partners table for user: {user_id}")
+            logger.debug("Deleting from Partners table", extra={"fields": {"user_id": user_id}})
             partners_table.delete_item(
                 Key={
                     "UserID": user_id
                 }
             )
             
-            print(f"Deleting from Partners table for partner: {partner_id}")
+            logger.debug("Deleting from Partners table", extra={"fields": {"user_id": partner_id}})
             partners_table.delete_item(
                 Key={
                     "UserID": partner_id
                 }
             )
         except Exception as e:
-            print(f"Error deleting from Partners table: {e}")
+            logger.exception("Error deleting from Partners table")
             raise e
 
         try:
             # Delete from PartnerRequests table
-            print("Deleting from PartnerRequests table")
+            logger.debug("Deleting from PartnerRequests table")
             
-            # İlgili tüm partner isteklerini bul
-            requests_as_receiver = request_table.scan(
-                FilterExpression="ReceiverUserID = :user_id",
-                ExpressionAttributeValues={
-                    ":user_id": user_id
-                }
-            )
-            
-            requests_as_receiver_partner = request_table.scan(
-                FilterExpression="ReceiverUserID = :partner_id",
-                ExpressionAttributeValues={
-                    ":partner_id": partner_id
-                }
-            )
-            
-            print(f"Found requests where user is receiver: {requests_as_receiver}")
-            print(f"Found requests where partner is receiver: {requests_as_receiver_partner}")
-            
-            # Kullanıcının alıcı olduğu istekleri sil
-            for request in requests_as_receiver.get("Items", []):
-                print(f"Deleting request where user is receiver: {request}")
+            # PartnerRequests ReceiverUserID ile anahtarlı; iki kullanıcının
+            # alıcı olduğu istekleri doğrudan anahtar ile sil
+            for receiver in (user_id, partner_id):
+                logger.debug("Deleting partner request", extra={"fields": {"receiver": receiver}})
                 request_table.delete_item(
                     Key={
-                        "ReceiverUserID": user_id
-                    }
-                )
-            
-            # Partnerin alıcı olduğu istekleri sil
-            for request in requests_as_receiver_partner.get("Items", []):
-                print(f"Deleting request where partner is receiver: {request}")
-                request_table.delete_item(
-                    Key={
-                        "ReceiverUserID": partner_id
+                        "ReceiverUserID": receiver
                     }
                 )
             
         except Exception as e:
-            print(f"Error deleting from PartnerRequests table: {e}")
+            logger.exception("Error deleting from PartnerRequests table")
             raise e
 
         # Send notifications to both users
         add_notification(
             user_id,
-            f"Partner ilişkiniz sonlandırıldı.",
+            "Partner ilişkiniz sonlandırıldı.",
             "partner_deleted"
         )
         add_notification(
@@ -700,26 +1247,15 @@ def delete_partner(user_id):
 
         return {"message": "Partner ilişkisi başarıyla sonlandırıldı"}
     except Exception as e:
-        print(f"Error in delete_partner: {str(e)}")
-        print(f"Error type: {type(e)}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        logger.exception("Error in delete_partner")
         return {"error": str(e)}
 
 def withdraw_partner_request(sender_id, receiver_id):
     try:
         # İsteğin var olup olmadığını kontrol et
-        response = request_table.scan(
-            FilterExpression="ReceiverUserID = :receiver AND SenderUserID = :sender AND #s = :pending",
-            ExpressionAttributeValues={
-                ":receiver": receiver_id,
-                ":sender": sender_id,
-                ":pending": "pending"
-            },
-            ExpressionAttributeNames={"#s": "Status"}
-        )
+        pending_request = get_pending_request_for_receiver(receiver_id)
         
-        if not response["Items"]:
+        if not pending_request or pending_request.get("SenderUserID") != sender_id:
             return {"error": "Geri çekilecek partner isteği bulunamadı"}
 
         # İsteği sil
@@ -736,6 +1272,6 @@ def withdraw_partner_request(sender_id, receiver_id):
 
         return {"message": "Partner isteği başarıyla geri çekildi"}
     except Exception as e:
-        print(f"Error in withdraw_partner_request: {e}")
+        logger.exception("Error in withdraw_partner_request")
         return {"error": str(e)}
 
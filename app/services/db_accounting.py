@@ -0,0 +1,243 @@
+"""
+Per-request DynamoDB call accounting.
+
+A middleware opens a RequestDbUsage for every HTTP request and keeps it in
+a context variable; run_in_db_pool copies the caller's context into the
+worker thread, so botocore event hooks registered on the shared session
+(see dynamo.py) can attribute each call to the request that issued it.
+
+Per request this records calls by operation and table, ConsumedCapacity
+totals (ReturnConsumedCapacity=TOTAL is added to every operation that
+accepts it) and cumulative time spent in DynamoDB calls. The totals are
+returned in the X-DynamoDB-Calls and Server-Timing response headers,
+exported as metrics and, above DYNAMODB_CALL_BUDGET calls, flagged with
+X-DynamoDB-Budget-Exceeded.
+
+Calls made while a streaming response body is being sent, or by background
+tasks, are counted in the metrics under route "background".
+"""
+import os
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from app.services.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+DYNAMODB_TRACE_CAPACITY = os.getenv("DYNAMODB_TRACE_CAPACITY", "true").lower() == "true"
+DYNAMODB_CALL_BUDGET = int(os.getenv("DYNAMODB_CALL_BUDGET", "8"))
+# "/preferences=6,/notifications=3" gibi route bazlı bütçeler
+DYNAMODB_CALL_BUDGETS = {
+    route.strip(): int(budget)
+    for route, _, budget in (
+        entry.partition("=") for entry in os.getenv("DYNAMODB_CALL_BUDGETS", "").split(",") if "=" in entry
+    )
+}
+OVER_BUDGET_HISTORY = 50
+
+_READ_OPERATIONS = {"GetItem", "BatchGetItem", "Query", "Scan", "TransactGetItems"}
+
+DYNAMODB_CALLS = Counter(
+    "dynamodb_calls_total", "DynamoDB API calls by route, operation and table.", ("route", "operation", "table")
+)
+DYNAMODB_CAPACITY = Counter(
+    "dynamodb_consumed_capacity_units_total", "Consumed capacity units by route, table and kind (read/write).",
+    ("route", "table", "kind")
+)
+DYNAMODB_ERRORS = Counter("dynamodb_call_errors_total", "DynamoDB calls that raised, by operation.", ("route", "operation"))
+DYNAMODB_REQUEST_CALLS = Histogram(
+    "dynamodb_calls_per_request", "DynamoDB calls issued while handling one request.", ("route",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+)
+DYNAMODB_REQUEST_SECONDS = Histogram(
+    "dynamodb_seconds_per_request", "Cumulative DynamoDB call time for one request.", ("route",),
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+)
+DYNAMODB_OVER_BUDGET = Counter(
+    "dynamodb_requests_over_budget_total", "Requests that exceeded their DynamoDB call budget.", ("route",)
+)
+
+_current = contextvars.ContextVar("dynamodb_request_usage", default=None)
+_lock = threading.Lock()
+_over_budget = deque(maxlen=OVER_BUDGET_HISTORY)
+
+
+def call_budget(route: str) -> int:
+    return DYNAMODB_CALL_BUDGETS.get(route, DYNAMODB_CALL_BUDGET)
+
+
+class RequestDbUsage:
+    def __init__(self, route: str = ""):
+        self.route = route
+        self.calls = {}  # (operation, table) -> count
+        self.capacity = {}  # (table, "read"/"write") -> consumed capacity units
+        self.seconds = 0.0
+        self.errors = {}  # operation -> failed calls
+        self.closed = False
+        self._lock = threading.Lock()
+
+    @property
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def record(self, operation: str, tables: list, seconds: float, consumed: dict, failed: bool):
+        with self._lock:
+            for table in tables or [""]:
+                self.calls[(operation, table)] = self.calls.get((operation, table), 0) + 1
+            for key, units in consumed.items():
+                self.capacity[key] = self.capacity.get(key, 0.0) + units
+            self.seconds += seconds
+            if failed:
+                self.errors[operation] = self.errors.get(operation, 0) + 1
+
+    def header(self) -> str:
+        """
+        'calls=4; rcu=2.5; wcu=0; ms=38.2; Scan:Users=1, GetItem:Partners=3'
+        """
+        with self._lock:
+            read = sum(units for (_, kind), units in self.capacity.items() if kind == "read")
+            write = sum(units for (_, kind), units in self.capacity.items() if kind == "write")
+            breakdown = ", ".join(
+                f"{operation}:{table}={count}" for (operation, table), count in sorted(self.calls.items())
+            )
+            summary = f"calls={sum(self.calls.values())}; rcu={read:g}; wcu={write:g}; ms={self.seconds * 1000:.1f}"
+        return f"{summary}; {breakdown}" if breakdown else summary
+
+    def export(self, route: str):
+        """
+        Add this usage to the per-route metrics.
+        """
+        with self._lock:
+            for (operation, table), count in self.calls.items():
+                DYNAMODB_CALLS.inc(count, route=route, operation=operation, table=table)
+            for (table, kind), units in self.capacity.items():
+                DYNAMODB_CAPACITY.inc(units, route=route, table=table, kind=kind)
+            for operation, count in self.errors.items():
+                DYNAMODB_ERRORS.inc(count, route=route, operation=operation)
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {
+                "route": self.route,
+                "calls": sum(self.calls.values()),
+                "by_operation": {f"{operation}:{table}": count for (operation, table), count in self.calls.items()},
+                "capacity_units": round(sum(self.capacity.values()), 2),
+                "db_ms": round(self.seconds * 1000, 1),
+                "errors": sum(self.errors.values()),
+            }
+
+
+def start_request(route: str = "") -> RequestDbUsage:
+    """
+    Open accounting for the current request (context).
+    """
+    usage = RequestDbUsage(route)
+    _current.set(usage)
+    return usage
+
+
+def current_usage():
+    usage = _current.get()
+    return usage if usage is not None and not usage.closed else None
+
+
+def finish_request(usage: RequestDbUsage, route: str) -> bool:
+    """
+    Close the request's accounting, export it and return True when it went
+    over its call budget.
+    """
+    usage.closed = True
+    usage.route = route
+    usage.export(route)
+    calls = usage.total_calls
+    DYNAMODB_REQUEST_CALLS.observe(calls, route=route)
+    DYNAMODB_REQUEST_SECONDS.observe(usage.seconds, route=route)
+    budget = call_budget(route)
+    if calls <= budget:
+        return False
+    DYNAMODB_OVER_BUDGET.inc(route=route)
+    summary = usage.summary()
+    summary["budget"] = budget
+    summary["at"] = int(time.time())
+    with _lock:
+        _over_budget.append(summary)
+    logger.warning("DynamoDB call budget exceeded on %s: %d calls (budget %d)", route, calls, budget, extra={"fields": summary})
+    return True
+
+
+def _tables(params: dict) -> list:
+    if "TableName" in params:
+        return [params["TableName"]]
+    if "RequestItems" in params:
+        return sorted(params["RequestItems"])
+    if "TransactItems" in params:
+        return sorted({
+            action.get("TableName", "")
+            for item in params["TransactItems"] for action in item.values() if isinstance(action, dict)
+        })
+    return []
+
+
+def _consumed(operation_name: str, parsed: dict) -> dict:
+    kind = "read" if operation_name in _READ_OPERATIONS else "write"
+    consumed = (parsed or {}).get("ConsumedCapacity") or []
+    if isinstance(consumed, dict):
+        consumed = [consumed]
+    totals = {}
+    for entry in consumed:
+        key = (entry.get("TableName", ""), kind)
+        totals[key] = totals.get(key, 0.0) + float(entry.get("CapacityUnits", 0) or 0)
+    return totals
+
+
+# botocore event hooks; registered on the shared session in dynamo.py
+
+def on_provide_client_params(params, model, context, **kwargs):
+    if DYNAMODB_TRACE_CAPACITY and "ReturnConsumedCapacity" in model.input_shape.members:
+        params.setdefault("ReturnConsumedCapacity", "TOTAL")
+    context["db_accounting"] = {
+        "operation": model.name,
+        "tables": _tables(params),
+        "started": time.perf_counter()
+    }
+
+
+def _record(context, parsed, failed):
+    call = context.get("db_accounting") if context else None
+    if call is None:
+        return
+    operation = call["operation"]
+    seconds = time.perf_counter() - call["started"]
+    consumed = _consumed(operation, parsed)
+    usage = current_usage()
+    if usage is not None:
+        # Route şablonu istek bitince belli olur; metrikler finish_request'te
+        usage.record(operation, call["tables"], seconds, consumed, failed)
+        return
+    background = RequestDbUsage("background")
+    background.record(operation, call["tables"], seconds, consumed, failed)
+    background.export("background")
+
+
+def on_after_call(context, http_response=None, parsed=None, **kwargs):
+    # Hata cevapları (ConditionalCheckFailed vb.) da after-call'dan geçer
+    failed = http_response is not None and http_response.status_code >= 300
+    _record(context, parsed, failed)
+
+
+def on_after_call_error(context, **kwargs):
+    # Bağlantı/zaman aşımı hataları; cevap yok
+    _record(context, None, failed=True)
+
+
+def get_accounting_stats() -> dict:
+    with _lock:
+        recent = list(_over_budget)
+    return {
+        "capacity_tracing": DYNAMODB_TRACE_CAPACITY,
+        "default_budget": DYNAMODB_CALL_BUDGET,
+        "route_budgets": DYNAMODB_CALL_BUDGETS,
+        "recent_over_budget": recent,
+    }
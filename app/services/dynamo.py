@@ -0,0 +1,94 @@
+"""
+Process-wide DynamoDB session and resource.
+
+Every module should get its DynamoDB handle from here instead of calling
+boto3.resource() itself, so the whole process shares one tuned connection
+pool.
+"""
+import os
+import threading
+import boto3
+from botocore.config import Config
+from app.services import db_accounting
+
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", "50"))
+DYNAMODB_CONNECT_TIMEOUT = float(os.getenv("DYNAMODB_CONNECT_TIMEOUT", "2"))
+DYNAMODB_READ_TIMEOUT = float(os.getenv("DYNAMODB_READ_TIMEOUT", "5"))
+DYNAMODB_MAX_ATTEMPTS = int(os.getenv("DYNAMODB_MAX_ATTEMPTS", "5"))
+
+_lock = threading.Lock()
+_session = None
+_resource = None
+
+_pool_stats = {
+    "in_flight": 0,
+    "peak_in_flight": 0,
+    "requests": 0,
+    # Sends issued while every pooled connection was busy; urllib3 opens an
+    # extra connection for these and discards it afterwards.
+    "saturated_requests": 0,
+}
+
+
+def _on_before_send(**kwargs):
+    with _lock:
+        _pool_stats["requests"] += 1
+        _pool_stats["in_flight"] += 1
+        if _pool_stats["in_flight"] > DYNAMODB_MAX_POOL_CONNECTIONS:
+            _pool_stats["saturated_requests"] += 1
+        _pool_stats["peak_in_flight"] = max(_pool_stats["peak_in_flight"], _pool_stats["in_flight"])
+
+
+def _on_response_received(**kwargs):
+    with _lock:
+        _pool_stats["in_flight"] = max(_pool_stats["in_flight"] - 1, 0)
+
+
+def _build_config():
+    return Config(
+        max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS,
+        connect_timeout=DYNAMODB_CONNECT_TIMEOUT,
+        read_timeout=DYNAMODB_READ_TIMEOUT,
+        retries={"mode": "adaptive", "total_max_attempts": DYNAMODB_MAX_ATTEMPTS},
+        tcp_keepalive=True,
+    )
+
+
+def get_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = boto3.session.Session(
+                region_name=os.getenv("AWS_DEFAULT_REGION"),
+                aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
+                aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+            )
+            events = _session.events
+            events.register("before-send.dynamodb", _on_before_send)
+            events.register("response-received.dynamodb", _on_response_received)
+            # İstek bazlı çağrı/kapasite muhasebesi
+            events.register("provide-client-params.dynamodb", db_accounting.on_provide_client_params)
+            events.register("after-call.dynamodb", db_accounting.on_after_call)
+            events.register("after-call-error.dynamodb", db_accounting.on_after_call_error)
+        return _session
+
+
+def get_dynamodb_resource():
+    """
+    Shared DynamoDB resource. The low-level client is available as
+    get_dynamodb_resource().meta.client.
+    """
+    global _resource
+    session = get_session()
+    with _lock:
+        if _resource is None:
+            _resource = session.resource("dynamodb", config=_build_config())
+        return _resource
+
+
+def get_pool_stats():
+    with _lock:
+        stats = dict(_pool_stats)
+    stats["max_pool_connections"] = DYNAMODB_MAX_POOL_CONNECTIONS
+    stats["utilization"] = round(stats["in_flight"] / DYNAMODB_MAX_POOL_CONNECTIONS, 3)
+    return stats
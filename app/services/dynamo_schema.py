@@ -0,0 +1,263 @@
+"""
+DynamoDB schema management: tables and secondary indexes used by crud.py,
+backfills and maintenance of denormalized counters.
+
+Run once per environment:
+
+    python -m app.services.dynamo_schema
+"""
+import time
+import logging
+from app.services.structured_logging import setup_logging
+from app.services.crud import dynamodb, request_table, user_table, partners_table, history_table, leases_table, jobs_table, buffer_table, llm_cache_table, movies_table, PARTNER_REQUESTS_SENDER_INDEX, MOVIES_TITLE_INDEX, reconcile_unread_notification_count, add_to_recommendation_history, title_attributes
+
+logger = logging.getLogger(__name__)
+
+
+def _scan_all(table, **scan_kwargs):
+    while True:
+        response = table.scan(**scan_kwargs)
+        for item in response.get("Items", []):
+            yield item
+        last_key = response.get("LastEvaluatedKey")
+        if not last_key:
+            return
+        scan_kwargs["ExclusiveStartKey"] = last_key
+
+
+def ensure_table(table_name, key_schema, attribute_definitions):
+    """
+    Create an on-demand table if it does not exist yet and wait until it is usable.
+    """
+    client = dynamodb.meta.client
+    existing = client.list_tables()
+    names = set(existing["TableNames"])
+    while existing.get("LastEvaluatedTableName"):
+        existing = client.list_tables(ExclusiveStartTableName=existing["LastEvaluatedTableName"])
+        names.update(existing["TableNames"])
+    if table_name in names:
+        return
+
+    logger.info("Creating table %s", table_name)
+    client.create_table(
+        TableName=table_name,
+        KeySchema=key_schema,
+        AttributeDefinitions=attribute_definitions,
+        BillingMode="PAY_PER_REQUEST",
+    )
+    client.get_waiter("table_exists").wait(TableName=table_name)
+
+
+def _index_status(table_name, index_name):
+    description = dynamodb.meta.client.describe_table(TableName=table_name)["Table"]
+    for index in description.get("GlobalSecondaryIndexes", []):
+        if index["IndexName"] == index_name:
+            return index
+    return None
+
+
+def _create_global_index(table_name, index_name, key_schema, attribute_definitions):
+    """
+    Add a GSI to an existing table, respecting its billing mode.
+    """
+    description = dynamodb.meta.client.describe_table(TableName=table_name)["Table"]
+    billing_mode = description.get("BillingModeSummary", {}).get("BillingMode", "PROVISIONED")
+
+    index = {
+        "IndexName": index_name,
+        "KeySchema": key_schema,
+        "Projection": {"ProjectionType": "ALL"},
+    }
+    if billing_mode == "PROVISIONED":
+        throughput = description["ProvisionedThroughput"]
+        index["ProvisionedThroughput"] = {
+            "ReadCapacityUnits": throughput["ReadCapacityUnits"],
+            "WriteCapacityUnits": throughput["WriteCapacityUnits"],
+        }
+
+    dynamodb.meta.client.update_table(
+        TableName=table_name,
+        AttributeDefinitions=attribute_definitions,
+        GlobalSecondaryIndexUpdates=[{"Create": index}],
+    )
+
+
+def wait_for_index(table_name, index_name, poll_interval=10):
+    """
+    Block until DynamoDB has finished backfilling the index from existing rows.
+    """
+    while True:
+        index = _index_status(table_name, index_name)
+        if index and index["IndexStatus"] == "ACTIVE" and not index.get("Backfilling"):
+            return index
+        logger.info("Waiting for %s.%s (status: %s)", table_name, index_name, index and index["IndexStatus"])
+        time.sleep(poll_interval)
+
+
+def find_unindexed_partner_requests():
+    """
+    The sender index is sparse: rows without SenderUserID or Status never
+    appear in it. Returns such rows so they can be repaired by hand.
+    """
+    return [
+        item for item in _scan_all(request_table)
+        if "SenderUserID" not in item or "Status" not in item
+    ]
+
+
+def ensure_partner_request_indexes():
+    """
+    Create the PartnerRequests sender index if it is missing and wait for the
+    backfill of existing rows. Receiver lookups use the table's own
+    ReceiverUserID key, so they need no index.
+    """
+    table_name = request_table.name
+    if _index_status(table_name, PARTNER_REQUESTS_SENDER_INDEX) is None:
+        logger.info("Creating index %s on %s", PARTNER_REQUESTS_SENDER_INDEX, table_name)
+        _create_global_index(
+            table_name,
+            PARTNER_REQUESTS_SENDER_INDEX,
+            key_schema=[
+                {"AttributeName": "SenderUserID", "KeyType": "HASH"},
+                {"AttributeName": "Status", "KeyType": "RANGE"},
+            ],
+            attribute_definitions=[
+                {"AttributeName": "SenderUserID", "AttributeType": "S"},
+                {"AttributeName": "Status", "AttributeType": "S"},
+            ],
+        )
+
+    wait_for_index(table_name, PARTNER_REQUESTS_SENDER_INDEX)
+
+    missing = find_unindexed_partner_requests()
+    if missing:
+        logger.warning("%d PartnerRequests rows are not covered by the index", len(missing), extra={"fields": {"missing": missing}})
+
+
+def backfill_movie_title_keys():
+    """
+    Set TitleKey/TitleBase on Movies rows written before they existed.
+    Rows are only updated when the stored values differ, so this is safe to re-run.
+    """
+    duplicates = {}
+    for item in _scan_all(movies_table, ProjectionExpression="MovieName, TitleKey, TitleBase"):
+        attributes = title_attributes(item["MovieName"])
+        duplicates.setdefault(attributes["TitleKey"], []).append(item["MovieName"])
+        if all(item.get(name) == value for name, value in attributes.items()):
+            continue
+        movies_table.update_item(
+            Key={"MovieName": item["MovieName"]},
+            UpdateExpression="SET TitleKey = :key, TitleBase = :base",
+            ExpressionAttributeValues={":key": attributes["TitleKey"], ":base": attributes["TitleBase"]}
+        )
+
+    duplicates = {key: names for key, names in duplicates.items() if len(names) > 1}
+    if duplicates:
+        logger.warning("%d Movies titles are stored under several spellings", len(duplicates), extra={"fields": {"duplicates": duplicates}})
+
+
+def ensure_movie_title_index():
+    """
+    Create the Movies TitleBase index used by crud.find_movie_by_title and
+    backfill the title attributes it is built from.
+    """
+    backfill_movie_title_keys()
+    table_name = movies_table.name
+    if _index_status(table_name, MOVIES_TITLE_INDEX) is None:
+        logger.info("Creating index %s on %s", MOVIES_TITLE_INDEX, table_name)
+        _create_global_index(
+            table_name,
+            MOVIES_TITLE_INDEX,
+            key_schema=[{"AttributeName": "TitleBase", "KeyType": "HASH"}],
+            attribute_definitions=[{"AttributeName": "TitleBase", "AttributeType": "S"}],
+        )
+    wait_for_index(table_name, MOVIES_TITLE_INDEX)
+
+
+def reconcile_all_unread_counters():
+    """
+    Recompute Users.UnreadNotifications for every user from the Notifications table.
+    """
+    for item in _scan_all(user_table, ProjectionExpression="UserID"):
+        reconcile_unread_notification_count(item["UserID"])
+
+
+def ensure_recommendation_history_table():
+    ensure_table(
+        history_table.name,
+        key_schema=[{"AttributeName": "PairID", "KeyType": "HASH"}],
+        attribute_definitions=[{"AttributeName": "PairID", "AttributeType": "S"}],
+    )
+
+
+def ensure_leases_table():
+    ensure_table(
+        leases_table.name,
+        key_schema=[{"AttributeName": "LeaseKey", "KeyType": "HASH"}],
+        attribute_definitions=[{"AttributeName": "LeaseKey", "AttributeType": "S"}],
+    )
+    ensure_ttl(leases_table.name, "ExpiresAt")
+
+
+def ensure_ttl(table_name, attribute_name):
+    ttl = dynamodb.meta.client.describe_time_to_live(TableName=table_name)
+    if ttl["TimeToLiveDescription"]["TimeToLiveStatus"] in ("DISABLED", "DISABLING"):
+        dynamodb.meta.client.update_time_to_live(
+            TableName=table_name,
+            TimeToLiveSpecification={"Enabled": True, "AttributeName": attribute_name},
+        )
+
+
+def ensure_recommendation_jobs_table():
+    ensure_table(
+        jobs_table.name,
+        key_schema=[{"AttributeName": "JobID", "KeyType": "HASH"}],
+        attribute_definitions=[{"AttributeName": "JobID", "AttributeType": "S"}],
+    )
+    # Bitmiş işler ExpiresAt geçince DynamoDB tarafından silinir
+    ensure_ttl(jobs_table.name, "ExpiresAt")
+
+
+def ensure_recommendation_buffer_table():
+    ensure_table(
+        buffer_table.name,
+        key_schema=[{"AttributeName": "PairID", "KeyType": "HASH"}],
+        attribute_definitions=[{"AttributeName": "PairID", "AttributeType": "S"}],
+    )
+    ensure_ttl(buffer_table.name, "ExpiresAt")
+
+
+def ensure_llm_cache_table():
+    ensure_table(
+        llm_cache_table.name,
+        key_schema=[{"AttributeName": "Fingerprint", "KeyType": "HASH"}],
+        attribute_definitions=[{"AttributeName": "Fingerprint", "AttributeType": "S"}],
+    )
+    ensure_ttl(llm_cache_table.name, "ExpiresAt")
+
+
+def backfill_recommendation_history():
+    """
+    Seed RecommendationHistory from the Movies lists kept on Partners rows.
+    ADD on a string set is idempotent, so this is safe to re-run.
+    """
+    for item in _scan_all(partners_table):
+        if item.get("Movies") and item.get("PartnerID"):
+            add_to_recommendation_history(item["UserID"], item["PartnerID"], item["Movies"])
+
+
+def main():
+    ensure_partner_request_indexes()
+    reconcile_all_unread_counters()
+    ensure_recommendation_history_table()
+    backfill_recommendation_history()
+    ensure_leases_table()
+    ensure_recommendation_jobs_table()
+    ensure_recommendation_buffer_table()
+    ensure_llm_cache_table()
+    ensure_movie_title_index()
+
+
+if __name__ == "__main__":
+    setup_logging()
+    main()
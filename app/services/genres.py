@@ -0,0 +1,203 @@
+"""
+Canonical genre taxonomy.
+
+Genres arrive as free text (user input, GPT output, Movies.Genre), so
+"Sci-Fi", "Science Fiction" and "sci-fi " must all resolve to the same
+genre. Every canonical genre has a small, stable integer ID; a set of genres
+is a bitset (bit i = genre i), so overlap between two profiles is a single
+AND + popcount and whole candidate lists can be scored with NumPy.
+
+Compound strings ("Action/Adventure", "Drama, Romance") are split on "/"
+and "," first. Normalization (alias -> canonical name) is independent of
+the bitset: unknown genres keep their cleaned name and are interned with
+the next free ID up to MAX_GENRES bits; past that they simply get no bit.
+Interned IDs are process-local, so bitsets are never persisted; DynamoDB
+keeps canonical names.
+"""
+import re
+import threading
+import numpy as np
+
+MAX_GENRES = 64  # bitsets fit in one uint64
+_SEPARATORS = re.compile(r"[/,]")
+
+# Sıra değişmemeli: indeks = ID. Yeni türler sona eklenir.
+CANONICAL_GENRES = [
+    "Action", "Adventure", "Animation", "Biography", "Comedy", "Crime",
+    "Documentary", "Drama", "Family", "Fantasy", "History", "Horror",
+    "Music", "Musical", "Mystery", "Romance", "Science Fiction", "Sport",
+    "Thriller", "War", "Western", "Superhero", "Psychological", "Noir",
+]
+
+_ALIASES = {
+    "scifi": "Science Fiction",
+    "sf": "Science Fiction",
+    "bilimkurgu": "Science Fiction",
+    "romcom": "Romance",
+    "romantic": "Romance",
+    "romanticcomedy": "Romance",
+    "animated": "Animation",
+    "anime": "Animation",
+    "cartoon": "Animation",
+    "biopic": "Biography",
+    "biographical": "Biography",
+    "historical": "History",
+    "period": "History",
+    "sports": "Sport",
+    "suspense": "Thriller",
+    "psychologicalthriller": "Psychological",
+    "filmnoir": "Noir",
+    "neonoir": "Noir",
+    "superheroes": "Superhero",
+    "comic": "Superhero",
+    "comicbook": "Superhero",
+    "docu": "Documentary",
+    "kids": "Family",
+    "children": "Family",
+    "teen": "Family",
+    "aksiyon": "Action",
+    "macera": "Adventure",
+    "komedi": "Comedy",
+    "dram": "Drama",
+    "korku": "Horror",
+    "gerilim": "Thriller",
+    "romantik": "Romance",
+    "suç": "Crime",
+    "belgesel": "Documentary",
+    "gizem": "Mystery",
+    "savaş": "War",
+    "animasyon": "Animation",
+    "aile": "Family",
+}
+
+
+def _key(name: str) -> str:
+    return re.sub(r"[\W_]+", "", str(name).lower())
+
+
+def split_genres(genres) -> list:
+    """
+    Individual genre strings from a string or list, splitting "A/B" and "A, B".
+    """
+    if isinstance(genres, str):
+        genres = [genres]
+    parts = []
+    for genre in genres or []:
+        parts.extend(part.strip() for part in _SEPARATORS.split(str(genre)) if _key(part))
+    return parts
+
+
+class GenreRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._names = list(CANONICAL_GENRES)
+        self._ids = {_key(name): index for index, name in enumerate(self._names)}
+        self._aliases = {alias: _key(name) for alias, name in _ALIASES.items()}
+        self._stats = {"lookups": 0, "alias_hits": 0, "interned": 0, "overflow": 0}
+
+    def _resolve(self, name: str):
+        """
+        (key, display name) of the canonical genre for one name; caller holds the lock.
+        """
+        key = _key(name)
+        if key in self._ids:
+            return key, self._names[self._ids[key]]
+        alias = self._aliases.get(key)
+        # Sondaki çoğul eki ("Thrillers", "Westerns")
+        if alias is None and key.endswith("s") and key[:-1] in self._ids:
+            alias = key[:-1]
+        if alias is not None:
+            self._stats["alias_hits"] += 1
+            return alias, self._names[self._ids[alias]]
+        return key, str(name).strip().title()
+
+    def canonical_name(self, name: str):
+        """
+        Canonical name for a single genre; unknown genres keep their cleaned name.
+        None only for empty input.
+        """
+        if not _key(name):
+            return None
+        with self._lock:
+            self._stats["lookups"] += 1
+            return self._resolve(name)[1]
+
+    def genre_id(self, name: str):
+        """
+        Bit ID for a single genre name or alias; unknown names are interned.
+        None for empty input or when the ID space is full.
+        """
+        if not _key(name):
+            return None
+        with self._lock:
+            self._stats["lookups"] += 1
+            key, display = self._resolve(name)
+            genre_id = self._ids.get(key)
+            if genre_id is not None:
+                return genre_id
+            if len(self._names) >= MAX_GENRES:
+                # Tür yine kaydedilir, sadece bitset'te yeri yok
+                self._stats["overflow"] += 1
+                return None
+            genre_id = len(self._names)
+            self._names.append(display)
+            self._ids[key] = genre_id
+            self._stats["interned"] += 1
+            return genre_id
+
+    def name(self, genre_id: int) -> str:
+        return self._names[genre_id]
+
+    def canonical(self, genres) -> list:
+        """
+        Canonical names for free-text genres, de-duplicated, order kept.
+        """
+        names = []
+        for genre in split_genres(genres):
+            name = self.canonical_name(genre)
+            if name is not None and name not in names:
+                names.append(name)
+        return names
+
+    def genre_ids(self, genres) -> list:
+        ids = (self.genre_id(genre) for genre in split_genres(genres))
+        return [genre_id for genre_id in ids if genre_id is not None]
+
+    def bitset(self, genres) -> int:
+        bits = 0
+        for genre_id in self.genre_ids(genres):
+            bits |= 1 << genre_id
+        return bits
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["genres"] = len(self._names)
+        return stats
+
+
+registry = GenreRegistry()
+canonical_genres = registry.canonical
+genre_bitset = registry.bitset
+
+# popcount of every byte value, for counting bits of uint64 arrays
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def popcount(bits: np.ndarray) -> np.ndarray:
+    bits = np.ascontiguousarray(bits, dtype=np.uint64)
+    return _POPCOUNT[bits.view(np.uint8)].reshape(bits.shape + (8,)).sum(axis=-1)
+
+
+def compatibility_scores(movie_bits, user_bits: int, partner_bits: int) -> np.ndarray:
+    """
+    Per movie: fraction of its genres liked by the user plus the fraction
+    liked by the partner (0..2). Movies that suit both partners score highest.
+    """
+    movie_bits = np.asarray(movie_bits, dtype=np.uint64)
+    sizes = popcount(movie_bits).astype(np.float32)
+    sizes[sizes == 0] = 1.0
+    user_overlap = popcount(movie_bits & np.uint64(user_bits))
+    partner_overlap = popcount(movie_bits & np.uint64(partner_bits))
+    return (user_overlap + partner_overlap) / sizes
+
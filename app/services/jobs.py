@@ -0,0 +1,292 @@
+"""
+Bounded background queue for recommendation jobs.
+
+/generate-recommendations only enqueues a job and returns its id; a fixed
+number of worker tasks run the LLM round trip outside the request. When the
+queue is full, submit() raises QueueFull so the caller can answer 503
+instead of piling up work. Job state lives in the RecommendationJobs table,
+so status can be polled from any worker process.
+
+The SSE endpoint generates inside the request, but through inline_job():
+it takes one of the same RECOMMENDATION_WORKERS slots, counts against the
+queue capacity while it waits for one and is deduplicated per pair with
+queued jobs, so streaming clients get the same backpressure.
+
+Queued jobs live only in this process's memory, so rows left queued or
+running by a restart are marked failed once they are older than
+RECOMMENDATION_JOB_STALE_SECONDS (on startup, and when polled).
+"""
+import os
+import time
+import uuid
+import asyncio
+import logging
+import contextlib
+from collections import deque
+from datetime import datetime
+from app.services.async_crud import put_recommendation_job, update_recommendation_job, scan_unfinished_recommendation_jobs
+from app.services.crud import pair_id
+from app.services.structured_logging import set_request_id
+from app.services.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDATION_WORKERS = int(os.getenv("RECOMMENDATION_WORKERS", "4"))
+RECOMMENDATION_QUEUE_SIZE = int(os.getenv("RECOMMENDATION_QUEUE_SIZE", "50"))
+RECOMMENDATION_JOB_TTL = int(os.getenv("RECOMMENDATION_JOB_TTL", str(24 * 3600)))
+# Bu süredir güncellenmeyen queued/running işler yeniden başlatmada kaybolmuş sayılır
+RECOMMENDATION_JOB_STALE_SECONDS = int(os.getenv("RECOMMENDATION_JOB_STALE_SECONDS", "900"))
+STALE_JOB_ERROR = "İş yarıda kaldı, lütfen tekrar deneyin"
+
+# Son N işin süreleri (p50/p95 için)
+LATENCY_WINDOW = 500
+
+RECOMMENDATION_JOBS = Counter(
+    "recommendation_jobs_total", "Recommendation jobs by result (submitted, deduplicated, rejected, succeeded, failed).", ("result",)
+)
+RECOMMENDATION_JOB_WAIT_SECONDS = Histogram(
+    "recommendation_job_wait_seconds", "Time a recommendation job waited for a worker slot."
+)
+RECOMMENDATION_JOB_RUN_SECONDS = Histogram(
+    "recommendation_job_run_seconds", "Time a recommendation job ran once it had a slot."
+)
+
+
+class QueueFull(Exception):
+    """
+    Raised by submit() and inline_job() when the queue is at capacity.
+    """
+
+
+class PairBusy(Exception):
+    """
+    Raised by inline_job() when the pair already has a job queued or running.
+    """
+
+    def __init__(self, job_id: str):
+        super().__init__(job_id)
+        self.job_id = job_id
+
+
+def job_is_stale(job: dict) -> bool:
+    """
+    True for a queued/running job that has not been updated for
+    RECOMMENDATION_JOB_STALE_SECONDS; its worker is gone.
+    """
+    if job.get("Status") not in ("queued", "running"):
+        return False
+    try:
+        updated_at = datetime.fromisoformat(job["UpdatedAt"])
+    except (KeyError, TypeError, ValueError):
+        return True
+    return (datetime.utcnow() - updated_at).total_seconds() > RECOMMENDATION_JOB_STALE_SECONDS
+
+
+async def fail_stale_job(job: dict):
+    await update_recommendation_job(job["JobID"], "failed", Error=STALE_JOB_ERROR)
+
+
+def _percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+class RecommendationJobQueue:
+    def __init__(self, handler, workers: int = RECOMMENDATION_WORKERS, maxsize: int = RECOMMENDATION_QUEUE_SIZE):
+        # handler(user_id, partner_id) -> dict; {"error": ...} marks the job failed
+        self.handler = handler
+        self.workers = workers
+        self.maxsize = maxsize
+        self._queue = None
+        self._slots = None  # kuyruk worker'ları ve SSE üretimleri arasında paylaşılır
+        self._waiting_inline = 0
+        self._tasks = []
+        self._active = {}  # pair_id -> job_id of a queued/running job
+        self._running = 0
+        self._wait_times = deque(maxlen=LATENCY_WINDOW)
+        self._run_times = deque(maxlen=LATENCY_WINDOW)
+        self._counters = {"submitted": 0, "deduplicated": 0, "rejected": 0, "succeeded": 0, "failed": 0}
+
+    async def start(self):
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self.recover_stale_jobs()))
+
+    async def recover_stale_jobs(self):
+        """
+        Mark jobs orphaned by a previous process as failed so pollers stop waiting.
+        """
+        try:
+            jobs = await scan_unfinished_recommendation_jobs()
+            stale = [job for job in jobs if job_is_stale(job)]
+            for job in stale:
+                await fail_stale_job(job)
+            if stale:
+                logger.info("Marked %d stale recommendation jobs as failed", len(stale))
+        except Exception as e:
+            logger.exception("Recovering stale recommendation jobs failed: %s", e)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def submit(self, user_id: str, partner_id: str) -> str:
+        """
+        Enqueue a job and return its id. A pair with a job already queued or
+        running (submitted by either partner) gets that job's id back instead
+        of a second job.
+        """
+        key = pair_id(user_id, partner_id)
+        if key in self._active:
+            self._count("deduplicated")
+            return self._active[key]
+        if self._at_capacity():
+            self._count("rejected")
+            raise QueueFull()
+
+        job_id = uuid.uuid4().hex
+        self._active[key] = job_id
+        try:
+            await self._put_job(job_id, user_id, partner_id)
+            # put_job sırasında kuyruk dolmuş olabilir
+            self._queue.put_nowait((job_id, user_id, partner_id, time.monotonic()))
+        except asyncio.QueueFull:
+            del self._active[key]
+            self._count("rejected")
+            await update_recommendation_job(job_id, "failed", Error="Sistem şu anda çok yoğun")
+            raise QueueFull()
+        except BaseException:
+            del self._active[key]
+            raise
+        self._count("submitted")
+        return job_id
+
+    def _count(self, result: str):
+        self._counters[result] += 1
+        RECOMMENDATION_JOBS.inc(result=result)
+
+    def _at_capacity(self) -> bool:
+        return self._queue.qsize() + self._waiting_inline >= self.maxsize
+
+    async def _put_job(self, job_id: str, user_id: str, partner_id: str):
+        now = datetime.utcnow().isoformat()
+        await put_recommendation_job({
+            "JobID": job_id,
+            "UserID": user_id,
+            "PartnerID": partner_id,
+            "Status": "queued",
+            "CreatedAt": now,
+            "UpdatedAt": now,
+            "ExpiresAt": int(time.time()) + RECOMMENDATION_JOB_TTL
+        })
+
+    @contextlib.asynccontextmanager
+    async def inline_job(self, user_id: str, partner_id: str):
+        """
+        Run a generation in the caller's task under the queue's limits.
+        Yields a dict the caller fills with "count" (or "error"); the job
+        row is finished from it, or marked failed if the body raises.
+        Raises PairBusy with the pair's current job id, or QueueFull.
+        """
+        key = pair_id(user_id, partner_id)
+        if key in self._active:
+            self._count("deduplicated")
+            raise PairBusy(self._active[key])
+        if self._at_capacity():
+            self._count("rejected")
+            raise QueueFull()
+
+        job_id = uuid.uuid4().hex
+        self._active[key] = job_id
+        self._waiting_inline += 1
+        waiting = True
+        try:
+            enqueued_at = time.monotonic()
+            await self._put_job(job_id, user_id, partner_id)
+            self._count("submitted")
+            async with self._slots:
+                self._waiting_inline -= 1
+                waiting = False
+                result = {}
+                async with self._running_job(job_id, enqueued_at):
+                    yield result
+                    await self._finish_job(job_id, result)
+        finally:
+            if waiting:
+                self._waiting_inline -= 1
+            self._active.pop(key, None)
+
+    @contextlib.asynccontextmanager
+    async def _running_job(self, job_id: str, enqueued_at: float):
+        """
+        Mark the job running for the body; a body that raises (or is
+        interrupted) leaves the job failed and the exception propagates.
+        """
+        started_at = time.monotonic()
+        self._wait_times.append(started_at - enqueued_at)
+        RECOMMENDATION_JOB_WAIT_SECONDS.observe(started_at - enqueued_at)
+        self._running += 1
+        error = "Film önerileri oluşturulurken bir hata oluştu"
+        try:
+            await update_recommendation_job(job_id, "running", StartedAt=datetime.utcnow().isoformat())
+            yield
+        except BaseException as e:
+            if isinstance(e, Exception):
+                logger.exception("Recommendation job failed", extra={"fields": {"job_id": job_id}})
+            else:
+                # İptal ya da SSE bağlantısının kapanması
+                error = STALE_JOB_ERROR
+            self._count("failed")
+            try:
+                await update_recommendation_job(job_id, "failed", Error=error)
+            except Exception as update_error:
+                logger.error("Could not record job failure: %s", update_error, extra={"fields": {"job_id": job_id}})
+            raise
+        finally:
+            self._run_times.append(time.monotonic() - started_at)
+            RECOMMENDATION_JOB_RUN_SECONDS.observe(time.monotonic() - started_at)
+            self._running -= 1
+
+    async def _finish_job(self, job_id: str, result: dict):
+        if "error" in result:
+            self._count("failed")
+            await update_recommendation_job(job_id, "failed", Error=result["error"])
+        else:
+            self._count("succeeded")
+            await update_recommendation_job(job_id, "done", Count=result.get("count", 0))
+
+    async def _worker(self):
+        while True:
+            job_id, user_id, partner_id, enqueued_at = await self._queue.get()
+            # İşin logları job ID ile ilişkilendirilsin
+            set_request_id(f"job-{job_id}")
+            try:
+                async with self._slots:
+                    async with self._running_job(job_id, enqueued_at):
+                        await self._finish_job(job_id, await self.handler(user_id, partner_id))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                # _running_job işi başarısız olarak kaydetti
+                pass
+            finally:
+                self._active.pop(pair_id(user_id, partner_id), None)
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats["queue_depth"] = self._queue.qsize() if self._queue else 0
+        stats["queue_capacity"] = self.maxsize
+        stats["running"] = self._running
+        stats["waiting_inline"] = self._waiting_inline
+        stats["workers"] = self.workers
+        stats["wait_seconds_p50"] = _percentile(self._wait_times, 0.5)
+        stats["wait_seconds_p95"] = _percentile(self._wait_times, 0.95)
+        stats["run_seconds_p50"] = _percentile(self._run_times, 0.5)
+        stats["run_seconds_p95"] = _percentile(self._run_times, 0.95)
+        return stats
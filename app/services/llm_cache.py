@@ -0,0 +1,195 @@
+"""
+Persistent cache of LLM responses keyed by a prompt fingerprint.
+
+The fingerprint is a SHA-256 of the model, the sampling parameters
+(max_tokens, temperature, functions, ...) and the messages with whitespace
+normalized, so identical requests hit the cache even across restarts and
+workers. Responses are kept in the LLMCache table with a per-call-type TTL
+(DynamoDB TTL removes expired rows) behind a small in-process LRU. A
+periodic trim keeps the table at most LLM_CACHE_MAX_ENTRIES rows, evicting
+the oldest first.
+
+Calls that need fresh sampling pass cache=False to call_openai_with_retry.
+"""
+import os
+import json
+import time
+import uuid
+import hashlib
+import asyncio
+import logging
+from app.services.cache import TTLCache, MISS
+from app.services.llm_client import response_cost
+from app.services.metrics import Counter
+from app.services.async_crud import (
+    get_llm_cache_entry, put_llm_cache_entry, scan_llm_cache_ages, delete_llm_cache_entries, acquire_lease, release_lease
+)
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_MEMORY_SIZE = int(os.getenv("LLM_CACHE_MEMORY_SIZE", "512"))
+LLM_CACHE_TRIM_INTERVAL = float(os.getenv("LLM_CACHE_TRIM_INTERVAL", str(6 * 3600)))
+# DynamoDB item limiti 400 KB
+LLM_CACHE_MAX_ITEM_BYTES = 350 * 1024
+
+LLM_CACHE_LOOKUPS = Counter("llm_cache_lookups_total", "Response cache lookups by result.", ("call_type", "result"))
+LLM_CACHE_SAVED_USD = Counter("llm_cache_saved_usd_total", "Spend avoided by cache hits.", ("call_type",))
+LLM_CACHE_SAVED_SECONDS = Counter("llm_cache_saved_seconds_total", "Model latency avoided by cache hits.", ("call_type",))
+
+# Call type -> TTL in seconds; 0 disables caching for that type
+LLM_CACHE_TTLS = {
+    "movie_details": int(os.getenv("LLM_CACHE_TTL_MOVIE_DETAILS", str(30 * 24 * 3600))),
+    "recommendations": int(os.getenv("LLM_CACHE_TTL_RECOMMENDATIONS", str(24 * 3600))),
+    "prompt": int(os.getenv("LLM_CACHE_TTL_PROMPT", str(7 * 24 * 3600))),
+}
+
+
+def _normalize_messages(messages: list) -> list:
+    return [
+        {"role": message.get("role"), "content": " ".join(str(message.get("content") or "").split())}
+        for message in messages
+    ]
+
+
+def fingerprint(model: str, messages: list, **params) -> str:
+    payload = json.dumps(
+        {"model": model, "messages": _normalize_messages(messages), "params": params},
+        sort_keys=True,
+        default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    def __init__(self):
+        self.memory = TTLCache(maxsize=LLM_CACHE_MEMORY_SIZE, ttl=max(LLM_CACHE_TTLS.values()))
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._by_type = {}
+        self._totals = {"stores": 0, "store_errors": 0, "evictions": 0, "usd_saved": 0.0, "latency_saved_seconds": 0.0}
+
+    def _counters(self, call_type: str) -> dict:
+        return self._by_type.setdefault(call_type, {"hits": 0, "memory_hits": 0, "misses": 0})
+
+    def enabled(self, call_type: str) -> bool:
+        return LLM_CACHE_ENABLED and bool(call_type) and LLM_CACHE_TTLS.get(call_type, 0) > 0
+
+    async def get(self, call_type: str, key: str):
+        """
+        Cached response for `key`, or None.
+        """
+        counters = self._counters(call_type)
+        entry = self.memory.get(key)
+        if entry is not MISS:
+            counters["memory_hits"] += 1
+        else:
+            try:
+                item = await get_llm_cache_entry(key)
+            except Exception as e:
+                logger.warning("LLM cache read failed: %s", e)
+                item = None
+            # DynamoDB TTL silmesi gecikebilir
+            if not item or int(item.get("ExpiresAt", 0)) < time.time():
+                counters["misses"] += 1
+                LLM_CACHE_LOOKUPS.inc(call_type=call_type, result="miss")
+                return None
+            entry = {
+                "response": json.loads(item["Response"]),
+                "model": item.get("Model", ""),
+                "latency": int(item.get("LatencyMs", 0)) / 1000
+            }
+            self.memory.set(key, entry, ttl=int(item["ExpiresAt"]) - time.time())
+
+        counters["hits"] += 1
+        saved_usd = response_cost(entry["model"], entry["response"])
+        self._totals["usd_saved"] += saved_usd
+        self._totals["latency_saved_seconds"] += entry["latency"]
+        LLM_CACHE_LOOKUPS.inc(call_type=call_type, result="hit")
+        LLM_CACHE_SAVED_USD.inc(saved_usd, call_type=call_type)
+        LLM_CACHE_SAVED_SECONDS.inc(entry["latency"], call_type=call_type)
+        return entry["response"]
+
+    async def put(self, call_type: str, key: str, model: str, response, latency: float):
+        ttl = LLM_CACHE_TTLS[call_type]
+        body = json.dumps(response)
+        if len(body) > LLM_CACHE_MAX_ITEM_BYTES:
+            return
+        self.memory.set(key, {"response": json.loads(body), "model": model, "latency": latency}, ttl=ttl)
+        try:
+            await put_llm_cache_entry({
+                "Fingerprint": key,
+                "CallType": call_type,
+                "Model": model,
+                "Response": body,
+                "LatencyMs": int(latency * 1000),
+                "CreatedAt": int(time.time()),
+                "ExpiresAt": int(time.time()) + ttl
+            })
+            self._totals["stores"] += 1
+        except Exception as e:
+            self._totals["store_errors"] += 1
+            logger.warning("LLM cache write failed: %s", e)
+
+    async def trim(self, max_entries: int = LLM_CACHE_MAX_ENTRIES) -> int:
+        """
+        Delete the oldest rows beyond `max_entries`; returns how many were evicted.
+        """
+        items = await scan_llm_cache_ages()
+        if len(items) <= max_entries:
+            return 0
+        items.sort(key=lambda item: int(item.get("CreatedAt", 0)))
+        evicted = [item["Fingerprint"] for item in items[:len(items) - max_entries]]
+        await delete_llm_cache_entries(evicted)
+        for key in evicted:
+            self.memory.invalidate(key)
+        self._totals["evictions"] += len(evicted)
+        return len(evicted)
+
+    async def trim_periodically(self):
+        while True:
+            await asyncio.sleep(LLM_CACHE_TRIM_INTERVAL)
+            await self.trim_once()
+
+    async def trim_once(self):
+        """
+        One trim under the "llm-cache-trim" lease; errors are logged, never raised,
+        so the periodic task survives throttling or network failures.
+        """
+        acquired = False
+        try:
+            # Tabloyu tek bir worker budasın
+            acquired = await acquire_lease("llm-cache-trim", self.owner, 600)
+            if acquired:
+                evicted = await self.trim()
+                logger.info("LLM cache trim evicted %d entries", evicted)
+        except Exception:
+            logger.exception("LLM cache trim failed")
+        finally:
+            if acquired:
+                try:
+                    await release_lease("llm-cache-trim", self.owner)
+                except Exception as e:
+                    logger.warning("Releasing the LLM cache trim lease failed: %s", e)
+
+    def stats(self) -> dict:
+        stats = dict(self._totals)
+        stats["usd_saved"] = round(stats["usd_saved"], 4)
+        stats["latency_saved_seconds"] = round(stats["latency_saved_seconds"], 3)
+        stats["enabled"] = LLM_CACHE_ENABLED
+        stats["by_type"] = {}
+        hits = lookups = 0
+        for call_type, counters in self._by_type.items():
+            type_lookups = counters["hits"] + counters["misses"]
+            stats["by_type"][call_type] = dict(
+                counters,
+                hit_ratio=round(counters["hits"] / type_lookups, 3) if type_lookups else None
+            )
+            hits += counters["hits"]
+            lookups += type_lookups
+        stats["hit_ratio"] = round(hits / lookups, 3) if lookups else None
+        stats["memory"] = self.memory.stats()
+        return stats
+
+
+llm_cache = LLMResponseCache()
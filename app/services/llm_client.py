@@ -0,0 +1,272 @@
+"""
+Async OpenAI client wrapper.
+
+All model calls go through chat_completion(), which awaits the API instead
+of blocking the event loop, bounds every attempt with a timeout and retries
+transient failures with exponential backoff and full jitter. A Retry-After
+header sent by the API takes precedence over the computed delay.
+
+Every call is labelled with a call type and recorded in the Prometheus
+metrics: latency histograms, token usage, cost, retries and failure reasons.
+Streamed responses carry no usage block, so their tokens are estimated from
+the request and the streamed deltas.
+"""
+import os
+import json
+import time
+import asyncio
+import random
+import logging
+import openai
+from app.services.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "30"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "5"))
+OPENAI_BACKOFF_BASE = float(os.getenv("OPENAI_BACKOFF_BASE", "1"))
+OPENAI_BACKOFF_MAX = float(os.getenv("OPENAI_BACKOFF_MAX", "20"))
+
+# Errors worth another attempt; everything else (bad request, auth, ...) is raised at once
+RETRYABLE_ERRORS = (
+    openai.error.RateLimitError,
+    openai.error.APIError,
+    openai.error.Timeout,
+    openai.error.TryAgain,
+    openai.error.APIConnectionError,
+    openai.error.ServiceUnavailableError,
+    asyncio.TimeoutError,
+)
+
+
+# USD per 1K (prompt, completion) tokens
+MODEL_PRICES = {
+    "gpt-4": (0.03, 0.06),
+    "gpt-4-32k": (0.06, 0.12),
+    "gpt-3.5-turbo": (0.0015, 0.002),
+}
+
+LLM_CALL_SECONDS = Histogram(
+    "llm_call_duration_seconds", "Duration of a model call including retries.", ("call_type", "model", "outcome")
+)
+LLM_ATTEMPT_SECONDS = Histogram(
+    "llm_attempt_duration_seconds", "Duration of a single API attempt.", ("call_type", "model", "outcome")
+)
+LLM_FIRST_TOKEN_SECONDS = Histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed delta.", ("call_type", "model")
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens used, by kind (prompt/completion).", ("call_type", "model", "kind"))
+LLM_COST = Counter("llm_cost_usd_total", "Estimated spend from token usage.", ("call_type", "model"))
+LLM_RETRIES = Counter("llm_retries_total", "Attempts that were retried, by reason.", ("call_type", "model", "reason"))
+LLM_FAILURES = Counter("llm_failures_total", "Calls that gave up, by last failure reason.", ("call_type", "model", "reason"))
+
+
+def response_cost(model: str, response) -> float:
+    """
+    USD cost of a response from its token usage (0 for unknown models).
+    """
+    usage = (response or {}).get("usage") or {}
+    prompt_price, completion_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (usage.get("prompt_tokens", 0) * prompt_price + usage.get("completion_tokens", 0) * completion_price) / 1000
+
+
+def estimate_tokens(text: str) -> int:
+    # ~4 characters per token for English text
+    return (len(text) + 3) // 4
+
+
+def estimate_prompt_tokens(messages: list, **kwargs) -> int:
+    """
+    Approximate prompt tokens of a request: message texts plus function definitions.
+    """
+    # Mesaj başına ~4 token rol/ayraç yükü
+    tokens = sum(4 + estimate_tokens(str(message.get("content") or "")) for message in messages)
+    if kwargs.get("functions"):
+        tokens += estimate_tokens(json.dumps(kwargs["functions"]))
+    return tokens
+
+
+def _record_usage(call_type: str, model: str, response):
+    usage = (response or {}).get("usage") or {}
+    LLM_TOKENS.inc(usage.get("prompt_tokens", 0), call_type=call_type, model=model, kind="prompt")
+    LLM_TOKENS.inc(usage.get("completion_tokens", 0), call_type=call_type, model=model, kind="completion")
+    LLM_COST.inc(response_cost(model, response), call_type=call_type, model=model)
+
+
+class LLMCallError(Exception):
+    """
+    Raised when no valid response was received within the retry budget.
+    """
+
+
+def backoff_delay(attempt: int) -> float:
+    """
+    Full-jitter exponential backoff: uniform in [0, min(max, base * 2^attempt)].
+    """
+    return random.uniform(0, min(OPENAI_BACKOFF_MAX, OPENAI_BACKOFF_BASE * (2 ** attempt)))
+
+
+def retry_after_seconds(error) -> float:
+    """
+    Seconds requested by the API's Retry-After header, capped at
+    OPENAI_BACKOFF_MAX, or None.
+    """
+    headers = getattr(error, "headers", None) or {}
+    value = headers.get("retry-after") or headers.get("Retry-After")
+    try:
+        retry_after = float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+    # Tek bir büyük başlık worker'ı dakikalarca bekletmesin
+    return min(max(retry_after, 0), OPENAI_BACKOFF_MAX) if retry_after is not None else None
+
+
+def has_choices(response) -> bool:
+    return bool(response) and "choices" in response and len(response["choices"]) > 0
+
+
+async def chat_completion(
+    messages: list,
+    model: str = "gpt-4",
+    max_tokens: int = 300,
+    temperature: float = 0.7,
+    retries: int = OPENAI_MAX_RETRIES,
+    timeout: float = OPENAI_TIMEOUT,
+    validate=has_choices,
+    call_type: str = "other",
+    **kwargs
+):
+    """
+    Await a ChatCompletion, retrying until `validate(response)` is true.
+    """
+    started = time.monotonic()
+    last_error = None
+    reason = None
+    for attempt in range(retries):
+        delay = None
+        attempt_started = time.monotonic()
+        try:
+            response = await asyncio.wait_for(
+                openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    request_timeout=timeout,
+                    **kwargs
+                ),
+                timeout=timeout
+            )
+            # Geçersiz cevaplar da token harcar
+            _record_usage(call_type, model, response)
+            if validate(response):
+                LLM_ATTEMPT_SECONDS.observe(time.monotonic() - attempt_started, call_type=call_type, model=model, outcome="ok")
+                LLM_CALL_SECONDS.observe(time.monotonic() - started, call_type=call_type, model=model, outcome="ok")
+                return response
+            last_error = ValueError("Invalid response format")
+            reason = "InvalidResponse"
+            logger.warning("Invalid response format on attempt %d", attempt + 1, extra={"fields": {"call_type": call_type}})
+        except RETRYABLE_ERRORS as e:
+            last_error = e
+            reason = type(e).__name__
+            delay = retry_after_seconds(e)
+            logger.warning("Attempt %d failed: %s: %s", attempt + 1, type(e).__name__, e, extra={"fields": {"call_type": call_type}})
+        except Exception as e:
+            # Yeniden denenmeyen hata (geçersiz istek, yetki, ...)
+            LLM_FAILURES.inc(call_type=call_type, model=model, reason=type(e).__name__)
+            LLM_CALL_SECONDS.observe(time.monotonic() - started, call_type=call_type, model=model, outcome="error")
+            raise
+        LLM_ATTEMPT_SECONDS.observe(time.monotonic() - attempt_started, call_type=call_type, model=model, outcome=reason)
+
+        if attempt < retries - 1:
+            LLM_RETRIES.inc(call_type=call_type, model=model, reason=reason)
+            await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+
+    LLM_FAILURES.inc(call_type=call_type, model=model, reason=reason)
+    LLM_CALL_SECONDS.observe(time.monotonic() - started, call_type=call_type, model=model, outcome="error")
+    raise LLMCallError(f"Failed to get a valid response from OpenAI API after {retries} attempts: {last_error}")
+
+
+async def stream_chat_completion(
+    messages: list,
+    model: str = "gpt-4",
+    max_tokens: int = 300,
+    temperature: float = 0.7,
+    retries: int = OPENAI_MAX_RETRIES,
+    timeout: float = OPENAI_TIMEOUT,
+    call_type: str = "other",
+    **kwargs
+):
+    """
+    Async generator over a streamed ChatCompletion, yielding text deltas
+    (message content or function-call arguments). Only opening the stream is
+    retried; `timeout` also bounds the wait for each following chunk.
+    """
+    started = time.monotonic()
+    stream = None
+    last_error = None
+    reason = None
+    for attempt in range(retries):
+        delay = None
+        try:
+            stream = await asyncio.wait_for(
+                openai.ChatCompletion.acreate(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    request_timeout=timeout,
+                    stream=True,
+                    **kwargs
+                ),
+                timeout=timeout
+            )
+            break
+        except RETRYABLE_ERRORS as e:
+            last_error = e
+            reason = type(e).__name__
+            delay = retry_after_seconds(e)
+            logger.warning("Stream attempt %d failed: %s: %s", attempt + 1, type(e).__name__, e, extra={"fields": {"call_type": call_type}})
+        if attempt < retries - 1:
+            LLM_RETRIES.inc(call_type=call_type, model=model, reason=reason)
+            await asyncio.sleep(delay if delay is not None else backoff_delay(attempt))
+
+    if stream is None:
+        LLM_FAILURES.inc(call_type=call_type, model=model, reason=reason)
+        LLM_CALL_SECONDS.observe(time.monotonic() - started, call_type=call_type, model=model, outcome="error")
+        raise LLMCallError(f"Failed to open an OpenAI stream after {retries} attempts: {last_error}")
+
+    outcome = "ok"
+    first_delta = True
+    completion = []  # akan parçalar; tamamlama token tahmini için
+    try:
+        while True:
+            try:
+                chunk = await asyncio.wait_for(stream.__anext__(), timeout=timeout)
+            except StopAsyncIteration:
+                return
+            choices = chunk.get("choices") or [{}]
+            delta = choices[0].get("delta", {})
+            text = delta.get("content") or (delta.get("function_call") or {}).get("arguments")
+            if text:
+                completion.append(text)
+                if first_delta:
+                    first_delta = False
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.monotonic() - started, call_type=call_type, model=model)
+                yield text
+    except GeneratorExit:
+        # Tüketici yeterli sonucu aldı ve akışı erken kapattı
+        outcome = "closed"
+        raise
+    except Exception as e:
+        outcome = "error"
+        LLM_FAILURES.inc(call_type=call_type, model=model, reason=type(e).__name__)
+        raise
+    finally:
+        LLM_CALL_SECONDS.observe(time.monotonic() - started, call_type=call_type, model=model, outcome=outcome)
+        # Erken kapatılan akışta da prompt ve gelen kısım ücretlendirilir
+        _record_usage(call_type, model, {"usage": {
+            "prompt_tokens": estimate_prompt_tokens(messages, **kwargs),
+            "completion_tokens": estimate_tokens("".join(completion))
+        }})
+        await stream.aclose()
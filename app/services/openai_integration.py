@@ -1,126 +1,301 @@
 import openai
 import os
-import boto3
 import time
-import re
-from app.services.crud import get_user_preferences
-from datetime import datetime
+import uuid
+import asyncio
+import logging
+import contextlib
+from app.services.async_crud import run_in_db_pool, get_user_preferences, get_movie_record, batch_get_movies, put_movies, find_movie_by_title, scan_movies, get_recommendation_history, get_partner_record, acquire_lease, release_lease, acquire_leases, release_leases
+from app.services.cache import TTLCache, MISS, NEGATIVE
+from app.services.singleflight import SingleFlight
+from app.services.vector_index import MovieVectorIndex
+from app.services.genres import canonical_genres, genre_bitset, compatibility_scores
+from app.services.titles import title_index, title_key, TitleSet
+from app.services.llm_cache import llm_cache, fingerprint
+from app.services.structured_output import RECOMMENDATIONS_FUNCTION, MOVIE_DETAILS_FUNCTION, function_call_kwargs, parse_structured, structured_stats, StreamingEntryParser
+from app.services.llm_client import chat_completion, stream_chat_completion, has_choices, estimate_tokens, OPENAI_MAX_RETRIES
+
+logger = logging.getLogger(__name__)
 
 # OpenAI API Key
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-# DynamoDB Connection
-dynamodb = boto3.resource(
-    'dynamodb',
-    region_name=os.getenv("AWS_DEFAULT_REGION"),
-    aws_access_key_id=os.getenv("AWS_ACCESS_KEY_ID"),
-    aws_secret_access_key=os.getenv("AWS_SECRET_ACCESS_KEY")
+# Movies tablosunun önünde süreç içi LRU+TTL cache; başarısız üretimler kısa süre hatırlanır
+movie_cache = TTLCache(
+    maxsize=int(os.getenv("MOVIE_CACHE_SIZE", "2048")),
+    ttl=float(os.getenv("MOVIE_CACHE_TTL", "3600")),
+    negative_ttl=float(os.getenv("MOVIE_CACHE_NEGATIVE_TTL", "120"))
 )
-movies_table = dynamodb.Table('Movies')  # Movies table
 
-def call_openai_with_retry(func, retries=5, delay=2):
+# Movies kataloğu üzerinde yerel vektör indeksi; LLM'e aday film listesi sağlar
+movie_index = MovieVectorIndex()
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", "15"))
+
+async def build_movie_index():
+    """
+    Load every Movies row into the vector and title indexes (startup).
+    """
+    try:
+        items = await scan_movies()
+        await run_in_db_pool(movie_index.build, items)
+        title_index.build(item["MovieName"] for item in items)
+        logger.info("Movie vector index built with %d movies", len(movie_index))
+    except Exception:
+        logger.exception("Error building movie vector index")
+
+# Film detayı üretiminin tekilleştirilmesi: worker içinde SingleFlight,
+# worker'lar arasında Leases tablosundaki bir lease satırı
+details_singleflight = SingleFlight()
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+# Üretim sürerken lease her TTL/3'te yenilenir; TTL yalnızca sahibi ölürse dolar
+DETAILS_LEASE_TTL = int(os.getenv("DETAILS_LEASE_TTL", "60"))
+# Bekleyenlerin yoklama aralığı: 0.5 sn'den başlayıp 8 sn'ye kadar ikiye katlanır
+DETAILS_POLL_INTERVAL = float(os.getenv("DETAILS_POLL_INTERVAL", "0.5"))
+DETAILS_POLL_MAX_INTERVAL = float(os.getenv("DETAILS_POLL_MAX_INTERVAL", "8"))
+lease_stats = {"waits": 0, "polls": 0, "takeovers": 0, "renewals": 0, "renewal_errors": 0}
+
+
+def get_details_dedup_stats() -> dict:
+    return {
+        **details_singleflight.stats,
+        **lease_stats,
+        "in_flight": details_singleflight.in_flight()
+    }
+
+async def call_openai_with_retry(messages: list, retries: int = OPENAI_MAX_RETRIES, validate=has_choices, call_type: str = "prompt", cache: bool = True, **kwargs):
     """
     Retry mechanism for OpenAI API calls until a valid response is returned.
+    Backoff, timeouts, Retry-After handling and metrics live in llm_client.
+    Identical requests are answered from llm_cache; pass cache=False for
+    calls that need fresh sampling.
     """
-    for attempt in range(retries):
-        try:
-            result = func()
-            if "choices" in result and len(result["choices"]) > 0:
-                return result
-            else:
-                print(f"Invalid response format on attempt {attempt + 1}. Retrying...")
-        except Exception as e:
-            print(f"Attempt {attempt + 1} failed: {e}")
-        time.sleep(delay)
-    raise ValueError("Failed to get a valid response from OpenAI API after retries.")
+    if not (cache and llm_cache.enabled(call_type)):
+        return await chat_completion(messages, retries=retries, validate=validate, call_type=call_type, **kwargs)
+
+    model = kwargs.get("model", "gpt-4")
+    key = fingerprint(model, messages, **{name: value for name, value in kwargs.items() if name != "model"})
+    cached = await llm_cache.get(call_type, key)
+    if cached is not None and validate(cached):
+        return cached
 
-def call_openai_with_prompt(prompt: str, model: str = "gpt-4", max_tokens: int = 300, temperature: float = 0.7) -> dict:
+    started = time.monotonic()
+    response = await chat_completion(messages, retries=retries, validate=validate, call_type=call_type, **kwargs)
+    await llm_cache.put(call_type, key, model, response, time.monotonic() - started)
+    return response
+
+async def call_openai_with_prompt(prompt: str, model: str = "gpt-4", max_tokens: int = 300, temperature: float = 0.7, call_type: str = "prompt", cache: bool = True, **kwargs) -> dict:
     """
     Generic function to call OpenAI API with a specific prompt.
     """
     try:
-        def openai_call():
-            return openai.ChatCompletion.create(
-                model=model,
-                messages=[
-                    {"role": "system", "content": "You are a movie assistant."},
-                    {"role": "user", "content": prompt}
-                ],
-                max_tokens=max_tokens,
-                temperature=temperature
-            )
-
-        response = call_openai_with_retry(openai_call)
+        response = await call_openai_with_retry(
+            [
+                {"role": "system", "content": "You are a movie assistant."},
+                {"role": "user", "content": prompt}
+            ],
+            model=model,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            call_type=call_type,
+            cache=cache,
+            **kwargs
+        )
 
         if response is None:
             raise ValueError("❌ OpenAI API response is None. Possible issue with API key or connection.")
 
-        print(f"✅ OpenAI API Response: {response}")
+        logger.debug("OpenAI API response", extra={"fields": {"call_type": call_type, "response": response}})
 
         return response
     except Exception as e:
-        print(f"🚨 OpenAI API Call Failed: {e}")
+        logger.error("OpenAI API call failed: %s", e, extra={"fields": {"call_type": call_type}})
         return {"error": str(e)}
 
-def parse_openai_response(response):
+async def request_movie_details(titles: list) -> dict:
     """
-    Parse the OpenAI API response to extract genre and description safely.
+    Ask the model for descriptions and genres of `titles` in one structured
+    request. Titles missing from a partially valid answer are re-requested
+    once; returns {title: {"description", "genres"}} for what was obtained.
     """
-    try:
-        content = response['choices'][0]['message']['content'].strip()
+    details = {}
+    pending = list(titles)
+    for attempt in range(2):
+        if attempt:
+            structured_stats["shortfall_requests"] += 1
+        prompt = (
+            "Generate a detailed but spoiler-free description (2-3 sentences) and the genres for each of these movies:\n"
+            + "\n".join(f"- {title}" for title in pending)
+            + f"\n\nCall {MOVIE_DETAILS_FUNCTION['name']} with one entry per movie, using the exact titles above."
+        )
+        response = await call_openai_with_prompt(
+            prompt,
+            max_tokens=250 * len(pending) + 100,
+            call_type="movie_details",
+            # Eksik kalanlar için ikinci istek aynı cevabı almamalı
+            cache=attempt == 0,
+            **function_call_kwargs(MOVIE_DETAILS_FUNCTION)
+        )
+        if "error" in response:
+            logger.warning("Error requesting movie details: %s", response["error"])
+            break
 
-        match = re.search(r"Genre:\s*(.+)\s*Description:\s*(.+)", content, re.DOTALL)
-        if not match:
-            raise ValueError(f"Unexpected response format: {content}")
+        entries = parse_structured(response, required=("description",), expected=len(pending), call_type="movie_details")
+        # Model büyük/küçük harf, noktalama ya da artikeli değiştirebilir: normalize anahtarla eşleştir
+        pending_by_key = {title_key(title): title for title in pending}
+        for entry in entries:
+            # Tek film istendiğinde başlıksız cevap da o filme aittir
+            title = pending_by_key.get(title_key(entry["title"]), pending[0] if len(pending) == 1 else None)
+            if title and title not in details:
+                details[title] = {"description": entry["description"], "genres": entry["genres"]}
 
-        genre = match.group(1).strip()
-        description = match.group(2).strip()
+        pending = [title for title in pending if title not in details]
+        if not pending:
+            break
+    return details
 
-        return genre, description
-    except Exception as e:
-        print(f"🚨 Error while parsing OpenAI response: {e}")
-        raise ValueError("Error while parsing OpenAI response.") from e
+def _movie_details(movie_data: dict) -> dict:
+    # Genre'yi liste olarak al
+    genres = canonical_genres(movie_data.get("Genre", []))
+    return {
+        "description": movie_data.get("Description", ""),
+        "genre": genres
+    }
 
-def generate_details(movie_name: str) -> dict:
+async def generate_details(movie_name: str) -> dict:
     """
-    Check the database for movie details. If not found, generate them using OpenAI API and save to DB.
+    Check the cache and the database for movie details. If not found, generate them using OpenAI API and save to DB.
+    Concurrent requests for the same title share a single generation.
     """
     try:
-        print(f"Checking database for movie: {movie_name}")
+        # "the matrix (1999)" -> katalogdaki "The Matrix"
+        movie_name = title_index.resolve(movie_name)
+        cached = movie_cache.get(movie_name)
+        if cached is NEGATIVE:
+            logger.debug("Movie recently failed to generate, skipping OpenAI call", extra={"fields": {"movie": movie_name}})
+            return {"error": "Film detayları alınamadı"}
+        if cached is not MISS:
+            return _movie_details(cached)
+
+        logger.debug("Checking database for movie", extra={"fields": {"movie": movie_name}})
         # Önce database'de kontrol et
-        response = movies_table.get_item(
-            Key={"MovieName": movie_name}
-        )
+        movie_data = await _stored_movie(movie_name)
         
-        if "Item" in response:
-            print(f"Movie '{movie_name}' found in database")
-            movie_data = response["Item"]
-            # Genre'yi liste olarak al
-            genres = movie_data.get("Genre", [])
-            if isinstance(genres, set):
-                genres = list(genres)
-            return {
-                "description": movie_data.get("Description", ""),
-                "genre": genres
-            }
-
-        print(f"Movie '{movie_name}' not found in database, generating details...")
-        # Detayları generate et
-        prompt = (
-            f"Generate a detailed but spoiler-free description (2-3 sentences) and genre for the movie '{movie_name}'. "
-            f"Provide the output in this format: 'Genre: [genre1/genre2/genre3], Description: [description]'."
-        )
+        if movie_data:
+            logger.debug("Movie found in database", extra={"fields": {"movie": movie_name}})
+            movie_cache.set(movie_name, movie_data)
+            return _movie_details(movie_data)
 
-        response = call_openai_with_prompt(prompt, max_tokens=800)
-        if "error" in response:
-            print(f"Error generating details for {movie_name}: {response['error']}")
-            return {"error": "Film detayları alınamadı"}
+        # Aynı film için worker içinde tek bir üretim çalışır, diğerleri sonucu bekler
+        details = await details_singleflight.do(movie_name, lambda: _generate_details_with_lease(movie_name))
+        if details is None:
+            # Katıldığımız toplu zenginleştirme bu filmi üretmedi; tek başına üret
+            details = await details_singleflight.do(movie_name, lambda: _generate_details_with_lease(movie_name))
+        return details
+    except Exception:
+        logger.exception("Error in generate_details", extra={"fields": {"movie": movie_name}})
+        return {"error": "Film detayları alınamadı"}
 
-        content = response['choices'][0]['message']['content'].strip()
-        genre, description = parse_openai_response(response)
+async def _stored_movie(movie_name: str):
+    """
+    Movies row for the title, also under a spelling stored by another worker.
+    """
+    movie_data = await get_movie_record(movie_name)
+    if movie_data:
+        return movie_data
+    movie_data = await find_movie_by_title(movie_name)
+    if movie_data:
+        title_index.add(movie_data["MovieName"])
+    return movie_data
 
-        # Genre'ları liste olarak sakla
-        genres = [g.strip() for g in genre.split('/')]
+def _details_lease_key(movie_name: str) -> str:
+    # Normalize anahtar: farklı yazılışlar aynı lease'i paylaşır
+    return f"movie-details#{title_key(movie_name)}"
+
+@contextlib.asynccontextmanager
+async def _renewed_leases(lease_keys: list):
+    """
+    Keep this worker's movie-details leases alive while the body runs, so a
+    generation slower than DETAILS_LEASE_TTL (retries, a shortfall request)
+    is not taken over by a waiting worker.
+    """
+    async def renew():
+        while True:
+            await asyncio.sleep(DETAILS_LEASE_TTL / 3)
+            try:
+                if len(lease_keys) == 1:
+                    await acquire_lease(lease_keys[0], WORKER_ID, DETAILS_LEASE_TTL)
+                else:
+                    await acquire_leases(lease_keys, WORKER_ID, DETAILS_LEASE_TTL)
+                lease_stats["renewals"] += 1
+            except Exception as e:
+                lease_stats["renewal_errors"] += 1
+                logger.warning("Renewing movie-details leases failed: %s", e)
+
+    task = asyncio.create_task(renew())
+    try:
+        yield
+    finally:
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+async def _generate_details_with_lease(movie_name: str) -> dict:
+    """
+    Worker'lar arası tekilleştirme: lease'i alan worker üretir, diğerleri
+    Movies satırının oluşmasını bekler. Sahibi lease'i üretim boyunca
+    yeniler; bekleyen ancak lease düştüğünde (sahibi öldüğünde) devralır.
+    """
+    lease_key = _details_lease_key(movie_name)
+    if await acquire_lease(lease_key, WORKER_ID, DETAILS_LEASE_TTL):
+        return await _generate_under_lease(movie_name, lease_key)
+
+    lease_stats["waits"] += 1
+    # Yalnızca birincil anahtar okunur, aralık her turda ikiye katlanır
+    delay = DETAILS_POLL_INTERVAL
+    while True:
+        lease_expires = time.monotonic() + DETAILS_LEASE_TTL
+        while time.monotonic() < lease_expires:
+            await asyncio.sleep(min(delay, lease_expires - time.monotonic()))
+            delay = min(delay * 2, DETAILS_POLL_MAX_INTERVAL)
+            lease_stats["polls"] += 1
+            movie_data = await get_movie_record(movie_name)
+            if movie_data:
+                movie_cache.set(movie_name, movie_data)
+                return _movie_details(movie_data)
+
+        # Sahibi başka yazılışla kaydetmiş, bırakmış ya da ölmüş olabilir;
+        # lease hâlâ tutuluyorsa (yenileniyorsa) bir TTL daha bekle
+        movie_data = await _stored_movie(movie_name)
+        if movie_data:
+            movie_cache.set(movie_name, movie_data)
+            return _movie_details(movie_data)
+        if await acquire_lease(lease_key, WORKER_ID, DETAILS_LEASE_TTL):
+            lease_stats["takeovers"] += 1
+            return await _generate_under_lease(movie_name, lease_key)
+
+async def _generate_under_lease(movie_name: str, lease_key: str) -> dict:
+    try:
+        # Lease beklenirken başka bir worker üretmiş olabilir
+        movie_data = await _stored_movie(movie_name)
+        if movie_data:
+            movie_cache.set(movie_name, movie_data)
+            return _movie_details(movie_data)
+        async with _renewed_leases([lease_key]):
+            return await _generate_and_store_details(movie_name)
+    finally:
+        await release_lease(lease_key, WORKER_ID)
+
+async def _generate_and_store_details(movie_name: str) -> dict:
+    try:
+        logger.info("Movie not found in database, generating details", extra={"fields": {"movie": movie_name}})
+        # Detayları generate et
+        generated = (await request_movie_details([movie_name])).get(movie_name)
+        if not generated:
+            logger.warning("Error generating details", extra={"fields": {"movie": movie_name}})
+            movie_cache.set_negative(movie_name)
+            return {"error": "Film detayları alınamadı"}
+
+        description = generated["description"]
+        genres = generated["genres"]
 
         # Database'e kaydet
         movie_item = {
@@ -128,169 +303,355 @@ def generate_details(movie_name: str) -> dict:
             "Description": description,
             "Genre": genres  # Liste olarak kaydet
         }
-        movies_table.put_item(Item=movie_item)
-        print(f"Successfully generated and saved details for '{movie_name}'")
+        if not await put_movies([movie_item]):
+            # Başka bir worker aynı filmi farklı yazılışla kaydetmiş; GSI henüz
+            # yansıtmadıysa az önce üretilen detaylar kullanılır (negatif cache'e girmez)
+            movie_data = await _stored_movie(movie_name)
+            if movie_data:
+                movie_cache.set(movie_name, movie_data)
+                return _movie_details(movie_data)
+            return _movie_details(movie_item)
+        movie_cache.invalidate(movie_name)
+        movie_index.upsert_items([movie_item])
+        title_index.add(movie_name)
+        logger.info("Generated and saved movie details", extra={"fields": {"movie": movie_name}})
 
         return {
             "description": description,
             "genre": genres
         }
-    except Exception as e:
-        print(f"🚨 Error in generate_details for {movie_name}: {e}")
+    except Exception:
+        logger.exception("Error generating details", extra={"fields": {"movie": movie_name}})
+        movie_cache.set_negative(movie_name)
         return {"error": "Film detayları alınamadı"}
 
-def generate_movie_recommendations(user_id: str, partner_id: str, existing_recommendations: list = None) -> list:
+RECOMMENDATION_COUNT = int(os.getenv("RECOMMENDATION_COUNT", "5"))
+# Modelden fazladan istenecek aday sayısı (yerel elemeden sonra yetsin diye)
+RECOMMENDATION_OVERGENERATE = int(os.getenv("RECOMMENDATION_OVERGENERATE", "3"))
+RECOMMENDATION_MAX_REFILLS = int(os.getenv("RECOMMENDATION_MAX_REFILLS", "2"))
+# Prompt'a konacak en fazla geçmiş film sayısı; 0 tüm geçmişi gönderir
+EXCLUSION_PROMPT_LIMIT = int(os.getenv("EXCLUSION_PROMPT_LIMIT", "30"))
+
+exclusion_stats = {
+    "generations": 0,
+    "llm_calls": 0,
+    "candidates": 0,
+    "survivors": 0,
+    "prompt_tokens": 0,
+    "prompt_tokens_saved_estimate": 0,
+}
+
+
+def select_exclusion_slice(recent_titles: list, history: set) -> list:
     """
-    Generate movie recommendations based on two users' preferences from the database.
-    Returns a list of movie dictionaries with titles and genres.
+    Most recent previously recommended titles, bounded by EXCLUSION_PROMPT_LIMIT.
+    `recent_titles` is the newest-first Partners.Movies list.
     """
-    try:
-        # Get preferences from database
-        user_preferences = get_user_preferences(user_id)
-        partner_preferences = get_user_preferences(partner_id)
+    ordered = [title for title in dict.fromkeys(recent_titles) if title in history]
+    ordered += sorted(history.difference(ordered))
+    if EXCLUSION_PROMPT_LIMIT <= 0:
+        return ordered
+    return ordered[:EXCLUSION_PROMPT_LIMIT]
 
-        if "error" in user_preferences or "error" in partner_preferences:
-            raise ValueError("Kullanıcı tercihleri bulunamadı")
 
-        # Partners tablosundan daha önce önerilen tüm filmleri al
-        partners_table = dynamodb.Table('Partners')
-        previously_recommended = set()
-        
-        # Tüm önceki önerileri al
-        response = partners_table.scan()
-        for item in response.get("Items", []):
-            if "Movies" in item:
-                previously_recommended.update(item["Movies"])
-
-        print(f"Previously recommended movies: {previously_recommended}")
-
-        # Kullanıcı tercihlerini birleştir
-        all_genres = set()
-        all_movies = set()
-
-        # Add user preferences
-        if "Genre" in user_preferences:
-            all_genres.update(user_preferences["Genre"])
-        if "Movies" in user_preferences:
-            all_movies.update(user_preferences["Movies"])
-
-        # Add partner preferences
-        if "Genre" in partner_preferences:
-            all_genres.update(partner_preferences["Genre"])
-        if "Movies" in partner_preferences:
-            all_movies.update(partner_preferences["Movies"])
-
-        if not all_genres and not all_movies:
-            raise ValueError("Film tercihi bulunamadı")
-
-        # Prepare OpenAI API prompt
-        prompt = (
-            f"Based on these users' combined preferences, suggest 5 NEW movies that they might enjoy.\n\n"
-            f"Preferred genres: {', '.join(all_genres)}\n"
-            f"Previously liked movies: {', '.join(all_movies)}\n"
-            f"NEVER RECOMMEND these previously suggested movies: {', '.join(previously_recommended)}\n\n"
-            "The response should be in this exact format for each movie (one per line):\n"
-            "1. Movie Name: [name], Genre: [genre1/genre2/genre3]\n"
-            "2. ... (repeat for 5 movies)\n\n"
-            "IMPORTANT: You must suggest completely new movies that have never been recommended before. DO NOT suggest any movie from the 'NEVER RECOMMEND' list."
+def _record_exclusion_round(response, candidates: int, survivors: int, omitted_titles: set):
+    exclusion_stats["llm_calls"] += 1
+    exclusion_stats["candidates"] += candidates
+    exclusion_stats["survivors"] += survivors
+    exclusion_stats["prompt_tokens"] += response.get("usage", {}).get("prompt_tokens", 0)
+    if omitted_titles:
+        exclusion_stats["prompt_tokens_saved_estimate"] += estimate_tokens(", ".join(omitted_titles)) + 1
+
+
+def get_exclusion_stats() -> dict:
+    stats = dict(exclusion_stats)
+    stats["hit_rate"] = round(stats["survivors"] / stats["candidates"], 3) if stats["candidates"] else None
+    return stats
+
+
+async def load_recommendation_context(user_id: str, partner_id: str) -> dict:
+    """
+    Combined preferences, the pair's full recommendation history and the
+    bounded exclusion slice sent to the model.
+    """
+    # Get preferences from database
+    user_preferences = await get_user_preferences(user_id)
+    partner_preferences = await get_user_preferences(partner_id)
+
+    if "error" in user_preferences or "error" in partner_preferences:
+        raise ValueError("Kullanıcı tercihleri bulunamadı")
+
+    # Bu çifte daha önce önerilen filmler (tek anahtar okuması)
+    previously_recommended = await get_recommendation_history(user_id, partner_id)
+
+    logger.debug("Previously recommended movies", extra={"fields": {"movies": sorted(previously_recommended)}})
+
+    # Kullanıcı tercihlerini birleştir
+    all_genres = set()
+    all_movies = set()
+
+    # Add user preferences
+    if "Genre" in user_preferences:
+        all_genres.update(canonical_genres(user_preferences["Genre"]))
+    if "Movies" in user_preferences:
+        all_movies.update(user_preferences["Movies"])
+
+    # Add partner preferences
+    if "Genre" in partner_preferences:
+        all_genres.update(canonical_genres(partner_preferences["Genre"]))
+    if "Movies" in partner_preferences:
+        all_movies.update(partner_preferences["Movies"])
+
+    if not all_genres and not all_movies:
+        raise ValueError("Film tercihi bulunamadı")
+
+    # Prompt'a geçmişin tamamı yerine en yeni önerilerden sınırlı bir dilim konur;
+    # tekrarlar yerelde tam geçmişe karşı elenir
+    partner_record = await get_partner_record(user_id) or {}
+    exclusion_slice = select_exclusion_slice(partner_record.get("Movies", []), previously_recommended)
+
+    # Retrieval aşaması: katalogda tercihlere en yakın, daha önce önerilmemiş filmler
+    candidates = [
+        title for title, _ in movie_index.candidates_for(
+            all_genres, all_movies, k=RETRIEVAL_CANDIDATES, exclude=previously_recommended
         )
+    ] if RETRIEVAL_CANDIDATES > 0 else []
+
+    return {
+        "genres": all_genres,
+        "movies": all_movies,
+        "history": previously_recommended,
+        "exclusion_slice": exclusion_slice,
+        "candidates": candidates,
+        # Tür profilleri bitset olarak: aday filmleri iki partnere uyuma göre sıralamak için
+        "user_genre_bits": genre_bitset(user_preferences.get("Genre", [])),
+        "partner_genre_bits": genre_bitset(partner_preferences.get("Genre", []))
+    }
+
+def recommendation_messages(context: dict, requested: int, extra_exclusions: list = ()) -> list:
+    prompt_exclusions = context["exclusion_slice"] + list(extra_exclusions)
+    candidates_line = ""
+    if context.get("candidates"):
+        candidates_line = f"Candidate movies from our catalog that match these preferences (prefer them when they fit): {', '.join(context['candidates'])}\n\n"
+    prompt = (
+        f"Based on these users' combined preferences, suggest {requested} NEW movies that they might enjoy.\n\n"
+        f"Preferred genres: {', '.join(sorted(context['genres']))}\n"
+        f"Previously liked movies: {', '.join(sorted(context['movies']))}\n"
+        f"NEVER RECOMMEND these previously suggested movies: {', '.join(prompt_exclusions)}\n\n"
+        f"{candidates_line}"
+        f"Call {RECOMMENDATIONS_FUNCTION['name']} with exactly {requested} movies.\n\n"
+        "IMPORTANT: You must suggest completely new movies that have never been recommended before. DO NOT suggest any movie from the 'NEVER RECOMMEND' list."
+    )
+    return [
+        {
+            "role": "system", 
+            "content": "You are a movie recommendation assistant. You must NEVER recommend any movies that were previously suggested. Always suggest completely new movies."
+        },
+        {"role": "user", "content": prompt}
+    ]
+
+def rank_by_genre_fit(movies: list, context: dict) -> list:
+    """
+    Stable sort by genre compatibility with both partners (best first).
+    """
+    if len(movies) < 2:
+        return movies
+    scores = compatibility_scores(
+        [genre_bitset(movie["genres"]) for movie in movies],
+        context["user_genre_bits"],
+        context["partner_genre_bits"]
+    )
+    order = sorted(range(len(movies)), key=lambda i: -scores[i])
+    return [movies[i] for i in order]
+
+async def generate_movie_recommendations(user_id: str, partner_id: str, existing_recommendations: list = None) -> list:
+    """
+    Generate movie recommendations based on two users' preferences from the database.
+    Returns a list of movie dictionaries with titles and genres.
+    """
+    try:
+        context = await load_recommendation_context(user_id, partner_id)
+        previously_recommended = context["history"]
+        exclusion_slice = context["exclusion_slice"]
 
-        # Call OpenAI API with limited retries
-        max_retries = 5
-        for attempt in range(max_retries):
+        recommendations = []
+        # Geçmiş kontrolü normalize anahtarla: "the matrix" == "The Matrix (1999)"
+        seen = TitleSet(previously_recommended)
+        for round_number in range(RECOMMENDATION_MAX_REFILLS + 1):
+            shortfall = RECOMMENDATION_COUNT - len(recommendations)
+            if shortfall <= 0:
+                break
+            requested = shortfall + RECOMMENDATION_OVERGENERATE
             try:
-                response = openai.ChatCompletion.create(
+                response = await call_openai_with_retry(
+                    # Bu turda zaten seçilenleri de prompt'a ekle ki model tekrar etmesin
+                    recommendation_messages(context, requested, [movie["title"] for movie in recommendations]),
                     model="gpt-4",
-                    messages=[
-                        {
-                            "role": "system", 
-                            "content": "You are a movie recommendation assistant. You must NEVER recommend any movies that were previously suggested. Always suggest completely new movies."
-                        },
-                        {"role": "user", "content": prompt}
-                    ],
-                    max_tokens=300,
-                    temperature=0.7
+                    max_tokens=max(300, 40 * requested),
+                    temperature=0.7,
+                    call_type="recommendations",
+                    # Tamamlama turları taze örnekleme ister
+                    cache=round_number == 0,
+                    **function_call_kwargs(RECOMMENDATIONS_FUNCTION)
                 )
-                
-                if response and "choices" in response and len(response["choices"]) > 0:
-                    recommendations_text = response['choices'][0]['message']['content']
-                    
-                    # Parse the recommendations into a list of dictionaries
-                    recommendations = []
-                    for line in recommendations_text.strip().split('\n'):
-                        if not line.strip():
-                            continue
-                            
-                        try:
-                            # Remove the number prefix
-                            line = line.split('. ', 1)[1] if '. ' in line else line
-                            
-                            # Split into parts
-                            parts = line.split(', ')
-                            movie_name = parts[0].replace('Movie Name: ', '').strip()
-                            
-                            # Kesinlikle daha önce önerilmiş filmleri atlayalım
-                            if movie_name in previously_recommended:
-                                print(f"Skipping previously recommended movie: {movie_name}")
-                                continue
-                                
-                            genres = parts[1].replace('Genre: ', '').strip().split('/')
-                            genres = [g.strip() for g in genres]
-                            
-                            recommendations.append({
-                                'title': movie_name,
-                                'genres': genres
-                            })
-                        except Exception as parse_error:
-                            print(f"Error parsing movie line: {parse_error}")
-                            continue
-                    
-                    if recommendations:
-                        return recommendations
-                
-                print(f"Attempt {attempt + 1} failed: Invalid response format")
             except Exception as e:
-                print(f"Attempt {attempt + 1} failed: {str(e)}")
-            
-            if attempt < max_retries - 1:  # Don't sleep on the last attempt
-                time.sleep(2)  # Wait 2 seconds before retrying
-        
-        return []
-    except Exception as e:
-        print(f"Error in generate_movie_recommendations: {e}")
+                logger.error("OpenAI recommendation call failed: %s", e)
+                break
+
+            if round_number:
+                structured_stats["shortfall_requests"] += 1
+            candidates = [
+                {"title": title_index.resolve(entry["title"]), "genres": entry["genres"]}
+                for entry in parse_structured(response, required=("title",), expected=requested, call_type="recommendations")
+            ]
+            survivors = []
+            for movie in candidates:
+                if movie["title"] in seen:
+                    continue
+                seen.add(movie["title"])
+                survivors.append(movie)
+            # Fazladan üretilenler arasından iki partnere de en uygun olanları seç
+            recommendations.extend(rank_by_genre_fit(survivors, context)[:shortfall])
+
+            _record_exclusion_round(
+                response,
+                candidates=len(candidates),
+                survivors=len(survivors),
+                omitted_titles=previously_recommended.difference(exclusion_slice)
+            )
+            logger.info("Round %d: %d/%d candidates survived local filtering", round_number + 1, len(survivors), len(candidates))
+
+        exclusion_stats["generations"] += 1
+        return recommendations
+    except Exception:
+        logger.exception("Error in generate_movie_recommendations")
         return []
 
-async def generate_movie_details_async(movie_title: str, genres: list, movies_table):
+async def stream_movie_recommendations(user_id: str, partner_id: str):
     """
-    Generate movie details asynchronously and save to database
+    Async generator of new recommendations, each yielded as soon as its entry
+    is complete in the streamed response. Persisting the set is left to the caller.
     """
+    context = await load_recommendation_context(user_id, partner_id)
+    requested = RECOMMENDATION_COUNT + RECOMMENDATION_OVERGENERATE
+    seen = TitleSet(context["history"])
+    parser = StreamingEntryParser(required=("title",), call_type="recommendations_stream")
+    candidates = 0
+    delivered = 0
+
+    stream = stream_chat_completion(
+        recommendation_messages(context, requested),
+        model="gpt-4",
+        max_tokens=max(300, 40 * requested),
+        temperature=0.7,
+        call_type="recommendations_stream",
+        **function_call_kwargs(RECOMMENDATIONS_FUNCTION)
+    )
     try:
-        # Önce database'de kontrol et
-        response = movies_table.get_item(
-            Key={"MovieName": movie_title}
+        async for delta in stream:
+            for entry in parser.feed(delta):
+                candidates += 1
+                title = title_index.resolve(entry["title"])
+                if title in seen:
+                    continue
+                seen.add(title)
+                delivered += 1
+                yield {"title": title, "genres": entry["genres"]}
+                if delivered >= RECOMMENDATION_COUNT:
+                    return
+    finally:
+        await stream.aclose()
+        parser.close()
+        _record_exclusion_round(
+            {},
+            candidates=candidates,
+            survivors=delivered,
+            omitted_titles=context["history"].difference(context["exclusion_slice"])
         )
-        
-        if "Item" in response:
-            print(f"Movie details already exist for {movie_title}")
+        exclusion_stats["generations"] += 1
+
+async def enrich_recommendation_set(movies: list):
+    """
+    Generate and save details for a whole recommendation set: one batch read to
+    skip titles already in the catalog, one structured LLM request for the rest
+    (re-requesting only titles it left out) and one batch_writer flush.
+
+    Titles being enriched hold the same movie-details lease as
+    generate_details (taken and released with one transactional write each)
+    and are registered with details_singleflight, so a concurrent
+    /movie-details request waits for this batch instead of generating the
+    title again. Titles another worker is already generating are skipped.
+    """
+    try:
+        recommended_genres = {movie["title"]: list(movie.get("genres", [])) for movie in movies}
+        # Katalogdaki kanonik isimlerle tek BatchGetItem; eşleşme normalize anahtarla
+        catalog_names = {title: title_index.resolve(title) for title in recommended_genres}
+        existing, _ = await batch_get_movies(list(set(catalog_names.values())))
+        stored_keys = {title_key(name) for name in existing}
+        missing = [
+            title for title in recommended_genres
+            if title_key(catalog_names[title]) not in stored_keys and not details_singleflight.running(title)
+        ]
+        if not missing:
+            logger.debug("All recommended movies already have details or are being generated")
             return
-            
-        # Detayları generate et
-        details = generate_details(movie_title)
-        if "error" in details:
-            print(f"Error generating details for {movie_title}: {details['error']}")
+        lease_titles = {_details_lease_key(title): title for title in missing}
+        leased = [lease_titles[key] for key in await acquire_leases(list(lease_titles), WORKER_ID, DETAILS_LEASE_TTL)]
+        if not leased:
+            logger.debug("All recommended movies already have details or are being generated")
             return
-            
-        # Genre'yi liste olarak kaydet
-        if isinstance(genres, set):
-            genres = list(genres)
-            
-        # Database'e kaydet
-        movies_table.put_item(Item={
-            "MovieName": movie_title,
-            "Description": details.get("description", ""),
-            "Genre": genres  # Liste olarak kaydet
-        })
-        print(f"Successfully generated and saved details for {movie_title}")
+
+        batch = asyncio.ensure_future(_enrich_batch(leased, recommended_genres))
+        for title in leased:
+            details_singleflight.adopt(title, _enriched_details(batch, title))
+        items = await asyncio.shield(batch)
+        # Cevapta eksik kalan filmler /movie-details ile istendiğinde üretilir
+        logger.info("Enriched %d/%d movies", len(items), len(missing))
     except Exception as e:
-        print(f"Error in generate_movie_details_async for {movie_title}: {e}")
-        return
+        logger.exception("Error in enrich_recommendation_set: %s", e)
+
+async def _enrich_batch(titles: list, recommended_genres: dict) -> dict:
+    """
+    Generate `titles`, whose leases the caller holds, renewing the leases
+    until the batch is stored; returns {title: Movies item} for the titles generated.
+    """
+    try:
+        async with _renewed_leases([_details_lease_key(title) for title in titles]):
+            return await _generate_batch(titles, recommended_genres)
+    finally:
+        await release_leases([_details_lease_key(title) for title in titles], WORKER_ID)
+
+async def _generate_batch(titles: list, recommended_genres: dict) -> dict:
+    """
+    One LLM request and one batch write for `titles`.
+    """
+    generated = await request_movie_details(titles)
+    items = {}
+    for title, entry in generated.items():
+        if title not in recommended_genres:
+            continue
+        items[title] = {
+            "MovieName": title,
+            "Description": entry["description"],
+            "Genre": recommended_genres[title] or entry["genres"]  # Liste olarak kaydet
+        }
+    if items:
+        # Başlıklar enrich_recommendation_set'te katalogla eşleştirildi
+        items = {item["MovieName"]: item for item in await put_movies(list(items.values()), skip_lookup=True)}
+        for title in items:
+            movie_cache.invalidate(title)
+            title_index.add(title)
+        movie_index.upsert_items(list(items.values()))
+    return items
+
+async def _enriched_details(batch: asyncio.Task, title: str):
+    """
+    Result of the batch for one title, as generate_details returns it;
+    None when the batch failed or left the title out.
+    """
+    try:
+        items = await asyncio.shield(batch)
+    except Exception:
+        return None
+    item = items.get(title)
+    return _movie_details(item) if item else None
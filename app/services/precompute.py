@@ -0,0 +1,189 @@
+"""
+Keeps a ready-to-serve recommendation batch for every active pair.
+
+A batch is generated ahead of time and stored in the RecommendationBuffer
+table, so /generate-recommendations can usually answer from it instead of
+waiting for the LLM. A pair is refilled when its batch is consumed, when
+either partner changes preferences, and by a periodic sweep that catches
+pairs left without a batch (a failed refill, a restarted worker). Only pairs
+that took a batch or changed preferences within PRECOMPUTE_ACTIVE_WINDOW are
+swept, and only one worker sweeps per interval (Leases row). A lease row
+also keeps several workers from generating the same pair's batch at once,
+and the buffer row's Generation
+(bumped on every invalidation, by any worker) makes a refill that started
+before an invalidation discard its stale batch.
+"""
+import os
+import time
+import asyncio
+import logging
+from app.services.async_crud import (
+    get_user, get_recommendation_history, put_recommendation_buffer, take_recommendation_buffer,
+    invalidate_recommendation_buffer, get_recommendation_buffer_generation,
+    list_pairs_to_refill, acquire_lease, release_lease
+)
+from app.services.crud import pair_id
+from app.services.titles import TitleSet
+from app.services.openai_integration import generate_movie_recommendations, WORKER_ID
+
+logger = logging.getLogger(__name__)
+
+PRECOMPUTE_ENABLED = os.getenv("PRECOMPUTE_ENABLED", "true").lower() == "true"
+PRECOMPUTE_CONCURRENCY = int(os.getenv("PRECOMPUTE_CONCURRENCY", "2"))
+# Art arda yapılan tercih değişikliklerini tek bir üretimde birleştir
+PRECOMPUTE_DEBOUNCE = float(os.getenv("PRECOMPUTE_DEBOUNCE", "10"))
+PRECOMPUTE_SWEEP_INTERVAL = float(os.getenv("PRECOMPUTE_SWEEP_INTERVAL", "900"))
+PRECOMPUTE_BUFFER_TTL = int(os.getenv("PRECOMPUTE_BUFFER_TTL", str(7 * 24 * 3600)))
+PRECOMPUTE_LEASE_TTL = int(os.getenv("PRECOMPUTE_LEASE_TTL", "120"))
+# Sweep yalnızca bu süre içinde set tüketmiş ya da tercih değiştirmiş çiftleri doldurur
+PRECOMPUTE_ACTIVE_WINDOW = int(os.getenv("PRECOMPUTE_ACTIVE_WINDOW", str(3 * 24 * 3600)))
+SWEEP_LEASE_KEY = "precompute#sweep"
+
+
+class RecommendationPrecomputer:
+    def __init__(self, concurrency: int = PRECOMPUTE_CONCURRENCY, debounce: float = PRECOMPUTE_DEBOUNCE):
+        self.concurrency = concurrency
+        self.debounce = debounce
+        self._pending = {}  # pair_id -> (user_id, partner_id, due_at)
+        self._running = set()  # pair_ids being generated
+        self._tasks = []
+        self._refills = set()
+        self._semaphore = None
+        self._counters = {
+            "buffer_hits": 0,
+            "buffer_misses": 0,
+            "batches_generated": 0,
+            "batches_discarded": 0,
+            "generation_failures": 0,
+            "invalidations": 0,
+            "sweeps": 0,
+            "swept_pairs": 0,
+        }
+
+    async def start(self):
+        if not PRECOMPUTE_ENABLED:
+            return
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._tasks = [asyncio.create_task(self._dispatch_loop()), asyncio.create_task(self._sweep_loop())]
+
+    async def stop(self):
+        tasks = self._tasks + list(self._refills)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = []
+
+    def schedule(self, user_id: str, partner_id: str, delay: float = 0):
+        if not self._tasks:
+            return
+        key = pair_id(user_id, partner_id)
+        due_at = time.monotonic() + delay
+        pending = self._pending.get(key)
+        # Daha geç bir zamana ertele (debounce), öne çekme
+        if pending is None or pending[2] < due_at:
+            self._pending[key] = (user_id, partner_id, due_at)
+
+    async def take(self, user_id: str, partner_id: str):
+        """
+        Consume the pair's buffered batch and schedule the next one.
+        Returns the movies not recommended since the batch was built, or None.
+        """
+        movies = await take_recommendation_buffer(user_id, partner_id, PRECOMPUTE_BUFFER_TTL) if PRECOMPUTE_ENABLED else None
+        if not movies:
+            self._counters["buffer_misses"] += 1
+            return None
+
+        self.schedule(user_id, partner_id)
+        # Batch hazırlandıktan sonra başka yoldan (SSE, /docs) önerilmiş olabilir
+        history = TitleSet(await get_recommendation_history(user_id, partner_id))
+        movies = [movie for movie in movies if movie["title"] not in history]
+        if not movies:
+            self._counters["buffer_misses"] += 1
+            return None
+        self._counters["buffer_hits"] += 1
+        return movies
+
+    async def preferences_changed(self, user_id: str):
+        """
+        Drop the pair's batch (it reflects old preferences) and rebuild it.
+        """
+        if not PRECOMPUTE_ENABLED:
+            return
+        user_data = await get_user(user_id)
+        partner_id = user_data.get("partner_id") if user_data else None
+        if not partner_id:
+            return
+        await self.invalidate(user_id, partner_id)
+        self.schedule(user_id, partner_id, delay=self.debounce)
+
+    async def invalidate(self, user_id: str, partner_id: str, active: bool = True):
+        """
+        Drop the pair's batch; active=False (the pair ended) also stops refilling it.
+        """
+        if not PRECOMPUTE_ENABLED:
+            return
+        self._counters["invalidations"] += 1
+        if not active:
+            self._pending.pop(pair_id(user_id, partner_id), None)
+        await invalidate_recommendation_buffer(user_id, partner_id, PRECOMPUTE_BUFFER_TTL, active)
+
+    async def _dispatch_loop(self):
+        while True:
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for key, (user_id, partner_id, due_at) in list(self._pending.items()):
+                if due_at <= now and key not in self._running:
+                    del self._pending[key]
+                    self._running.add(key)
+                    task = asyncio.create_task(self._refill(key, user_id, partner_id))
+                    self._refills.add(task)
+                    task.add_done_callback(self._refills.discard)
+
+    async def _sweep_loop(self):
+        while True:
+            try:
+                # Lease bırakılmaz: aralık boyunca başka worker taramaz
+                if await acquire_lease(SWEEP_LEASE_KEY, WORKER_ID, int(PRECOMPUTE_SWEEP_INTERVAL)):
+                    pairs = await list_pairs_to_refill(time.time() - PRECOMPUTE_ACTIVE_WINDOW)
+                    for user_id, partner_id in pairs:
+                        self.schedule(user_id, partner_id)
+                    self._counters["sweeps"] += 1
+                    self._counters["swept_pairs"] += len(pairs)
+            except Exception:
+                logger.exception("Recommendation precompute sweep failed")
+            await asyncio.sleep(PRECOMPUTE_SWEEP_INTERVAL)
+
+    async def _refill(self, key: str, user_id: str, partner_id: str):
+        lease_key = f"precompute#{key}"
+        try:
+            async with self._semaphore:
+                if not await acquire_lease(lease_key, WORKER_ID, PRECOMPUTE_LEASE_TTL):
+                    # Başka bir worker bu çifti üretiyor
+                    return
+                try:
+                    generation = await get_recommendation_buffer_generation(user_id, partner_id)
+                    movies = await generate_movie_recommendations(user_id, partner_id)
+                    if not movies:
+                        self._counters["generation_failures"] += 1
+                        return
+                    if not await put_recommendation_buffer(user_id, partner_id, movies, PRECOMPUTE_BUFFER_TTL, generation):
+                        # Üretim sırasında (herhangi bir worker'da) tercihler değişti; yeni üretim zaten planlandı
+                        self._counters["batches_discarded"] += 1
+                        return
+                    self._counters["batches_generated"] += 1
+                finally:
+                    await release_lease(lease_key, WORKER_ID)
+        except Exception:
+            self._counters["generation_failures"] += 1
+            logger.exception("Precomputing recommendations failed", extra={"fields": {"pair": key}})
+        finally:
+            self._running.discard(key)
+
+    def stats(self) -> dict:
+        stats = dict(self._counters)
+        stats["enabled"] = PRECOMPUTE_ENABLED
+        stats["pending"] = len(self._pending)
+        stats["running"] = len(self._running)
+        served = stats["buffer_hits"] + stats["buffer_misses"]
+        stats["hit_rate"] = round(stats["buffer_hits"] / served, 3) if served else None
+        return stats
@@ -0,0 +1,51 @@
+"""
+Per-key single-flight de-duplication for coroutines.
+
+While a call for a key is running, later callers for the same key await
+that call's result instead of starting their own. The shared call runs in
+its own task, so a caller that is cancelled (e.g. its client disconnected)
+never cancels the work the other callers are waiting for.
+"""
+import asyncio
+
+
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}  # key -> asyncio.Task
+        self.stats = {"leaders": 0, "coalesced": 0}
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
+
+    def running(self, key) -> bool:
+        return key in self._inflight
+
+    async def do(self, key, func):
+        """
+        Run `await func()` once per key at a time and share its outcome.
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            self.stats["coalesced"] += 1
+        else:
+            task = self.adopt(key, func())
+        # shield: iptal edilen çağıran ortak işi iptal etmez
+        return await asyncio.shield(task)
+
+    def adopt(self, key, awaitable) -> asyncio.Task:
+        """
+        Register work started elsewhere (e.g. one batch call covering many
+        keys) as the in-flight call for `key`; later do() calls join it.
+        """
+        task = asyncio.ensure_future(awaitable)
+        self._inflight[key] = task
+        self.stats["leaders"] += 1
+        task.add_done_callback(lambda done: self._forget(key, done))
+        return task
+
+    def _forget(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            # Kimse beklemiyorsa "exception was never retrieved" uyarısı çıkmasın
+            task.exception()
@@ -0,0 +1,198 @@
+"""
+Structured JSON logging.
+
+Modules log through the standard library (logging.getLogger(__name__)).
+setup_logging() routes the "app" logger tree through a QueueHandler: the
+calling thread only renders the message and enqueues the record, and a
+QueueListener thread serializes it to JSON and writes it to stdout, so
+request handlers never block on stdout. When the queue is full, records
+are dropped and counted instead of blocking.
+
+Every record carries the current request ID (set by the request-ID
+middleware in main.py). Sensitive fields (passwords, tokens, secrets,
+cookies, API keys) are redacted from structured fields and from message
+text. Large payloads belong in extra={"fields": {...}} at debug level.
+Field names are merged into the JSON record; names the formatter writes
+itself (ts, level, message, ...) are kept under a nested "fields" key.
+
+LOG_LEVEL sets the default level; LOG_LEVELS overrides per module, e.g.
+"app.services.crud=DEBUG,app.services.openai_integration=WARNING".
+"""
+import os
+import re
+import sys
+import json
+import queue
+import atexit
+import logging
+import threading
+import contextvars
+import logging.handlers
+from datetime import datetime, timezone
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+REDACTED = "***"
+# prompt_tokens/completion_tokens gibi sayaçlar maskelenmez
+_SENSITIVE_KEY = re.compile(
+    r"passw(or)?d|passphrase|secret|^(access_|refresh_|id_|session_)?token$|authorization|cookie|api[_-]?key|credential",
+    re.IGNORECASE
+)
+_SENSITIVE_TEXT = [
+    # JWT
+    re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+"),
+    # OpenAI anahtarları
+    re.compile(r"sk-[A-Za-z0-9_-]{16,}"),
+    # Authorization başlığındaki (JWT olmayan) taşıyıcı token'lar
+    re.compile(r"(?P<key>\bBearer\s+)(?P<value>\S+)", re.IGNORECASE),
+    # password=..., SECRET_KEY=..., "access_token": "..." gibi anahtar/değer çiftleri;
+    # prompt_tokens gibi sayaçlar maskelenmez
+    re.compile(
+        r"""(?P<key>["']?[\w-]*(?:password|secret|token(?!s\b)|api[_-]?key)[\w-]*["']?\s*[:=]\s*)(?P<value>"[^"]*"|'[^']*'|[^\s,;}]+)""",
+        re.IGNORECASE
+    ),
+]
+
+# JsonFormatter'ın kendi yazdığı anahtarlar
+_RESERVED_FIELDS = {"ts", "level", "logger", "message", "request_id", "exception", "fields"}
+
+_request_id = contextvars.ContextVar("request_id", default=None)
+_listener = None
+_lock = threading.Lock()
+_dropped = 0
+
+
+def set_request_id(request_id):
+    return _request_id.set(request_id)
+
+
+def get_request_id():
+    return _request_id.get()
+
+
+def redact(value, depth: int = 0):
+    """
+    Copy of `value` with sensitive dict keys and secrets in strings masked.
+    """
+    if depth > 8:
+        return value
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if _SENSITIVE_KEY.search(str(key)) else redact(item, depth + 1)
+            for key, item in value.items()
+        }
+    if isinstance(value, (list, tuple, set)):
+        return [redact(item, depth + 1) for item in value]
+    if isinstance(value, str):
+        return redact_text(value)
+    return value
+
+
+def redact_text(text: str) -> str:
+    text = _SENSITIVE_TEXT[0].sub(REDACTED, text)
+    text = _SENSITIVE_TEXT[1].sub(REDACTED, text)
+    text = _SENSITIVE_TEXT[2].sub(lambda match: match.group("key") + REDACTED, text)
+    return _SENSITIVE_TEXT[3].sub(lambda match: match.group("key") + REDACTED, text)
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": redact_text(record.getMessage()),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        fields = getattr(record, "fields", None)
+        if fields:
+            fields = redact(fields)
+            # Kaydın kendi alanlarını (ts, level, message, ...) ezmesin; çakışanlar "fields" altına
+            clashing = {key: fields.pop(key) for key in list(fields) if key in _RESERVED_FIELDS}
+            entry.update(fields)
+            if clashing:
+                entry["fields"] = clashing
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exception"] = redact_text(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class _NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Çağıran thread'de sadece mesaj ve traceback metni hazırlanır; JSON listener'da
+        record = logging.makeLogRecord(record.__dict__)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = _request_id.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with _lock:
+                _dropped += 1
+
+
+def _module_levels() -> dict:
+    levels = {}
+    for entry in LOG_LEVELS.split(","):
+        name, _, level = entry.partition("=")
+        if name.strip() and level.strip():
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def setup_logging():
+    """
+    Install the queue-based JSON pipeline on the "app" logger. Idempotent.
+    """
+    global _listener
+    with _lock:
+        if _listener is not None:
+            return
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+        stream = logging.StreamHandler(sys.stdout)
+        stream.setFormatter(JsonFormatter())
+        _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+        _listener.start()
+
+    logger = logging.getLogger("app")
+    logger.handlers = [_NonBlockingQueueHandler(log_queue)]
+    logger.setLevel(LOG_LEVEL)
+    logger.propagate = False
+    for name, level in _module_levels().items():
+        logging.getLogger(name).setLevel(level)
+    atexit.register(shutdown_logging)
+
+
+def shutdown_logging():
+    """
+    Flush queued records and stop the writer thread.
+    """
+    global _listener
+    with _lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+
+def get_logging_stats() -> dict:
+    with _lock:
+        listener = _listener
+        dropped = _dropped
+    return {
+        "level": LOG_LEVEL,
+        "queued": listener.queue.qsize() if listener is not None else 0,
+        "dropped": dropped,
+    }
@@ -0,0 +1,283 @@
+"""
+Structured (function-calling) output for LLM responses.
+
+The model is asked to call a function with a declared JSON schema. The
+parser is tolerant: it keeps every valid entry of a partially malformed or
+truncated response, so a single bad entry no longer throws away the whole
+answer and costs another request.
+"""
+import json
+import re
+from app.services.genres import canonical_genres
+from app.services.metrics import Counter
+
+RECOMMENDATIONS_FUNCTION = {
+    "name": "submit_recommendations",
+    "description": "Submit the recommended movies.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "movies": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "title": {"type": "string"},
+                        "genres": {"type": "array", "items": {"type": "string"}},
+                    },
+                    "required": ["title", "genres"],
+                },
+            }
+        },
+        "required": ["movies"],
+    },
+}
+
+MOVIE_DETAILS_FUNCTION = {
+    "name": "submit_movie_details",
+    "description": "Submit a spoiler-free description and the genres of each movie.",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "movies": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "title": {"type": "string"},
+                        "genres": {"type": "array", "items": {"type": "string"}},
+                        "description": {"type": "string"},
+                    },
+                    "required": ["title", "genres", "description"],
+                },
+            }
+        },
+        "required": ["movies"],
+    },
+}
+
+structured_stats = {
+    "responses": 0,
+    "fully_valid": 0,
+    # Malformed responses from which at least one entry was kept
+    "salvaged": 0,
+    # Salvaged responses that still covered everything requested
+    "salvage_avoided_retry": 0,
+    # Responses with nothing usable
+    "wasted": 0,
+    "entries_kept": 0,
+    "entries_dropped": 0,
+    "shortfall_requests": 0,
+}
+
+STRUCTURED_RESPONSES = Counter(
+    "llm_structured_responses_total",
+    "Parsed responses: fully_valid, salvaged (partly usable) or wasted (nothing usable).",
+    ("call_type", "outcome")
+)
+STRUCTURED_ENTRIES = Counter("llm_structured_entries_total", "Parsed entries kept or dropped.", ("call_type", "result"))
+
+_decoder = json.JSONDecoder()
+
+
+def function_call_kwargs(function: dict) -> dict:
+    """
+    Extra ChatCompletion arguments that force a call to `function`.
+    """
+    return {"functions": [function], "function_call": {"name": function["name"]}}
+
+
+def response_payload(response) -> str:
+    """
+    Function-call arguments if the model called the function, else the message text.
+    """
+    message = response['choices'][0]['message']
+    function_call = message.get("function_call")
+    if function_call and function_call.get("arguments"):
+        return function_call["arguments"]
+    return message.get("content") or ""
+
+
+def _legacy_lines(text: str) -> list:
+    """
+    Fallback for 'N. Movie Name: [name], Genre: [g1/g2]' and
+    'Genre: [g1/g2], Description: [text]' style answers.
+    """
+    entries = []
+    for line in text.strip().split('\n'):
+        match = re.match(r"\s*(?:\d+\.\s*)?Movie Name:\s*(.+?),\s*Genre:\s*(.+)$", line)
+        if match:
+            entries.append({"title": match.group(1).strip(), "genres": match.group(2).split('/')})
+    if not entries:
+        match = re.search(r"Genre:\s*(.+?),?\s*Description:\s*(.+)", text, re.DOTALL)
+        if match:
+            entries.append({"genres": match.group(1).split('/'), "description": match.group(2).strip()})
+    return entries
+
+
+def extract_entries(text: str):
+    """
+    Pull entry objects out of a possibly malformed JSON payload.
+    Returns (entries, well_formed).
+    """
+    try:
+        payload = json.loads(text)
+        if isinstance(payload, dict):
+            payload = payload.get("movies", [payload])
+        if isinstance(payload, list):
+            return [entry for entry in payload if isinstance(entry, dict)], True
+    except ValueError:
+        pass
+
+    # Salvage: decode every complete innermost object that looks like an entry
+    entries = []
+    index = text.find('{')
+    while index != -1:
+        try:
+            value, end = _decoder.raw_decode(text, index)
+        except ValueError:
+            value, end = None, index + 1
+        if isinstance(value, dict) and "movies" not in value:
+            entries.append(value)
+            index = text.find('{', end)
+        else:
+            index = text.find('{', index + 1)
+
+    if not entries:
+        entries = _legacy_lines(text)
+    return entries, False
+
+
+def _clean_genres(genres) -> list:
+    if isinstance(genres, str):
+        genres = [genres.strip("[]")]
+    if not isinstance(genres, list):
+        return []
+    return canonical_genres(str(g).strip().strip("[]").strip() for g in genres)
+
+
+def validate_entries(entries: list, required: tuple) -> list:
+    """
+    Normalize entries and keep only those with every required field present.
+    """
+    valid = []
+    for entry in entries:
+        cleaned = {
+            "title": str(entry.get("title", "")).strip(),
+            "genres": _clean_genres(entry.get("genres", entry.get("genre", []))),
+            "description": str(entry.get("description", "")).strip(),
+        }
+        if all(cleaned.get(field) for field in required):
+            valid.append(cleaned)
+    return valid
+
+
+def parse_structured(response, required: tuple, expected: int = None, call_type: str = "other") -> list:
+    """
+    Parse a function-calling response into validated entries, recording how
+    often salvaging a malformed response made a re-request unnecessary.
+    """
+    entries, well_formed = extract_entries(response_payload(response))
+    valid = validate_entries(entries, required)
+
+    if not valid:
+        outcome = "wasted"
+    elif well_formed and len(valid) == len(entries):
+        outcome = "fully_valid"
+    else:
+        outcome = "salvaged"
+        if expected is None or len(valid) >= expected:
+            structured_stats["salvage_avoided_retry"] += 1
+    _record_outcome(call_type, outcome, len(valid), len(entries) - len(valid))
+    return valid
+
+
+def _record_outcome(call_type: str, outcome: str, kept: int, dropped: int):
+    # /internal/stats ve /metrics aynı outcome değerinden sayılır
+    structured_stats["responses"] += 1
+    structured_stats[outcome] += 1
+    structured_stats["entries_kept"] += kept
+    structured_stats["entries_dropped"] += dropped
+    STRUCTURED_RESPONSES.inc(call_type=call_type, outcome=outcome)
+    STRUCTURED_ENTRIES.inc(kept, call_type=call_type, result="kept")
+    STRUCTURED_ENTRIES.inc(dropped, call_type=call_type, result="dropped")
+
+
+def _object_end(text: str, start: int) -> int:
+    """
+    Index just past the brace closing the object opened at `start`, or -1
+    if the text ends first. String contents are skipped.
+    """
+    depth = 0
+    in_string = escaped = False
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == '{':
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                return index + 1
+    return -1
+
+
+class StreamingEntryParser:
+    """
+    Incremental counterpart of extract_entries for streamed payloads: every
+    feed() returns the entries whose JSON object has just been completed.
+    """
+
+    def __init__(self, required: tuple, call_type: str = "other"):
+        self.required = required
+        self.call_type = call_type
+        self.buffer = ""
+        self.position = 0
+        self.kept = 0
+        self.dropped = 0
+
+    def feed(self, text: str) -> list:
+        self.buffer += text
+        entries = []
+        while True:
+            index = self.buffer.find('{', self.position)
+            if index == -1:
+                break
+            # Skip the {"movies": [...]} wrapper; only entries are decoded
+            if self.buffer[index + 1:].lstrip().startswith('"movies"'):
+                self.position = index + 1
+                continue
+            try:
+                value, end = _decoder.raw_decode(self.buffer, index)
+            except ValueError:
+                if _object_end(self.buffer, index) == -1:
+                    # Object not complete yet (or wrapper prefix still arriving)
+                    break
+                # Closed but malformed: drop it and resume at the next '{'
+                self.dropped += 1
+                self.position = index + 1
+                continue
+            self.position = end
+            if isinstance(value, dict):
+                entries.append(value)
+
+        valid = validate_entries(entries, self.required)
+        self.kept += len(valid)
+        self.dropped += len(entries) - len(valid)
+        return valid
+
+    def close(self):
+        outcome = "wasted" if not self.kept else ("salvaged" if self.dropped else "fully_valid")
+        _record_outcome(self.call_type, outcome, self.kept, self.dropped)
+
+
+def get_structured_stats() -> dict:
+    return dict(structured_stats)
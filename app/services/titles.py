@@ -0,0 +1,158 @@
+"""
+Movie title normalization and alias index.
+
+Movies rows are keyed by the exact title string, so "The Matrix",
+"the matrix" and "The Matrix (1999)" used to be three catalog misses, three
+GPT calls and three rows, and slipped past the previously-recommended check.
+
+title_key() reduces a title to a comparison key (case, accents,
+punctuation, leading/trailing articles); a bracketed release year stays in
+the key, so "Dune (1984)" and "Dune (2021)" remain different films. A title
+without a year matches any stored title with the same name; a title with a
+year only matches the same year or a stored title without one.
+
+TitleIndex maps keys to the MovieName already stored in the catalog, so
+every incoming title can be resolved to that canonical name before a Movies
+lookup or a history check. The index is per process; Movies rows also carry
+TitleKey/TitleBase attributes (see crud.find_movie_by_title) so a worker can
+find titles another worker stored.
+"""
+import re
+import threading
+import unicodedata
+
+# Sadece parantez içindeki yıl: "Blade Runner 2049" başlığın parçası
+_YEAR = re.compile(r"[\(\[]\s*(?:18|19|20)\d{2}\s*[\)\]]")
+_ARTICLES = ("the ", "a ", "an ")
+_TRAILING_ARTICLE = re.compile(r",\s*(?:the|a|an)$")
+
+
+def title_year(title: str):
+    """
+    Bracketed release year of a title ('Dune (2021)' -> '2021'), or None.
+    """
+    match = _YEAR.search(str(title))
+    return re.sub(r"\D", "", match.group()) if match else None
+
+
+def base_title_key(title: str) -> str:
+    """
+    Comparison key without the year: 'The Matrix (1999)', 'the matrix' and 'Matrix, The' -> 'matrix'.
+    """
+    text = unicodedata.normalize("NFKD", str(title)).encode("ascii", "ignore").decode("ascii")
+    text = text.lower().strip()
+    text = _YEAR.sub(" ", text).strip()
+    text = _TRAILING_ARTICLE.sub("", text)
+    text = text.replace("&", " and ")
+    text = re.sub(r"[^a-z0-9]+", " ", text).strip()
+    for article in _ARTICLES:
+        # "A" tek başına başlık olabilir ("Us", "It" gibi), sadece önekse sil
+        if text.startswith(article) and len(text) > len(article):
+            text = text[len(article):]
+            break
+    # Alfabe dışı başlıklar (ör. sadece Japonca) boş anahtara düşmesin
+    return text or str(title).strip().lower()
+
+
+def title_key(title: str) -> str:
+    """
+    Comparison key with the year kept: 'The Matrix (1999)' -> 'matrix 1999', 'the matrix' -> 'matrix'.
+    """
+    year = title_year(title)
+    base = base_title_key(title)
+    return f"{base} {year}" if year else base
+
+
+def match_title(title: str, candidates):
+    """
+    First of `candidates` (titles with the same base_title_key) that is the
+    same film as `title`, or None.
+    """
+    year = title_year(title)
+    for candidate in candidates:
+        candidate_year = title_year(candidate)
+        if year is None or candidate_year is None or candidate_year == year:
+            return candidate
+    return None
+
+
+class TitleSet:
+    """
+    Set of titles with match_title() membership, for history checks.
+    """
+    def __init__(self, titles=()):
+        self._titles = {}  # base_title_key -> titles
+        for title in titles:
+            self.add(title)
+
+    def add(self, title: str):
+        self._titles.setdefault(base_title_key(title), []).append(title)
+
+    def __contains__(self, title) -> bool:
+        return match_title(title, self._titles.get(base_title_key(title), ())) is not None
+
+
+class TitleIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._canonical = {}  # base_title_key -> stored MovieNames
+        self._stats = {"lookups": 0, "exact_hits": 0, "alias_hits": 0, "misses": 0}
+
+    def __len__(self):
+        return sum(len(names) for names in self._canonical.values())
+
+    def add(self, movie_name: str):
+        """
+        Register a stored MovieName; the first name seen for a key stays canonical.
+        """
+        with self._lock:
+            self._add(self._canonical, movie_name)
+
+    @staticmethod
+    def _add(canonical: dict, movie_name: str):
+        names = canonical.setdefault(base_title_key(movie_name), [])
+        key = title_key(movie_name)
+        if all(title_key(name) != key for name in names):
+            names.append(movie_name)
+
+    def build(self, movie_names):
+        canonical = {}
+        for name in movie_names:
+            self._add(canonical, name)
+        with self._lock:
+            self._canonical = canonical
+
+    def match(self, title: str):
+        """
+        Stored MovieName equivalent to `title`, or None.
+        """
+        with self._lock:
+            return match_title(title, list(self._canonical.get(base_title_key(title), ())))
+
+    def resolve(self, title: str) -> str:
+        """
+        Stored MovieName for `title`, or the cleaned-up title if the catalog
+        has no equivalent yet.
+        """
+        title = " ".join(str(title).split())
+        canonical = self.match(title)
+        with self._lock:
+            self._stats["lookups"] += 1
+            if canonical is None:
+                self._stats["misses"] += 1
+                return title
+            self._stats["exact_hits" if canonical == title else "alias_hits"] += 1
+            return canonical
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["titles"] = sum(len(names) for names in self._canonical.values())
+        lookups = stats["lookups"]
+        # Normalizasyonun katalog isabetine etkisi: alias_hits olmadan bunlar ıskalanırdı
+        stats["catalog_hit_rate"] = round((stats["exact_hits"] + stats["alias_hits"]) / lookups, 3) if lookups else None
+        stats["catalog_hit_rate_exact_only"] = round(stats["exact_hits"] / lookups, 3) if lookups else None
+        return stats
+
+
+title_index = TitleIndex()
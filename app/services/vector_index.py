@@ -0,0 +1,162 @@
+"""
+In-process vector index over the Movies table for candidate retrieval.
+
+Each movie is embedded as a hashed word/bigram TF vector of its Description
+plus a one-hot block over canonical genre IDs, L2-normalized, so a dot product
+is cosine similarity. Search is a single NumPy matrix-vector product over a
+float32 matrix; no external service or model is involved.
+
+Rows are added or replaced with upsert() whenever a Movies row is written,
+so the index stays current without a rebuild.
+"""
+import os
+import re
+import time
+import zlib
+import threading
+import numpy as np
+from app.services.genres import registry, MAX_GENRES
+
+VECTOR_TEXT_DIM = int(os.getenv("VECTOR_TEXT_DIM", "1024"))
+# Tür bloğu: kanonik tür ID başına bir boyut
+VECTOR_GENRE_DIM = MAX_GENRES
+# Tür bloğunun açıklama bloğuna göre ağırlığı
+VECTOR_GENRE_WEIGHT = float(os.getenv("VECTOR_GENRE_WEIGHT", "1.0"))
+
+_TOKEN = re.compile(r"[^\W\d_]+", re.UNICODE)
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has he her his in is it its of on or she that the their "
+    "they this to was were who with will when while into about after before".split()
+)
+
+
+def _bucket(token: str, dim: int):
+    # crc32 is stable across processes, unlike hash()
+    h = zlib.crc32(token.encode("utf-8"))
+    return h % dim, (1.0 if (h >> 31) & 1 else -1.0)
+
+
+def _tokens(text: str) -> list:
+    words = [w for w in _TOKEN.findall(text.lower()) if w not in _STOPWORDS and len(w) > 1]
+    return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+
+def _normalize(vector):
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def text_vector(text: str) -> np.ndarray:
+    vector = np.zeros(VECTOR_TEXT_DIM, dtype=np.float32)
+    for token in _tokens(text or ""):
+        index, sign = _bucket(token, VECTOR_TEXT_DIM)
+        vector[index] += sign
+    # Sublinear TF: tekrar eden kelimeler vektörü domine etmesin
+    return _normalize(np.sign(vector) * np.log1p(np.abs(vector)))
+
+
+def genre_vector(genres) -> np.ndarray:
+    vector = np.zeros(VECTOR_GENRE_DIM, dtype=np.float32)
+    for genre_id in registry.genre_ids(genres):
+        vector[genre_id] = 1.0
+    return _normalize(vector) * VECTOR_GENRE_WEIGHT
+
+
+def movie_vector(description: str, genres) -> np.ndarray:
+    return _normalize(np.concatenate([text_vector(description), genre_vector(genres)]))
+
+
+class MovieVectorIndex:
+    def __init__(self, capacity: int = 1024):
+        self._lock = threading.Lock()
+        self._matrix = np.zeros((capacity, VECTOR_TEXT_DIM + VECTOR_GENRE_DIM), dtype=np.float32)
+        self._titles = []
+        self._rows = {}  # title -> row
+        self._stats = {"builds": 0, "build_seconds": None, "upserts": 0, "queries": 0, "query_ms_total": 0.0}
+
+    def __len__(self):
+        return len(self._titles)
+
+    def __contains__(self, title):
+        return title in self._rows
+
+    def upsert(self, title: str, description: str, genres):
+        vector = movie_vector(description, genres)
+        with self._lock:
+            row = self._rows.get(title)
+            if row is None:
+                row = len(self._titles)
+                if row == self._matrix.shape[0]:
+                    # Kapasiteyi ikiye katla (amortize O(1) ekleme)
+                    grown = np.zeros((row * 2, self._matrix.shape[1]), dtype=np.float32)
+                    grown[:row] = self._matrix
+                    self._matrix = grown
+                self._titles.append(title)
+                self._rows[title] = row
+            self._matrix[row] = vector
+            self._stats["upserts"] += 1
+
+    def upsert_items(self, items):
+        """
+        Index Movies rows ({MovieName, Description, Genre}).
+        """
+        for item in items:
+            if item.get("MovieName"):
+                self.upsert(item["MovieName"], item.get("Description", ""), item.get("Genre", []))
+
+    def build(self, items):
+        """
+        Replace the index contents with `items` (e.g. a full Movies scan).
+        """
+        started = time.perf_counter()
+        fresh = MovieVectorIndex(capacity=max(len(items), 1))
+        fresh.upsert_items(items)
+        with self._lock:
+            self._matrix, self._titles, self._rows = fresh._matrix, fresh._titles, fresh._rows
+            self._stats["builds"] += 1
+            self._stats["build_seconds"] = round(time.perf_counter() - started, 3)
+
+    def query_vector(self, genres, movies):
+        """
+        Preference profile: mean of the liked movies' rows plus the
+        preferred genres. None if nothing in it is known to the index.
+        """
+        with self._lock:
+            rows = [self._rows[title] for title in movies or [] if title in self._rows]
+            liked = self._matrix[rows].mean(axis=0) if rows else None
+        preferred = np.concatenate([np.zeros(VECTOR_TEXT_DIM, dtype=np.float32), genre_vector(genres)])
+        if liked is None and not np.any(preferred):
+            return None
+        return _normalize(preferred if liked is None else liked + _normalize(preferred))
+
+    def search(self, vector, k: int = 20, exclude=()) -> list:
+        """
+        Top-k (title, score) pairs by cosine similarity, skipping `exclude`.
+        """
+        started = time.perf_counter()
+        with self._lock:
+            size = len(self._titles)
+            if vector is None or size == 0:
+                return []
+            scores = self._matrix[:size] @ vector
+            titles = self._titles
+            # Hariç tutulanlar kadar fazladan al, sonra ele
+            wanted = min(size, k + len(exclude))
+            top = np.argpartition(-scores, wanted - 1)[:wanted]
+            top = top[np.argsort(-scores[top])]
+            results = [(titles[i], float(scores[i])) for i in top if titles[i] not in exclude][:k]
+        self._stats["queries"] += 1
+        self._stats["query_ms_total"] += (time.perf_counter() - started) * 1000
+        return results
+
+    def candidates_for(self, genres, movies, k: int = 20, exclude=()) -> list:
+        return self.search(self.query_vector(genres, movies), k=k, exclude=set(exclude) | set(movies or []))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._titles)
+            stats["memory_bytes"] = int(self._matrix.nbytes)
+        queries = stats.pop("query_ms_total")
+        stats["avg_query_ms"] = round(queries / stats["queries"], 3) if stats["queries"] else None
+        return stats
@@ -0,0 +1,6 @@
+import os
+
+# crud.py creates its boto3 resource on import; no request is sent in these tests
+os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
@@ -0,0 +1,58 @@
+from app.services import cache
+from app.services.cache import TTLCache, MISS, NEGATIVE
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    ttl_cache = TTLCache(maxsize=10, ttl=60)
+
+    ttl_cache.set("movie", {"MovieName": "Alien"})
+    clock.now += 59
+    assert ttl_cache.get("movie") == {"MovieName": "Alien"}
+    clock.now += 1
+    assert ttl_cache.get("movie") is MISS
+    assert ttl_cache.stats()["expirations"] == 1
+
+
+def test_negative_entries_use_their_own_ttl(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    ttl_cache = TTLCache(maxsize=10, ttl=3600, negative_ttl=5)
+
+    ttl_cache.set_negative("missing")
+    assert ttl_cache.get("missing") is NEGATIVE
+    clock.now += 5
+    assert ttl_cache.get("missing") is MISS
+
+    stats = ttl_cache.stats()
+    assert stats["negative_hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.set("b", 2)
+    ttl_cache.get("a")
+    ttl_cache.set("c", 3)
+
+    assert ttl_cache.get("b") is MISS
+    assert ttl_cache.get("a") == 1
+    assert ttl_cache.stats()["evictions"] == 1
+
+
+def test_invalidate_removes_entry():
+    ttl_cache = TTLCache(maxsize=2, ttl=60)
+    ttl_cache.set("a", 1)
+    ttl_cache.invalidate("a")
+    assert ttl_cache.get("a") is MISS
+    assert ttl_cache.stats()["invalidations"] == 1
@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from app.services.collaborative import ItemItemRecommender
+
+
+def _dense(recommender):
+    """
+    C and per-item support keyed by title, independent of column order.
+    """
+    titles = recommender._titles[:recommender._cooccurrence.shape[0]]
+    matrix = recommender._cooccurrence.toarray()
+    cooccurrence = {
+        (a, b): matrix[i, j] for i, a in enumerate(titles) for j, b in enumerate(titles) if matrix[i, j]
+    }
+    support = {title: int(recommender._support[i]) for i, title in enumerate(titles) if recommender._support[i]}
+    return cooccurrence, support
+
+
+USERS = {
+    "alice": {"Alien": 1.0, "Heat": 1.0},
+    "bob": {"Alien": 1.0, "Up": 0.5},
+    "carol": {"Heat": 1.0, "Up": 1.0},
+}
+
+
+def test_folded_updates_match_a_full_rebuild():
+    incremental = ItemItemRecommender()
+    incremental.build(USERS)
+    incremental.update_user("alice", {"Alien": 1.0, "Drive": 1.0})
+    incremental.update_user("dave", {"Drive": 1.0, "Up": 1.0})
+    assert incremental.apply_pending() == 2
+
+    expected = ItemItemRecommender()
+    expected.build(dict(USERS, alice={"Alien": 1.0, "Drive": 1.0}, dave={"Drive": 1.0, "Up": 1.0}))
+
+    folded, folded_support = _dense(incremental)
+    rebuilt, rebuilt_support = _dense(expected)
+    assert folded.keys() == rebuilt.keys()
+    for key, value in rebuilt.items():
+        assert folded[key] == pytest.approx(value)
+    assert folded_support == rebuilt_support
+
+
+def test_unchanged_rows_are_not_folded():
+    recommender = ItemItemRecommender()
+    recommender.build(USERS)
+    recommender.update_user("bob", dict(USERS["bob"]))
+    assert recommender.apply_pending() == 0
+    assert recommender.stats()["folds"] == 0
+
+
+def test_failed_fold_requeues_rows_without_overwriting_newer_ones(monkeypatch):
+    recommender = ItemItemRecommender()
+    recommender.build(USERS)
+    recommender.update_user("alice", {"Drive": 1.0})
+    recommender.update_user("bob", {"Up": 1.0})
+
+    def failing_fold(pending, started):
+        # Katlama sürerken alice yeni bir satır gönderir
+        recommender.update_user("alice", {"Heat": 1.0})
+        raise RuntimeError("fold failed")
+
+    monkeypatch.setattr(recommender, "_fold", failing_fold)
+    with pytest.raises(RuntimeError):
+        recommender.apply_pending()
+
+    assert recommender._pending == {"alice": {"Heat": 1.0}, "bob": {"Up": 1.0}}
+
+
+def test_rebuild_during_fold_requeues_rows(monkeypatch):
+    recommender = ItemItemRecommender()
+    recommender.build(USERS)
+    recommender.update_user("dave", {"Drive": 1.0, "Alien": 1.0})
+
+    matrix = ItemItemRecommender._matrix
+
+    def matrix_with_rebuild(rows, size):
+        # Ağır kısım kilit dışındayken tam yeniden kurulum araya girer
+        if not recommender._stats["builds"] > 1:
+            recommender.build(USERS)
+        return matrix(rows, size)
+
+    monkeypatch.setattr(recommender, "_matrix", matrix_with_rebuild)
+    assert recommender.apply_pending() == 0
+    assert "dave" in recommender._pending
+
+    monkeypatch.setattr(recommender, "_matrix", matrix)
+    assert recommender.apply_pending() == 1
+    assert np.isclose(_dense(recommender)[0][("Alien", "Drive")], 1.0)
@@ -0,0 +1,115 @@
+import asyncio
+
+from app.services import openai_integration
+
+
+def test_waiter_backs_off_and_polls_only_the_primary_key(monkeypatch):
+    delays = []
+    reads = []
+
+    async def acquire_lease(key, owner, ttl):
+        return False
+
+    async def get_movie_record(name):
+        reads.append(name)
+        return {"MovieName": name, "Description": "d", "Genre": ["Drama"]} if len(reads) == 5 else None
+
+    async def find_movie_by_title(name):
+        raise AssertionError("waiters must not query the title index while the lease is held")
+
+    async def sleep(delay):
+        delays.append(delay)
+
+    monkeypatch.setattr(openai_integration, "acquire_lease", acquire_lease)
+    monkeypatch.setattr(openai_integration, "get_movie_record", get_movie_record)
+    monkeypatch.setattr(openai_integration, "find_movie_by_title", find_movie_by_title)
+    monkeypatch.setattr(openai_integration.asyncio, "sleep", sleep)
+    monkeypatch.setattr(openai_integration, "DETAILS_LEASE_TTL", 3600)
+    openai_integration.movie_cache.clear()
+
+    details = asyncio.run(openai_integration._generate_details_with_lease("Heat"))
+
+    assert details == {"description": "d", "genre": ["Drama"]}
+    assert reads == ["Heat"] * 5
+    assert delays == [0.5, 1, 2, 4, 8]
+
+
+def test_waiter_keeps_waiting_while_the_lease_is_renewed_and_takes_over_once_it_lapses(monkeypatch):
+    clock = [0.0]
+    # Sahibi ilk TTL sonunda lease'i yenilemiş, ikincisinde ölmüş
+    acquired = iter([False, False, True])
+    generated = []
+
+    async def acquire_lease(key, owner, ttl):
+        return next(acquired)
+
+    async def release_lease(key, owner):
+        pass
+
+    async def no_movie(name):
+        return None
+
+    async def generate(name):
+        generated.append(name)
+        return {"description": "d", "genre": []}
+
+    async def sleep(delay):
+        clock[0] += delay
+
+    monkeypatch.setattr(openai_integration, "acquire_lease", acquire_lease)
+    monkeypatch.setattr(openai_integration, "release_lease", release_lease)
+    monkeypatch.setattr(openai_integration, "get_movie_record", no_movie)
+    monkeypatch.setattr(openai_integration, "find_movie_by_title", no_movie)
+    monkeypatch.setattr(openai_integration, "_generate_and_store_details", generate)
+    monkeypatch.setattr(openai_integration.asyncio, "sleep", sleep)
+    monkeypatch.setattr(openai_integration.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(openai_integration, "DETAILS_LEASE_TTL", 20)
+    openai_integration.movie_cache.clear()
+
+    details = asyncio.run(openai_integration._generate_details_with_lease("Heat"))
+
+    assert details == {"description": "d", "genre": []}
+    assert generated == ["Heat"]
+    assert clock[0] == 40
+
+
+def test_lease_is_renewed_while_a_slow_generation_runs(monkeypatch):
+    renewals = []
+
+    async def acquire_lease(key, owner, ttl):
+        renewals.append(key)
+        return True
+
+    monkeypatch.setattr(openai_integration, "acquire_lease", acquire_lease)
+    monkeypatch.setattr(openai_integration, "DETAILS_LEASE_TTL", 0.03)
+
+    async def scenario():
+        async with openai_integration._renewed_leases(["movie-details#heat"]):
+            await asyncio.sleep(0.1)
+
+    asyncio.run(scenario())
+    assert len(renewals) >= 2
+    assert set(renewals) == {"movie-details#heat"}
+
+
+def test_duplicate_skipped_on_write_falls_back_to_generated_details(monkeypatch):
+    async def request_movie_details(titles):
+        return {"Heat": {"description": "Heist.", "genres": ["Crime"]}}
+
+    async def put_movies(items):
+        # Başka yazılışla kayıtlı sayıldı, yazılmadı
+        return []
+
+    async def no_movie(name):
+        return None
+
+    monkeypatch.setattr(openai_integration, "request_movie_details", request_movie_details)
+    monkeypatch.setattr(openai_integration, "put_movies", put_movies)
+    monkeypatch.setattr(openai_integration, "get_movie_record", no_movie)
+    monkeypatch.setattr(openai_integration, "find_movie_by_title", no_movie)
+    openai_integration.movie_cache.clear()
+
+    details = asyncio.run(openai_integration._generate_and_store_details("Heat"))
+
+    assert details == {"description": "Heist.", "genre": ["Crime"]}
+    assert openai_integration.movie_cache.get("Heat") is not openai_integration.NEGATIVE
@@ -0,0 +1,33 @@
+from app.services.genres import GenreRegistry, MAX_GENRES, CANONICAL_GENRES
+
+
+def test_aliases_and_plurals_resolve_to_canonical_names():
+    registry = GenreRegistry()
+    assert registry.canonical(["sci-fi ", "Science Fiction", "Thrillers", "komedi"]) == [
+        "Science Fiction", "Thriller", "Comedy"
+    ]
+
+
+def test_compound_genres_are_split():
+    registry = GenreRegistry()
+    assert registry.canonical("Action/Adventure") == ["Action", "Adventure"]
+    assert registry.canonical(["Drama, romcom"]) == ["Drama", "Romance"]
+
+
+def test_unknown_genres_are_interned():
+    registry = GenreRegistry()
+    genre_id = registry.genre_id("space opera")
+    assert genre_id == len(CANONICAL_GENRES)
+    assert registry.name(genre_id) == "Space Opera"
+    assert registry.genre_id("Space-Opera") == genre_id
+
+
+def test_overflow_keeps_names_but_assigns_no_bit():
+    registry = GenreRegistry()
+    for index in range(MAX_GENRES - len(CANONICAL_GENRES)):
+        assert registry.genre_id(f"custom genre {index}") is not None
+
+    assert registry.genre_id("Brand New") is None
+    assert registry.canonical(["Brand New", "Drama"]) == ["Brand New", "Drama"]
+    assert registry.bitset(["Brand New", "Drama"]) == 1 << CANONICAL_GENRES.index("Drama")
+    assert registry.stats()["overflow"] >= 1
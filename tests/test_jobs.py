@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+
+from app.services import jobs
+
+
+@pytest.fixture
+def job_rows(monkeypatch):
+    rows = {}
+
+    async def put_recommendation_job(job):
+        rows[job["JobID"]] = dict(job)
+
+    async def update_recommendation_job(job_id, status, **fields):
+        rows[job_id].update(fields, Status=status)
+
+    monkeypatch.setattr(jobs, "put_recommendation_job", put_recommendation_job)
+    monkeypatch.setattr(jobs, "update_recommendation_job", update_recommendation_job)
+    monkeypatch.setattr(jobs, "scan_unfinished_recommendation_jobs", lambda: asyncio.sleep(0, []))
+    return rows
+
+
+def test_inline_job_is_deduplicated_per_pair_and_records_its_outcome(job_rows):
+    async def scenario():
+        queue = jobs.RecommendationJobQueue(handler=None, workers=1, maxsize=5)
+        await queue.start()
+        try:
+            async with queue.inline_job("alice", "bob") as job:
+                with pytest.raises(jobs.PairBusy) as busy:
+                    async with queue.inline_job("bob", "alice"):
+                        pass
+                job["count"] = 3
+            return queue, busy.value.job_id
+        finally:
+            await queue.stop()
+
+    queue, busy_job_id = asyncio.run(scenario())
+    assert job_rows[busy_job_id]["Status"] == "done"
+    assert job_rows[busy_job_id]["Count"] == 3
+    assert queue.stats()["deduplicated"] == 1
+    assert queue.stats()["running"] == 0
+
+
+def test_inline_job_failure_marks_the_job_failed_and_frees_the_pair(job_rows):
+    async def scenario():
+        queue = jobs.RecommendationJobQueue(handler=None, workers=1, maxsize=5)
+        await queue.start()
+        try:
+            with pytest.raises(RuntimeError):
+                async with queue.inline_job("alice", "bob"):
+                    raise RuntimeError("stream broke")
+            async with queue.inline_job("alice", "bob") as job:
+                job["count"] = 1
+        finally:
+            await queue.stop()
+
+    asyncio.run(scenario())
+    assert sorted(row["Status"] for row in job_rows.values()) == ["done", "failed"]
+
+
+def test_submit_deduplicates_per_pair_and_rejects_when_full(job_rows):
+    async def scenario():
+        # Worker yok: işler kuyrukta kalır
+        queue = jobs.RecommendationJobQueue(handler=None, workers=0, maxsize=1)
+        await queue.start()
+        try:
+            first = await queue.submit("alice", "bob")
+            again = await queue.submit("bob", "alice")
+            with pytest.raises(jobs.QueueFull):
+                await queue.submit("carol", "dave")
+            return queue, first, again
+        finally:
+            await queue.stop()
+
+    queue, first, again = asyncio.run(scenario())
+    assert again == first
+    assert list(job_rows) == [first]
+    stats = queue.stats()
+    assert (stats["submitted"], stats["deduplicated"], stats["rejected"]) == (1, 1, 1)
+    assert any(line.startswith('recommendation_jobs_total{result="rejected"}') for line in jobs.RECOMMENDATION_JOBS.render())
+
+
+def test_worker_runs_the_handler_and_records_latency(job_rows):
+    async def handler(user_id, partner_id):
+        return {"count": 2}
+
+    async def scenario():
+        queue = jobs.RecommendationJobQueue(handler=handler, workers=1, maxsize=5)
+        await queue.start()
+        try:
+            job_id = await queue.submit("alice", "bob")
+            await queue._queue.join()
+            return queue, job_id
+        finally:
+            await queue.stop()
+
+    queue, job_id = asyncio.run(scenario())
+    assert job_rows[job_id]["Status"] == "done"
+    assert job_rows[job_id]["Count"] == 2
+    assert queue.stats()["run_seconds_p50"] is not None
+    assert any(line.startswith("recommendation_job_run_seconds_count") for line in jobs.RECOMMENDATION_JOB_RUN_SECONDS.render())
@@ -0,0 +1,39 @@
+from types import SimpleNamespace
+
+from app.services import crud
+
+
+class Cancelled(Exception):
+    def __init__(self, codes):
+        super().__init__("TransactionCanceledException")
+        self.response = {"CancellationReasons": [{"Code": code} for code in codes]}
+
+
+class FakeClient:
+    def __init__(self, held):
+        self.held = held
+        self.calls = []
+
+    def transact_write_items(self, TransactItems):
+        self.calls.append(len(TransactItems))
+        keys = [item["Put"]["Item"]["LeaseKey"]["S"] for item in TransactItems]
+        codes = ["ConditionalCheckFailed" if key in self.held else "None" for key in keys]
+        if "ConditionalCheckFailed" in codes:
+            raise Cancelled(codes)
+
+
+def test_acquire_leases_skips_held_keys_and_retries_the_rest(monkeypatch):
+    client = FakeClient(held={"b"})
+    monkeypatch.setattr(crud, "dynamodb", SimpleNamespace(meta=SimpleNamespace(client=client)))
+
+    assert crud.acquire_leases(["a", "b", "c"], "worker", 60) == ["a", "c"]
+    assert client.calls == [3, 2]
+
+
+def test_acquire_leases_chunks_at_the_transaction_limit(monkeypatch):
+    client = FakeClient(held=set())
+    monkeypatch.setattr(crud, "dynamodb", SimpleNamespace(meta=SimpleNamespace(client=client)))
+
+    keys = [f"k{i}" for i in range(crud.TRANSACT_MAX_ITEMS + 5)]
+    assert crud.acquire_leases(keys, "worker", 60) == keys
+    assert client.calls == [crud.TRANSACT_MAX_ITEMS, 5]
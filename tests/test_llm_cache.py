@@ -0,0 +1,96 @@
+import asyncio
+import time
+
+from app.services import llm_cache as llm_cache_module
+from app.services.llm_cache import LLMResponseCache, fingerprint
+
+MESSAGES = [{"role": "user", "content": "Suggest  five\nmovies"}]
+RESPONSE = {"choices": [{"message": {"content": "Alien"}}]}
+
+
+def test_fingerprint_ignores_whitespace_but_not_parameters():
+    key = fingerprint("gpt-4", MESSAGES, max_tokens=300, temperature=0.7)
+    assert key == fingerprint("gpt-4", [{"role": "user", "content": " Suggest five movies "}], temperature=0.7, max_tokens=300)
+    assert key != fingerprint("gpt-4", MESSAGES, max_tokens=301, temperature=0.7)
+    assert key != fingerprint("gpt-3.5-turbo", MESSAGES, max_tokens=300, temperature=0.7)
+    assert key != fingerprint("gpt-4", [{"role": "system", "content": "Suggest five movies"}], max_tokens=300, temperature=0.7)
+
+
+def _with_table(monkeypatch, rows):
+    async def get_entry(key):
+        return rows.get(key)
+
+    async def put_entry(item):
+        rows[item["Fingerprint"]] = item
+
+    monkeypatch.setattr(llm_cache_module, "get_llm_cache_entry", get_entry)
+    monkeypatch.setattr(llm_cache_module, "put_llm_cache_entry", put_entry)
+
+
+def test_entry_is_stored_with_its_call_type_ttl_and_read_back_across_processes(monkeypatch):
+    rows = {}
+    _with_table(monkeypatch, rows)
+    key = fingerprint("gpt-4", MESSAGES)
+
+    async def scenario():
+        await LLMResponseCache().put("recommendations", key, "gpt-4", RESPONSE, latency=1.5)
+        # Yeni süreç: bellek boş, satır DynamoDB'den okunur
+        return await LLMResponseCache().get("recommendations", key)
+
+    assert asyncio.run(scenario()) == RESPONSE
+    ttl = rows[key]["ExpiresAt"] - rows[key]["CreatedAt"]
+    assert ttl == llm_cache_module.LLM_CACHE_TTLS["recommendations"]
+
+
+def test_expired_row_is_a_miss_before_dynamodb_deletes_it(monkeypatch):
+    key = fingerprint("gpt-4", MESSAGES)
+    rows = {key: {
+        "Fingerprint": key,
+        "Response": '{"choices": []}',
+        "Model": "gpt-4",
+        "CreatedAt": int(time.time()) - 100,
+        "ExpiresAt": int(time.time()) - 1
+    }}
+    _with_table(monkeypatch, rows)
+
+    cache = LLMResponseCache()
+    assert asyncio.run(cache.get("recommendations", key)) is None
+    assert cache.stats()["by_type"]["recommendations"]["misses"] == 1
+
+
+def test_call_types_without_a_ttl_are_not_cached(monkeypatch):
+    monkeypatch.setitem(llm_cache_module.LLM_CACHE_TTLS, "recommendations", 0)
+    cache = LLMResponseCache()
+    assert not cache.enabled("recommendations")
+    assert not cache.enabled("recommendations_stream")
+    assert cache.enabled("movie_details") == llm_cache_module.LLM_CACHE_ENABLED
+
+
+def test_trim_survives_lease_errors_and_releases_only_held_leases(monkeypatch):
+    released = []
+    trimmed = []
+
+    async def failing_acquire(*args):
+        raise RuntimeError("ProvisionedThroughputExceededException")
+
+    async def release(*args):
+        released.append(args)
+
+    async def trim(max_entries=None):
+        trimmed.append(1)
+        return 0
+
+    cache = LLMResponseCache()
+    monkeypatch.setattr(llm_cache_module, "release_lease", release)
+    monkeypatch.setattr(cache, "trim", trim)
+
+    monkeypatch.setattr(llm_cache_module, "acquire_lease", failing_acquire)
+    asyncio.run(cache.trim_once())
+    monkeypatch.setattr(llm_cache_module, "acquire_lease", lambda *args: asyncio.sleep(0, False))
+    asyncio.run(cache.trim_once())
+    assert (trimmed, released) == ([], [])
+
+    monkeypatch.setattr(llm_cache_module, "acquire_lease", lambda *args: asyncio.sleep(0, True))
+    asyncio.run(cache.trim_once())
+    assert trimmed == [1]
+    assert len(released) == 1
@@ -0,0 +1,38 @@
+from app.services.metrics import Counter, Histogram, GaugeFunction, render_metrics
+
+
+def test_counter_renders_labelled_series():
+    counter = Counter("test_requests_total", "Requests.", ("route",))
+    counter.inc(route="/a")
+    counter.inc(2, route='/b"c')
+
+    text = render_metrics()
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/a"} 1' in text
+    assert 'test_requests_total{route="/b\\"c"} 2' in text
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("test_latency_seconds", "Latency.", buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    lines = render_metrics().splitlines()
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{le="1"} 2' in lines
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in lines
+    assert "test_latency_seconds_sum 5.55" in lines
+    assert "test_latency_seconds_count 3" in lines
+
+
+def test_gauge_function_is_read_at_render_time_and_errors_are_skipped():
+    values = [3]
+    GaugeFunction("test_queue_depth", "Depth.", lambda: values[0])
+    GaugeFunction("test_broken_gauge", "Broken.", lambda: 1 / 0)
+    values[0] = 7
+
+    text = render_metrics()
+    assert "test_queue_depth 7" in text
+    assert "test_broken_gauge" not in text
+    assert text.endswith("\n")
@@ -0,0 +1,50 @@
+import asyncio
+import json
+
+from app.services import openai_integration
+
+
+def _response(movies):
+    arguments = json.dumps({"movies": movies})
+    return {"choices": [{"message": {"function_call": {"name": "submit_movie_details", "arguments": arguments}}}]}
+
+
+def test_entries_are_matched_by_normalized_title(monkeypatch):
+    calls = []
+
+    async def call_openai_with_prompt(prompt, **kwargs):
+        calls.append(prompt)
+        return _response([
+            {"title": "the matrix", "genres": ["Sci-Fi"], "description": "Red pill."},
+            {"title": "HEAT", "genres": ["Crime"], "description": "Heist."},
+        ])
+
+    monkeypatch.setattr(openai_integration, "call_openai_with_prompt", call_openai_with_prompt)
+
+    details = asyncio.run(openai_integration.request_movie_details(["The Matrix", "Heat"]))
+
+    assert details == {
+        "The Matrix": {"description": "Red pill.", "genres": ["Science Fiction"]},
+        "Heat": {"description": "Heist.", "genres": ["Crime"]},
+    }
+    # Cevaplanmış başlıklar için ikinci istek yapılmaz
+    assert len(calls) == 1
+
+
+def test_only_titles_left_out_are_requested_again(monkeypatch):
+    answers = iter([
+        _response([{"title": "The Matrix.", "genres": [], "description": "Red pill."}]),
+        _response([{"title": "heat", "genres": [], "description": "Heist."}]),
+    ])
+    prompts = []
+
+    async def call_openai_with_prompt(prompt, **kwargs):
+        prompts.append(prompt)
+        return next(answers)
+
+    monkeypatch.setattr(openai_integration, "call_openai_with_prompt", call_openai_with_prompt)
+
+    details = asyncio.run(openai_integration.request_movie_details(["The Matrix", "Heat"]))
+
+    assert sorted(details) == ["Heat", "The Matrix"]
+    assert "- Heat" in prompts[1] and "The Matrix" not in prompts[1]
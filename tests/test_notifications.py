@@ -0,0 +1,56 @@
+from app.services import crud
+
+
+class FakeNotificationsTable:
+    """
+    Query-only stand-in for the Notifications table (UserID + Timestamp key).
+    """
+
+    def __init__(self, items):
+        self.items = items
+
+    def query(self, ExpressionAttributeValues, Limit, ExclusiveStartKey=None, **kwargs):
+        rows = sorted(
+            (item for item in self.items if item["UserID"] == ExpressionAttributeValues[":user_id"]),
+            key=lambda item: item["Timestamp"],
+            reverse=True
+        )
+        if ExclusiveStartKey:
+            rows = [row for row in rows if row["Timestamp"] < ExclusiveStartKey["Timestamp"]]
+        response = {"Items": rows[:Limit]}
+        if len(rows) > Limit:
+            last = rows[Limit - 1]
+            response["LastEvaluatedKey"] = {"UserID": last["UserID"], "Timestamp": last["Timestamp"]}
+        return response
+
+
+def test_cursor_round_trip_walks_every_page(monkeypatch):
+    items = [{"UserID": "alice", "Timestamp": f"2024-01-0{day}", "Message": str(day)} for day in range(1, 6)]
+    monkeypatch.setattr(crud, "notifications_table", FakeNotificationsTable(items))
+
+    seen, cursor = [], None
+    while True:
+        page = crud.get_notifications_page("alice", limit=2, cursor=cursor)
+        seen.extend(item["Message"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == ["5", "4", "3", "2", "1"]
+
+
+def test_cursor_encoding_is_reversible():
+    key = {"UserID": "alice", "Timestamp": "2024-01-01T00:00:00"}
+    assert crud.decode_cursor(crud.encode_cursor(key)) == key
+    assert crud.encode_cursor(None) is None
+
+
+def test_cursor_of_another_user_is_rejected(monkeypatch):
+    monkeypatch.setattr(crud, "notifications_table", FakeNotificationsTable([]))
+    cursor = crud.encode_cursor({"UserID": "bob", "Timestamp": "2024-01-01"})
+    assert "error" in crud.get_notifications_page("alice", cursor=cursor)
+
+
+def test_malformed_cursor_is_rejected(monkeypatch):
+    monkeypatch.setattr(crud, "notifications_table", FakeNotificationsTable([]))
+    assert "error" in crud.get_notifications_page("alice", cursor="not-a-cursor")
@@ -0,0 +1,126 @@
+import asyncio
+
+import pytest
+
+from app.services import precompute
+from app.services.crud import pair_id
+
+
+class FakeBuffer:
+    """
+    In-memory RecommendationBuffer with the crud.py generation semantics.
+    """
+
+    def __init__(self):
+        self.rows = {}
+        self.writes = 0
+
+    async def get_generation(self, user_id, partner_id):
+        return self.rows.get(pair_id(user_id, partner_id), {}).get("Generation", 0)
+
+    async def put(self, user_id, partner_id, movies, ttl_seconds, generation=0):
+        row = self.rows.setdefault(pair_id(user_id, partner_id), {})
+        self.writes += 1
+        if row.get("Generation", 0) != generation:
+            return False
+        row.update(Movies=movies, Generation=generation)
+        return True
+
+    async def take(self, user_id, partner_id, ttl_seconds):
+        self.writes += 1
+        return self.rows.setdefault(pair_id(user_id, partner_id), {}).pop("Movies", None)
+
+    async def invalidate(self, user_id, partner_id, ttl_seconds, active=True):
+        self.writes += 1
+        row = self.rows.setdefault(pair_id(user_id, partner_id), {})
+        row.pop("Movies", None)
+        row["Generation"] = row.get("Generation", 0) + 1
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    fake = FakeBuffer()
+    monkeypatch.setattr(precompute, "get_recommendation_buffer_generation", fake.get_generation)
+    monkeypatch.setattr(precompute, "put_recommendation_buffer", fake.put)
+    monkeypatch.setattr(precompute, "take_recommendation_buffer", fake.take)
+    monkeypatch.setattr(precompute, "invalidate_recommendation_buffer", fake.invalidate)
+    monkeypatch.setattr(precompute, "acquire_lease", lambda *args: asyncio.sleep(0, True))
+    monkeypatch.setattr(precompute, "release_lease", lambda *args: asyncio.sleep(0))
+    monkeypatch.setattr(precompute, "get_recommendation_history", lambda *args: asyncio.sleep(0, {"Heat"}))
+    monkeypatch.setattr(precompute, "PRECOMPUTE_ENABLED", True)
+    return fake
+
+
+def test_refill_is_discarded_when_invalidated_meanwhile(monkeypatch, buffer):
+    precomputer = precompute.RecommendationPrecomputer()
+
+    async def generate(user_id, partner_id):
+        # Tercihler üretim sürerken değişir
+        await precomputer.invalidate(user_id, partner_id)
+        return [{"title": "Alien", "genres": []}]
+
+    monkeypatch.setattr(precompute, "generate_movie_recommendations", generate)
+
+    async def scenario():
+        precomputer._semaphore = asyncio.Semaphore(1)
+        await precomputer._refill(pair_id("alice", "bob"), "alice", "bob")
+        return await precomputer.take("alice", "bob")
+
+    assert asyncio.run(scenario()) is None
+    assert precomputer.stats()["batches_discarded"] == 1
+    assert precomputer.stats()["batches_generated"] == 0
+
+
+def test_take_consumes_the_batch_once_and_filters_history(monkeypatch, buffer):
+    precomputer = precompute.RecommendationPrecomputer()
+
+    async def generate(user_id, partner_id):
+        return [{"title": "Alien", "genres": []}, {"title": "Heat", "genres": []}]
+
+    monkeypatch.setattr(precompute, "generate_movie_recommendations", generate)
+
+    async def scenario():
+        precomputer._semaphore = asyncio.Semaphore(1)
+        await precomputer._refill(pair_id("alice", "bob"), "alice", "bob")
+        return await precomputer.take("bob", "alice"), await precomputer.take("alice", "bob")
+
+    first, second = asyncio.run(scenario())
+    assert first == [{"title": "Alien", "genres": []}]
+    assert second is None
+    stats = precomputer.stats()
+    assert (stats["buffer_hits"], stats["buffer_misses"]) == (1, 1)
+
+
+def test_sweep_schedules_pairs_only_under_the_sweep_lease(monkeypatch, buffer):
+    leases = iter([True, False])
+    monkeypatch.setattr(precompute, "acquire_lease", lambda *args: asyncio.sleep(0, next(leases)))
+    monkeypatch.setattr(precompute, "list_pairs_to_refill", lambda since: asyncio.sleep(0, [("alice", "bob")]))
+
+    async def scenario():
+        precomputers = [precompute.RecommendationPrecomputer(), precompute.RecommendationPrecomputer()]
+        for precomputer in precomputers:
+            # schedule() yalnızca başlatılmış bir precomputer'da çalışır
+            precomputer._tasks = [asyncio.create_task(asyncio.sleep(3600))]
+            sweep = asyncio.create_task(precomputer._sweep_loop())
+            await asyncio.sleep(0.01)
+            sweep.cancel()
+            await precomputer.stop()
+        return precomputers
+
+    swept, skipped = asyncio.run(scenario())
+    assert list(swept._pending) == [pair_id("alice", "bob")]
+    assert skipped._pending == {}
+
+
+def test_disabled_precompute_does_not_write(monkeypatch, buffer):
+    monkeypatch.setattr(precompute, "PRECOMPUTE_ENABLED", False)
+    monkeypatch.setattr(precompute, "get_user", lambda user_id: asyncio.sleep(0, {"partner_id": "bob"}))
+    precomputer = precompute.RecommendationPrecomputer()
+
+    async def scenario():
+        await precomputer.preferences_changed("alice")
+        await precomputer.invalidate("alice", "bob")
+        return await precomputer.take("alice", "bob")
+
+    assert asyncio.run(scenario()) is None
+    assert buffer.writes == 0
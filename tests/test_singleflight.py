@@ -0,0 +1,79 @@
+import asyncio
+
+from app.services.singleflight import SingleFlight
+
+
+def test_concurrent_calls_share_one_execution():
+    async def scenario():
+        flight = SingleFlight()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return 42
+
+        results = await asyncio.gather(*(flight.do("key", work) for _ in range(5)))
+        return flight, calls, results
+
+    flight, calls, results = asyncio.run(scenario())
+    assert results == [42] * 5
+    assert len(calls) == 1
+    assert flight.stats == {"leaders": 1, "coalesced": 4}
+    assert flight.in_flight() == 0
+
+
+def test_cancelled_leader_does_not_cancel_waiters():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return 42
+
+        leader = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        waiter = asyncio.ensure_future(flight.do("key", work))
+        await asyncio.sleep(0)
+        leader.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leader, await waiter
+
+    leader, result = asyncio.run(scenario())
+    assert leader.cancelled()
+    assert result == 42
+
+
+def test_failure_is_shared_and_key_is_released():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def fail():
+            await asyncio.sleep(0)
+            raise RuntimeError("boom")
+
+        results = await asyncio.gather(flight.do("key", fail), flight.do("key", fail), return_exceptions=True)
+        return flight, results
+
+    flight, results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
+    assert not flight.running("key")
+
+
+def test_adopted_work_is_joined():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def batch():
+            await asyncio.sleep(0)
+            return "from batch"
+
+        async def own():
+            return "own"
+
+        flight.adopt("key", batch())
+        return await flight.do("key", own)
+
+    assert asyncio.run(scenario()) == "from batch"
@@ -0,0 +1,59 @@
+import json
+import logging
+
+from app.services.structured_logging import JsonFormatter, REDACTED, redact, redact_text
+
+
+def test_key_value_secrets_are_masked_including_compound_keys():
+    assert redact_text("SECRET_KEY=abc123") == f"SECRET_KEY={REDACTED}"
+    assert redact_text("password: hunter2, user=alice") == f"password: {REDACTED}, user=alice"
+    assert redact_text('{"access_token": "xyz"}') == f'{{"access_token": {REDACTED}}}'
+    assert redact_text("OPENAI_API_KEY=foo") == f"OPENAI_API_KEY={REDACTED}"
+
+
+def test_bearer_tokens_are_masked():
+    assert redact_text("Authorization: Bearer abc.def-123") == f"Authorization: Bearer {REDACTED}"
+    assert "eyJ" not in redact_text("bearer eyJhbGciOi.eyJzdWIi.c2lnbmF0dXJl")
+
+
+def test_token_counters_are_kept():
+    text = "prompt_tokens=12 completion_tokens: 4"
+    assert redact_text(text) == text
+
+
+def test_sensitive_dict_keys_are_masked_recursively():
+    fields = {"user": "alice", "headers": {"Authorization": "Bearer x", "Cookie": "c"}, "usage": {"prompt_tokens": 3}}
+    assert redact(fields) == {
+        "user": "alice",
+        "headers": {"Authorization": REDACTED, "Cookie": REDACTED},
+        "usage": {"prompt_tokens": 3},
+    }
+
+
+def test_formatter_redacts_message_and_fields():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "login with password=%s", ("hunter2",), None)
+    record.fields = {"api_key": "sk-abc"}
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == f"login with password={REDACTED}"
+    assert entry["api_key"] == REDACTED
+
+
+def test_only_password_like_keys_are_masked():
+    fields = {"passenger": "alice", "passes": 3, "passwd": "x", "passphrase": "y", "user_password": "z"}
+    assert redact(fields) == {
+        "passenger": "alice",
+        "passes": 3,
+        "passwd": REDACTED,
+        "passphrase": REDACTED,
+        "user_password": REDACTED,
+    }
+
+
+def test_fields_cannot_overwrite_record_attributes():
+    record = logging.LogRecord("app.test", logging.INFO, __file__, 1, "real message", (), None)
+    record.request_id = "req-1"
+    record.fields = {"message": "spoofed", "level": "DEBUG", "request_id": "other", "movie": "Heat"}
+    entry = json.loads(JsonFormatter().format(record))
+    assert (entry["message"], entry["level"], entry["request_id"]) == ("real message", "INFO", "req-1")
+    assert entry["movie"] == "Heat"
+    assert entry["fields"] == {"message": "spoofed", "level": "DEBUG", "request_id": "other"}
@@ -0,0 +1,54 @@
+import json
+
+from app.services.structured_output import extract_entries, StreamingEntryParser
+
+MOVIES = [
+    {"title": "Alien", "genres": ["Horror"]},
+    {"title": "Heat", "genres": ["Crime"]},
+    {"title": "Up", "genres": ["Animation"]},
+]
+
+
+def test_well_formed_payload():
+    entries, well_formed = extract_entries(json.dumps({"movies": MOVIES}))
+    assert well_formed
+    assert [entry["title"] for entry in entries] == ["Alien", "Heat", "Up"]
+
+
+def test_truncated_payload_is_salvaged():
+    text = json.dumps({"movies": MOVIES})[:-25]
+    entries, well_formed = extract_entries(text)
+    assert not well_formed
+    assert [entry["title"] for entry in entries] == ["Alien", "Heat"]
+
+
+def test_legacy_text_answer():
+    entries, well_formed = extract_entries("1. Movie Name: Alien, Genre: Horror/Sci-Fi")
+    assert not well_formed
+    assert entries == [{"title": "Alien", "genres": ["Horror", "Sci-Fi"]}]
+
+
+def _stream(parser, text, size=7):
+    titles = []
+    for start in range(0, len(text), size):
+        titles.extend(entry["title"] for entry in parser.feed(text[start:start + size]))
+    return titles
+
+
+def test_streaming_parser_yields_entries_as_they_complete():
+    parser = StreamingEntryParser(required=("title",))
+    assert _stream(parser, json.dumps({"movies": MOVIES})) == ["Alien", "Heat", "Up"]
+    assert parser.dropped == 0
+
+
+def test_streaming_parser_skips_malformed_object():
+    text = '{"movies": [{"title": "Alien"}, {"title": "Bad" "x"}, {"title": "Heat"}, {"title": "Up"}]}'
+    parser = StreamingEntryParser(required=("title",))
+    assert _stream(parser, text) == ["Alien", "Heat", "Up"]
+    assert parser.dropped == 1
+
+
+def test_streaming_parser_drops_entries_missing_required_fields():
+    parser = StreamingEntryParser(required=("title",))
+    assert _stream(parser, '{"movies": [{"genres": ["Drama"]}, {"title": "Up"}]}') == ["Up"]
+    assert parser.dropped == 1
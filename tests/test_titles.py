@@ -0,0 +1,35 @@
+from app.services.titles import title_key, base_title_key, title_year, TitleIndex, TitleSet
+
+
+def test_title_key_normalizes_spelling():
+    assert title_key("The Matrix") == title_key("the matrix") == title_key("Matrix, The") == "matrix"
+    assert title_key("Amélie") == "amelie"
+    assert title_key("Fast & Furious") == "fast and furious"
+
+
+def test_title_key_keeps_bracketed_year():
+    assert title_key("Dune (1984)") == "dune 1984"
+    assert title_key("Dune (1984)") != title_key("Dune (2021)")
+    assert base_title_key("Dune (2021)") == "dune"
+    assert title_year("Blade Runner 2049") is None
+    assert title_key("Blade Runner 2049") == "blade runner 2049"
+
+
+def test_single_letter_article_is_kept_when_it_is_the_title():
+    assert title_key("A") == "a"
+
+
+def test_index_matches_title_without_year_to_stored_year():
+    index = TitleIndex()
+    index.build(["Dune (1984)", "The Matrix"])
+
+    assert index.resolve("dune") == "Dune (1984)"
+    assert index.resolve("Dune (2021)") == "Dune (2021)"
+    assert index.resolve("the matrix (1999)") == "The Matrix"
+
+
+def test_title_set_membership():
+    seen = TitleSet(["Dune (1984)"])
+    assert "Dune" in seen
+    assert "dune (1984)" in seen
+    assert "Dune (2021)" not in seen